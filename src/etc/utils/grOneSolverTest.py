@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+""" ================================================================
+    grOneSolverTest.py - Check grOneSolver against a brute-force one
+    ================================================================
+
+    Generates small random GR(1) specifications, synthesizes each one with
+    grOneSolver, and checks the result against an explicit-state solver that
+    just enumerates every state:
+
+    - The realizability verdict must match.
+    - For realizable specifications, the automaton must cover every initial
+      state, respond legally to every allowed environment move, and satisfy
+      each system goal on every run that satisfies the environment goals.
+    - For unrealizable specifications, the counterstrategy must only visit
+      states that are losing for the system, and must offer the system every
+      legal response.
+
+    Usage: grOneSolverTest.py [first_seed [last_seed]]
+"""
+
+import os, sys
+import itertools
+import random
+import re
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+ltlmop_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ltlmop_root, "lib"))
+
+import grOneSolver
+
+def randomFormula(rng, variables, depth, allow_next=False):
+    """ Returns a random propositional formula over ``variables`` in .ltl file syntax """
+
+    if depth == 0 or rng.random() < 0.3:
+        v = rng.choice(variables)
+        if allow_next and rng.random() < 0.5:
+            v = "next(%s)" % v
+        return rng.choice(["", "!"]) + v
+
+    op = rng.choice([" & ", " | ", " -> ", " <-> "])
+    return "(" + randomFormula(rng, variables, depth-1, allow_next) + op + \
+                 randomFormula(rng, variables, depth-1, allow_next) + ")"
+
+class RandomSpec:
+    """ A small random GR(1) specification """
+
+    def __init__(self, seed):
+        rng = random.Random(seed)
+
+        self.env_vars = ["e.x%d" % i for i in range(rng.randint(1, 2))]
+        self.sys_vars = ["s.bit0"] + ["s.y%d" % i for i in range(rng.randint(1, 3) - 1)]
+        self.all_vars = self.env_vars + self.sys_vars
+
+        self.env_init = randomFormula(rng, self.env_vars, 1)
+        self.sys_init = randomFormula(rng, self.all_vars, 1)
+
+        # The environment can't see what the system will do next
+        self.env_trans = [re.sub(r"next\((s\.\w+)\)", r"\1", randomFormula(rng, self.all_vars, 2, True))
+                          for k in range(rng.randint(0, 2))]
+        self.sys_trans = [randomFormula(rng, self.all_vars, 2, True) for k in range(rng.randint(0, 3))]
+
+        self.env_goals = [randomFormula(rng, self.all_vars, 1) for k in range(rng.randint(1, 2))]
+        self.sys_goals = [randomFormula(rng, self.all_vars, 1) for k in range(rng.randint(1, 3))]
+
+    def write(self, prefix):
+        """ Write out the specification as ``prefix``.smv and ``prefix``.ltl """
+
+        f = open(prefix + ".smv", "w")
+        f.write("MODULE main\n VAR\n e : env();\n s : sys();\n")
+        f.write("MODULE env -- inputs\n VAR\n")
+        f.write("".join("\t%s : boolean;\n" % v[2:] for v in self.env_vars))
+        f.write("MODULE sys -- outputs\n VAR\n")
+        f.write("".join("\t%s : boolean;\n" % v[2:] for v in self.sys_vars))
+        f.close()
+
+        assumptions = " & \n".join([self.env_init] + ["[](%s)" % t for t in self.env_trans] +
+                                   ["[]<>(%s)" % g for g in self.env_goals])
+        guarantees = " & \n".join([self.sys_init] + ["[](%s)" % t for t in self.sys_trans] +
+                                  ["[]<>(%s)" % g for g in self.sys_goals])
+
+        f = open(prefix + ".ltl", "w")
+        f.write("-- Random specification\nLTLSPEC -- Assumptions\n\t(\n%s\n\t);\n\n" % assumptions)
+        f.write("LTLSPEC -- Guarantees\n\t(\n%s\n\t);\n" % guarantees)
+        f.close()
+
+def toPython(formula):
+    """ Translate a formula into a Python expression over the dicts C (current) and N (next) """
+
+    formula = re.sub(r"next\(([\w.]+)\)", lambda m: "N['%s']" % m.group(1), formula)
+    formula = re.sub(r"(?<![\w'.])([es]\.\w+)", lambda m: "C['%s']" % m.group(1), formula)
+    formula = re.sub(r"!([NC]\['[^']+'\])", r"(not \1)", formula)
+    formula = formula.replace("<->", "==").replace("->", "<=")
+    return formula.replace("&", " and ").replace("|", " or ")
+
+class ExplicitGame:
+    """ The game for a RandomSpec, solved by enumerating every state """
+
+    def __init__(self, spec):
+        self.spec = spec
+
+        self.states = [dict(zip(spec.all_vars, bits))
+                       for bits in itertools.product([False, True], repeat=len(spec.all_vars))]
+        self.index = dict((self.key(s), i) for i, s in enumerate(self.states))
+        self.all = set(range(len(self.states)))
+
+        # For each assignment to the environment variables, all the states that agree with it
+        self.env_moves = {}
+        for i, s in enumerate(self.states):
+            self.env_moves.setdefault(tuple(s[v] for v in spec.env_vars), []).append(i)
+
+        self.init = set(i for i in self.all if self.holds(spec.env_init, i) and self.holds(spec.sys_init, i))
+        self.env_goals = [set(i for i in self.all if self.holds(g, i)) for g in spec.env_goals]
+        self.sys_goals = [set(i for i in self.all if self.holds(g, i)) for g in spec.sys_goals]
+
+        self.winning = self._solve()
+
+    def key(self, state):
+        return tuple(state[v] for v in self.spec.all_vars)
+
+    def holds(self, formula, current, next=None):
+        return bool(eval(toPython(formula), {"C": self.states[current],
+                                             "N": self.states[next] if next is not None else None}))
+
+    def envAllows(self, current, next):
+        return all(self.holds(t, current, next) for t in self.spec.env_trans)
+
+    def sysAllows(self, current, next):
+        return all(self.holds(t, current, next) for t in self.spec.sys_trans)
+
+    def _controllablePredecessors(self, targets):
+        """ The states from which the system can force the next state into ``targets`` """
+
+        result = set()
+        for c in self.all:
+            for successors in self.env_moves.itervalues():
+                # (Whether the environment may make this move can't depend on the system's choice)
+                if self.envAllows(c, successors[0]) and \
+                   not any(self.sysAllows(c, n) and n in targets for n in successors):
+                    break
+            else:
+                result.add(c)
+        return result
+
+    def _solve(self):
+        """ The standard GR(1) triple fixpoint; returns the states that are winning for the system """
+
+        z = set(self.all)
+        while True:
+            old_z = set(z)
+            for goal in self.sys_goals:
+                y = set()
+                while True:
+                    start = (goal & self._controllablePredecessors(z)) | self._controllablePredecessors(y)
+                    new_y = set()
+                    for env_goal in self.env_goals:
+                        x = set(z)
+                        while True:
+                            new_x = ((self.all - env_goal) & self._controllablePredecessors(x)) | start
+                            if new_x == x:
+                                break
+                            x = new_x
+                        new_y |= x
+                    if new_y == y:
+                        break
+                    y = new_y
+                z = y
+            if z == old_z:
+                return z
+
+    def realizable(self):
+        return self.init <= self.winning
+
+def readAutomaton(filename, spec):
+    """ Returns a dict of state number -> (assignment, list of successor numbers) """
+
+    f = open(filename, "r")
+    aut = f.read()
+    f.close()
+
+    states = {}
+    for num, conds, succ in re.findall(r"State (\d+) with rank \S+ -> <([^>]*)>\n\t" +
+                                       r"(?:With successors : ([\d, ]+)|With no successors.)", aut):
+        values = {}
+        for cond in conds.split(", "):
+            name, value = cond.split(":")
+            name = "e." + name if "e." + name in spec.env_vars else "s." + name
+            values[name] = (value == "1")
+        states[int(num)] = (values, [int(s) for s in succ.split(", ")] if succ else [])
+
+    return states
+
+def checkStrategy(game, states):
+    """ Returns a list of problems with a strategy for a realizable specification """
+
+    problems = []
+
+    for values, successors in states.itervalues():
+        c = game.index[game.key(values)]
+
+        # Every move must be legal, and every legal environment move must be answered
+        answered = set()
+        for s in successors:
+            n = game.index[game.key(states[s][0])]
+            if not game.sysAllows(c, n):
+                problems.append("illegal system move")
+            if not game.envAllows(c, n):
+                problems.append("illegal environment move")
+            answered.add(tuple(states[s][0][v] for v in game.spec.env_vars))
+        for move, candidates in game.env_moves.iteritems():
+            if game.envAllows(c, candidates[0]) and move not in answered:
+                problems.append("missing environment move")
+
+    covered = set(game.key(values) for values, successors in states.itervalues())
+    if any(game.key(game.states[i]) not in covered for i in game.init):
+        problems.append("missing initial state")
+
+    # For each system goal, there must be no cycle that avoids it but visits every environment goal
+    for j, goal in enumerate(game.sys_goals):
+        allowed = set(n for n in states if game.index[game.key(states[n][0])] not in goal)
+
+        reachable = {}
+        for n in allowed:
+            seen = set()
+            stack = [s for s in states[n][1] if s in allowed]
+            while stack:
+                q = stack.pop()
+                if q not in seen:
+                    seen.add(q)
+                    stack.extend(s for s in states[q][1] if s in allowed)
+            reachable[n] = seen
+
+        for n in allowed:
+            if n in reachable[n]:
+                scc = [m for m in reachable[n] if n in reachable[m]]
+                if all(any(game.index[game.key(states[m][0])] in env_goal for m in scc)
+                       for env_goal in game.env_goals):
+                    problems.append("system goal %d can be avoided forever" % j)
+                    break
+
+    return problems
+
+def checkCounterstrategy(game, states):
+    """ Returns a list of problems with a counterstrategy for an unrealizable specification """
+
+    problems = []
+    n_vars = len(game.spec.all_vars)
+
+    for values, successors in states.itervalues():
+        if len(values) < n_vars:
+            # Partial states are where the system has no legal move left
+            if successors:
+                problems.append("dead end with successors")
+            continue
+
+        c = game.index[game.key(values)]
+        if c in game.winning:
+            problems.append("counterstrategy visits a state that is winning for the system")
+
+        inputs = set(tuple(states[s][0][v] for v in game.spec.env_vars) for s in successors)
+        if len(inputs) == 0:
+            continue
+        if len(inputs) != 1:
+            problems.append("counterstrategy picks %d inputs at once" % len(inputs))
+            continue
+
+        candidates = game.env_moves[inputs.pop()]
+        if not game.envAllows(c, candidates[0]):
+            problems.append("illegal environment input")
+
+        # Every response that doesn't leave the system immediately stuck should be there
+        got = set(game.index[game.key(states[s][0])] for s in successors if len(states[s][0]) == n_vars)
+        want = set(m for m in candidates if game.sysAllows(c, m) and any(game.sysAllows(m, q) for q in game.all))
+        if got != want and not (got == set() and not any(game.sysAllows(c, m) for m in candidates)):
+            problems.append("wrong system responses")
+
+    return problems
+
+def checkSeed(seed, tempdir):
+    """ Returns (realizable, list of problems) for the random specification with the given seed """
+
+    spec = RandomSpec(seed)
+    prefix = os.path.join(tempdir, "random")
+    spec.write(prefix)
+
+    realizable = grOneSolver.synthesize(prefix + ".smv", prefix + ".ltl", prefix + ".aut",
+                                        prefix + "_safety.aut", out=StringIO())
+
+    game = ExplicitGame(spec)
+    if realizable != game.realizable():
+        return realizable, ["realizability is %s, but should be %s" % (realizable, game.realizable())]
+
+    states = readAutomaton(prefix + ".aut", spec)
+    if realizable:
+        return realizable, checkStrategy(game, states)
+    else:
+        return realizable, checkCounterstrategy(game, states)
+
+if __name__ == "__main__":
+    first_seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    last_seed = int(sys.argv[2]) if len(sys.argv) > 2 else first_seed + 200
+
+    failed = 0
+    counts = {True: 0, False: 0}
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        for seed in range(first_seed, last_seed):
+            try:
+                realizable, problems = checkSeed(seed, tempdir)
+            except grOneSolver.SpecificationError, e:
+                print "FAIL: seed %d: %s" % (seed, e)
+                failed += 1
+                continue
+
+            counts[realizable] += 1
+            if problems:
+                print "FAIL: seed %d: %s" % (seed, ", ".join(sorted(set(problems))))
+                failed += 1
+    finally:
+        shutil.rmtree(tempdir)
+
+    print "%d realizable and %d unrealizable specifications checked; %d failed" % \
+          (counts[True], counts[False], failed)
+
+    if failed:
+        sys.exit(1)
+    else:
+        sys.exit(0)
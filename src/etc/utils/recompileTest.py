@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+""" =========================================================
+    recompileTest.py - Check that cached recompilation works
+    =========================================================
+
+    Compiles each of the given specifications (by default, the examples that use
+    "near", "within" and "between") twice in a row, and checks that the second
+    compilation, which reuses the cached decomposition, gives the same result as
+    the first.  The projects are copied to a temporary directory first, so the
+    examples themselves aren't touched.
+
+    Usage: recompileTest.py [spec_file ...]
+"""
+
+import os, sys
+import shutil
+import tempfile
+
+ltlmop_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ltlmop_root, "lib"))
+
+from specCompiler import SpecCompiler
+
+DEFAULT_SPECS = [os.path.join(ltlmop_root, "examples", "bears", "bears.spec"),
+                 os.path.join(ltlmop_root, "examples", "hideandseek", "hideandseek.spec")]
+
+def compileToLTL(spec_filename):
+    """
+    Run the compilation stages up to (but not including) synthesis.
+    Returns the decomposed region names and the contents of the .ltl file.
+    """
+
+    compiler = SpecCompiler(spec_filename)
+    compiler._decompose()
+    compiler._writeSMVFile()
+    if compiler._writeLTLFile() is None:
+        raise RuntimeError("Could not write the LTL file")
+
+    f = open(compiler.proj.getFilenamePrefix() + ".ltl", "r")
+    ltl = f.read()
+    f.close()
+
+    return [r.name for r in compiler.parser.proj.rfi.regions], ltl
+
+def checkRecompile(spec_filename):
+    """ Returns True if compiling twice gives the same result both times """
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        project_dir = os.path.join(tempdir, "project")
+        shutil.copytree(os.path.dirname(os.path.abspath(spec_filename)), project_dir)
+        spec_copy = os.path.join(project_dir, os.path.basename(spec_filename))
+
+        first = compileToLTL(spec_copy)
+        second = compileToLTL(spec_copy)
+    finally:
+        shutil.rmtree(tempdir)
+
+    if first[0] != second[0]:
+        print "FAIL: %s: The decomposed regions changed on recompilation" % spec_filename
+        return False
+    if first[1] != second[1]:
+        print "FAIL: %s: The LTL changed on recompilation" % spec_filename
+        return False
+
+    print "OK: %s" % spec_filename
+    return True
+
+if __name__ == "__main__":
+    specs = sys.argv[1:] or DEFAULT_SPECS
+
+    results = [checkRecompile(spec) for spec in specs]
+
+    if all(results):
+        sys.exit(0)
+    else:
+        sys.exit(1)
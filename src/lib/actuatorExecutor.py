@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+""" ============================================================
+    actuatorExecutor.py - Asynchronous actuator command dispatch
+    ============================================================
+
+    Runs actuator commands on worker threads, so that slow actuators (speech, sounds,
+    gait changes, etc.) don't hold up the execution loop.
+"""
+
+import threading, Queue, time
+
+class ActuatorExecutor:
+    """
+    Runs actuator commands in the background, with one worker thread per actuator.
+
+    Commands for the same actuator are always run one at a time, in the order they were
+    submitted; commands for different actuators may run concurrently.  Use ``isIdle()``
+    or ``waitForCompletion()`` to find out when submitted commands have finished.
+    """
+
+    def __init__(self):
+        self.queues = {}        # Actuator name -> Queue of pending commands
+        self.threads = {}       # Actuator name -> worker thread
+        self.pending = {}       # Actuator name -> number of commands submitted but not yet finished
+        self.condition = threading.Condition()
+
+    def submit(self, actuator, func, *args):
+        """
+        Schedule ``func(*args)`` to be run on the worker thread for ``actuator``
+        """
+
+        self.condition.acquire()
+        self.pending[actuator] = self.pending.get(actuator, 0) + 1
+        self.condition.release()
+
+        if actuator not in self.threads:
+            self.queues[actuator] = Queue.Queue()
+            t = threading.Thread(target=self._work, args=(actuator,), name="ActuatorExecutor-" + actuator)
+            t.daemon = True  # Don't keep the process alive just for actuators
+            t.start()
+            self.threads[actuator] = t
+
+        self.queues[actuator].put((func, args))
+
+    def _work(self, actuator):
+        """
+        Worker loop for a single actuator; run in its own thread
+        """
+
+        q = self.queues[actuator]
+
+        while True:
+            job = q.get()
+            if job is None:
+                # Shutdown signal
+                break
+
+            func, args = job
+            try:
+                func(*args)
+            except Exception, e:
+                print "WARNING: Error running actuator '%s': %s" % (actuator, e)
+
+            self.condition.acquire()
+            self.pending[actuator] -= 1
+            self.condition.notifyAll()
+            self.condition.release()
+
+    def isIdle(self, actuators=None):
+        """
+        Returns True if all submitted commands for the given actuators (or all actuators,
+        if none are specified) have finished
+        """
+
+        self.condition.acquire()
+        idle = self._allDone(actuators)
+        self.condition.release()
+
+        return idle
+
+    def waitForCompletion(self, actuators=None, timeout=None):
+        """
+        Block until all submitted commands for the given actuators (or all actuators, if none
+        are specified) have finished, or until ``timeout`` seconds have passed.
+
+        Returns True if everything finished.
+        """
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        self.condition.acquire()
+        try:
+            while not self._allDone(actuators):
+                if timeout is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+            return self._allDone(actuators)
+        finally:
+            self.condition.release()
+
+    def _allDone(self, actuators):
+        """
+        Check whether there are any pending commands (the caller must hold the lock)
+        """
+        if actuators is None:
+            actuators = self.pending.keys()
+        return all(self.pending.get(a, 0) == 0 for a in actuators)
+
+    def shutdown(self, wait=True, timeout=5.0):
+        """
+        Stop all worker threads once they have finished their pending commands.
+
+        If ``wait`` is True, wait for up to ``timeout`` seconds in total for them to finish.
+        Workers that are still busy after that (e.g. with a hung actuator handler) are
+        abandoned; since they are daemon threads, they won't keep the process alive.
+        """
+
+        for q in self.queues.itervalues():
+            q.put(None)
+
+        if wait:
+            deadline = time.time() + timeout
+            for actuator, t in self.threads.iteritems():
+                t.join(max(0, deadline - time.time()))
+                if t.isAlive():
+                    print "WARNING: Actuator '%s' did not finish in time; abandoning it." % actuator
+
+        self.queues = {}
+        self.threads = {}
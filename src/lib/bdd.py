@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+
+""" =============================================
+    bdd.py - Pure-Python binary decision diagrams
+    =============================================
+
+    A small reduced ordered BDD package, with just the operations needed to play
+    GR(1) games on the specifications that LTLMoP generates (see grOneSolver.py).
+
+    A BDDManager owns the nodes of all the BDDs over an ordered list of named
+    variables, and BDD objects are handles to those nodes that support the usual
+    boolean operators (``&``, ``|``, ``~``) and quantification.  Nodes that are no
+    longer reachable from any BDD object are reclaimed every so often, so a single
+    manager can be kept around and reused for many computations.
+"""
+
+# The "level" of the two terminal nodes, which comes after that of every variable
+TERMINAL_LEVEL = 1 << 30
+
+# How many nodes we can have before we first try to reclaim unused ones
+GC_THRESHOLD = 100000
+
+# How many entries each operation cache can hold before it is emptied
+CACHE_SIZE = 500000
+
+class BDDManager(object):
+    """
+    Holds the nodes for a set of BDDs over an ordered list of variables.
+
+    Variables are added with addVar(), and their position in the variable
+    order (their "level") is the order in which they were added.  Nodes are
+    stored as parallel lists of level, low child and high child, indexed by
+    node number; node 0 is FALSE and node 1 is TRUE.
+    """
+
+    def __init__(self):
+        self.varNames = []
+        self.levels = {}  # Variable name -> level
+
+        self._level = [TERMINAL_LEVEL, TERMINAL_LEVEL]
+        self._low = [0, 1]
+        self._high = [0, 1]
+        self._unique = {}  # (level, low, high) -> node
+        self._free = []    # Numbers of reclaimed nodes, available for reuse
+
+        # Number of BDD objects referring to each node
+        self._refs = {}
+
+        self._gcThreshold = GC_THRESHOLD
+
+        self._andCache = {}
+        self._orCache = {}
+        self._notCache = {}
+        self._existCache = {}
+        self._andExistCache = {}
+        self._renameCache = {}
+
+    def addVar(self, name):
+        """
+        Add a new variable at the end of the variable order, and return its level.
+        If a variable of this name already exists, just return its level.
+        """
+
+        if name not in self.levels:
+            self.levels[name] = len(self.varNames)
+            self.varNames.append(name)
+
+        return self.levels[name]
+
+    ### Creating BDDs
+
+    def true(self):
+        return BDD(self, 1)
+
+    def false(self):
+        return BDD(self, 0)
+
+    def var(self, name):
+        """ Return the BDD for the variable ``name`` """
+        return BDD(self, self._mk(self.levels[name], 0, 1))
+
+    def cube(self, assignment):
+        """
+        Return the BDD that is only true for the given values of some variables.
+        ``assignment`` is a dictionary mapping variable names to booleans.
+        """
+
+        node = 1
+        for level in sorted([self.levels[name] for name in assignment], reverse=True):
+            if assignment[self.varNames[level]]:
+                node = self._mk(level, 0, node)
+            else:
+                node = self._mk(level, node, 0)
+        return BDD(self, node)
+
+    def varSet(self, names):
+        """
+        Return a set of variables, as used by exist(), forAll() and iterAssignments().
+        (This is represented as the conjunction of the variables.)
+        """
+
+        return self.cube(dict((name, True) for name in names))
+
+    def renaming(self, mapping):
+        """
+        Return an object to pass to BDD.rename() that renames variables as given by
+        ``mapping`` (old name -> new name).  The renaming must preserve the relative
+        order of the variables involved.
+        """
+
+        levelMap = dict((self.levels[old], self.levels[new]) for old, new in mapping.iteritems())
+        return Renaming(levelMap)
+
+    ### Node management
+
+    def _mk(self, level, low, high):
+        """ Return the node for (level ? high : low), creating it if necessary """
+
+        if low == high:
+            return low
+
+        key = (level, low, high)
+        node = self._unique.get(key)
+        if node is None:
+            if self._free:
+                node = self._free.pop()
+                self._level[node] = level
+                self._low[node] = low
+                self._high[node] = high
+            else:
+                node = len(self._level)
+                self._level.append(level)
+                self._low.append(low)
+                self._high.append(high)
+            self._unique[key] = node
+        return node
+
+    def _ref(self, node):
+        self._refs[node] = self._refs.get(node, 0) + 1
+
+    def _deref(self, node):
+        count = self._refs[node] - 1
+        if count == 0:
+            del self._refs[node]
+        else:
+            self._refs[node] = count
+
+    def nodeCount(self):
+        """ Return the number of nodes currently in use """
+        return len(self._unique)
+
+    def _maybeCollectGarbage(self):
+        """
+        Reclaim unreachable nodes if there are a lot of them, and empty any caches that
+        have grown too big.  This is only called at the start of each operation on BDD
+        objects, when every node we care about is referred to by one.
+        """
+
+        if len(self._unique) > self._gcThreshold:
+            self.collectGarbage()
+            self._gcThreshold = max(GC_THRESHOLD, 2*len(self._unique))
+
+        for cache in [self._andCache, self._orCache, self._notCache,
+                      self._existCache, self._andExistCache, self._renameCache]:
+            if len(cache) > CACHE_SIZE:
+                cache.clear()
+
+    def collectGarbage(self):
+        """ Free all the nodes that can't be reached from any BDD object """
+
+        level, low, high = self._level, self._low, self._high
+
+        marked = set([0, 1])
+        stack = list(self._refs)
+        while stack:
+            node = stack.pop()
+            if node in marked:
+                continue
+            marked.add(node)
+            stack.append(low[node])
+            stack.append(high[node])
+
+        for key, node in self._unique.items():
+            if node not in marked:
+                del self._unique[key]
+                self._free.append(node)
+                level[node] = None
+
+        self.clearCaches()
+
+    def clearCaches(self):
+        for cache in [self._andCache, self._orCache, self._notCache,
+                      self._existCache, self._andExistCache, self._renameCache]:
+            cache.clear()
+
+    ### Operations on nodes
+
+    def _and(self, f, g):
+        if f == 0 or g == 0:
+            return 0
+        if f == 1 or f == g:
+            return g
+        if g == 1:
+            return f
+        if f > g:
+            f, g = g, f
+
+        key = (f, g)
+        result = self._andCache.get(key)
+        if result is not None:
+            return result
+
+        lf, lg = self._level[f], self._level[g]
+        if lf == lg:
+            result = self._mk(lf, self._and(self._low[f], self._low[g]), self._and(self._high[f], self._high[g]))
+        elif lf < lg:
+            result = self._mk(lf, self._and(self._low[f], g), self._and(self._high[f], g))
+        else:
+            result = self._mk(lg, self._and(f, self._low[g]), self._and(f, self._high[g]))
+
+        self._andCache[key] = result
+        return result
+
+    def _or(self, f, g):
+        if f == 1 or g == 1:
+            return 1
+        if f == 0 or f == g:
+            return g
+        if g == 0:
+            return f
+        if f > g:
+            f, g = g, f
+
+        key = (f, g)
+        result = self._orCache.get(key)
+        if result is not None:
+            return result
+
+        lf, lg = self._level[f], self._level[g]
+        if lf == lg:
+            result = self._mk(lf, self._or(self._low[f], self._low[g]), self._or(self._high[f], self._high[g]))
+        elif lf < lg:
+            result = self._mk(lf, self._or(self._low[f], g), self._or(self._high[f], g))
+        else:
+            result = self._mk(lg, self._or(f, self._low[g]), self._or(f, self._high[g]))
+
+        self._orCache[key] = result
+        return result
+
+    def _not(self, f):
+        if f < 2:
+            return 1 - f
+
+        result = self._notCache.get(f)
+        if result is not None:
+            return result
+
+        result = self._mk(self._level[f], self._not(self._low[f]), self._not(self._high[f]))
+
+        self._notCache[f] = result
+        self._notCache[result] = f
+        return result
+
+    def _exist(self, f, cube):
+        """ Existentially quantify the variables in the positive cube ``cube`` out of ``f`` """
+
+        if f < 2 or cube == 1:
+            return f
+
+        level = self._level[f]
+        while self._level[cube] < level:
+            cube = self._high[cube]
+        if cube == 1:
+            return f
+
+        key = (f, cube)
+        result = self._existCache.get(key)
+        if result is not None:
+            return result
+
+        if self._level[cube] == level:
+            low = self._exist(self._low[f], self._high[cube])
+            if low == 1:
+                result = 1
+            else:
+                result = self._or(low, self._exist(self._high[f], self._high[cube]))
+        else:
+            result = self._mk(level, self._exist(self._low[f], cube), self._exist(self._high[f], cube))
+
+        self._existCache[key] = result
+        return result
+
+    def _andExist(self, f, g, cube):
+        """ Return exist(and(f, g), cube), without building all of and(f, g) """
+
+        if f == 0 or g == 0:
+            return 0
+        if f == 1:
+            return self._exist(g, cube)
+        if g == 1 or f == g:
+            return self._exist(f, cube)
+        if f > g:
+            f, g = g, f
+
+        level = min(self._level[f], self._level[g])
+        while self._level[cube] < level:
+            cube = self._high[cube]
+        if cube == 1:
+            return self._and(f, g)
+
+        key = (f, g, cube)
+        result = self._andExistCache.get(key)
+        if result is not None:
+            return result
+
+        if self._level[f] == level:
+            f0, f1 = self._low[f], self._high[f]
+        else:
+            f0 = f1 = f
+        if self._level[g] == level:
+            g0, g1 = self._low[g], self._high[g]
+        else:
+            g0 = g1 = g
+
+        if self._level[cube] == level:
+            low = self._andExist(f0, g0, self._high[cube])
+            if low == 1:
+                result = 1
+            else:
+                result = self._or(low, self._andExist(f1, g1, self._high[cube]))
+        else:
+            result = self._mk(level, self._andExist(f0, g0, cube), self._andExist(f1, g1, cube))
+
+        self._andExistCache[key] = result
+        return result
+
+    def _rename(self, f, renaming):
+        if f < 2:
+            return f
+
+        key = (f, renaming.id)
+        result = self._renameCache.get(key)
+        if result is not None:
+            return result
+
+        level = self._level[f]
+        result = self._mk(renaming.levelMap.get(level, level),
+                          self._rename(self._low[f], renaming), self._rename(self._high[f], renaming))
+
+        self._renameCache[key] = result
+        return result
+
+    def _support(self, f):
+        """ Return the set of levels of the variables that ``f`` depends on """
+
+        levels = set()
+        seen = set()
+        stack = [f]
+        while stack:
+            node = stack.pop()
+            if node < 2 or node in seen:
+                continue
+            seen.add(node)
+            levels.add(self._level[node])
+            stack.append(self._low[node])
+            stack.append(self._high[node])
+        return levels
+
+class Renaming(object):
+    """ A variable renaming, as created by BDDManager.renaming() """
+
+    _nextId = 0
+
+    def __init__(self, levelMap):
+        self.levelMap = levelMap
+        self.id = Renaming._nextId
+        Renaming._nextId += 1
+
+class BDD(object):
+    """
+    A boolean function, represented as a node in a BDDManager.
+
+    BDDs from the same manager can be combined with ``&``, ``|`` and ``~``,
+    and compared with ``==`` (which tests whether the functions are equal).
+    """
+
+    __slots__ = ['manager', 'node']
+
+    def __init__(self, manager, node):
+        self.manager = manager
+        self.node = node
+        manager._ref(node)
+
+    def __del__(self):
+        self.manager._deref(self.node)
+
+    def _result(self, node):
+        return BDD(self.manager, node)
+
+    def _start(self):
+        self.manager._maybeCollectGarbage()
+        return self.manager
+
+    def __and__(self, other):
+        return self._result(self._start()._and(self.node, other.node))
+
+    def __or__(self, other):
+        return self._result(self._start()._or(self.node, other.node))
+
+    def __invert__(self):
+        return self._result(self._start()._not(self.node))
+
+    def imp(self, other):
+        m = self._start()
+        return self._result(m._or(m._not(self.node), other.node))
+
+    def biimp(self, other):
+        m = self._start()
+        return self._result(m._or(m._and(self.node, other.node),
+                                  m._and(m._not(self.node), m._not(other.node))))
+
+    def exist(self, varSet):
+        return self._result(self._start()._exist(self.node, varSet.node))
+
+    def forAll(self, varSet):
+        m = self._start()
+        return self._result(m._not(m._exist(m._not(self.node), varSet.node)))
+
+    def andExist(self, other, varSet):
+        """ Return (self & other).exist(varSet), computed in one pass """
+        return self._result(self._start()._andExist(self.node, other.node, varSet.node))
+
+    def rename(self, renaming):
+        return self._result(self._start()._rename(self.node, renaming))
+
+    def isZero(self):
+        return self.node == 0
+
+    def isOne(self):
+        return self.node == 1
+
+    def support(self):
+        """ Return the names of the variables this function depends on """
+        m = self.manager
+        return set(m.varNames[level] for level in m._support(self.node))
+
+    def __eq__(self, other):
+        return isinstance(other, BDD) and self.manager is other.manager and self.node == other.node
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.node)
+
+    def __nonzero__(self):
+        raise TypeError("The truth value of a BDD is ambiguous; use isZero() or isOne()")
+
+    def iterAssignments(self, varSet):
+        """
+        Iterate over all the assignments to the variables in ``varSet`` that satisfy
+        this function, as dictionaries of variable name -> 0 or 1.  Variables outside
+        ``varSet`` are existentially quantified out first.
+
+        Assignments are generated in lexicographic order of the variable values
+        (taking the variables in order, with 0 before 1).
+        """
+
+        m = self.manager
+        levels = sorted(m._support(varSet.node))
+        others = m._support(self.node) - set(levels)
+        f = self.exist(m.varSet([m.varNames[level] for level in others]))
+
+        names = [m.varNames[level] for level in levels]
+        values = [0] * len(levels)
+
+        def visit(node, i):
+            if node == 0:
+                return
+            if i == len(levels):
+                yield dict(zip(names, values))
+                return
+            if m._level[node] == levels[i]:
+                children = (m._low[node], m._high[node])
+            else:
+                children = (node, node)
+            for value in (0, 1):
+                values[i] = value
+                for assignment in visit(children[value], i+1):
+                    yield assignment
+
+        return visit(f.node, 0)
+
+    def evaluate(self, assignment):
+        """
+        Return the value of this function for the given variable values
+        (a dictionary of variable name -> boolean, covering every variable it depends on)
+        """
+
+        m = self.manager
+        node = self.node
+        while node > 1:
+            if assignment[m.varNames[m._level[node]]]:
+                node = m._high[node]
+            else:
+                node = m._low[node]
+        return node == 1
+
+    def nodeCount(self):
+        """ Return the number of nodes in this BDD """
+        m = self.manager
+        seen = set()
+        stack = [self.node]
+        while stack:
+            node = stack.pop()
+            if node < 2 or node in seen:
+                continue
+            seen.add(node)
+            stack.append(m._low[node])
+            stack.append(m._high[node])
+        return len(seen)
+
+    def __repr__(self):
+        return "<BDD with %d nodes>" % self.nodeCount()
@@ -10,6 +10,7 @@
 import numpy
 import parseEnglishToLTL
 import textwrap
+from ltlFormula import Prop, Next, TRUE, FALSE, ifThenElse
 
 def createSMVfile(fileName, numRegions, sensorList, robotPropList):
     ''' This function writes the skeleton SMV file.
@@ -64,20 +65,79 @@ def createSMVfile(fileName, numRegions, sensorList, robotPropList):
     smvFile.close()
     
 
-def createLTLfile(fileName, sensorList, robotPropList, adjData, spec):
+def neighbourLists(adjData):
+    ''' Returns, for each region, the sorted list of regions it has a transition to.
+    adjData is either a dense (# of regions) x (# of regions) list of lists of faces, or
+    the dense view of a RegionFileInterface's adjacency, whose sparse data we read directly.
+    '''
+
+    if hasattr(adjData, 'rfi'):
+        adjacency = adjData.rfi.adjacency
+        return [sorted([dest for dest, faces in adjacency.get(Origin, {}).iteritems() if faces])
+                for Origin in range(len(adjData))]
+
+    return [[dest for dest in range(len(adjData)) if adjData[Origin][dest]]
+            for Origin in range(len(adjData))]
+
+def compactTopologyFormula(neighbours, numBits):
+    ''' This function creates a single formula equivalent to the conjunction of
+    [](current region -> (next region is the same or a neighbour)) over all regions.
+
+    Instead of a clause per region, the formula is a decision tree over the current
+    region bits, with a decision tree over the next region bits at each leaf.  The trees
+    are reduced like a BDD: wherever both branches of a test are the same subformula,
+    the test is dropped.  Bit encodings that don't correspond to any region can't be
+    reached, so they are treated as "don't care" for the current region.
+    '''
+
+    currBits = [Prop('s.bit' + str(bitNum)) for bitNum in range(numBits)]
+    nextBits = [Next(b) for b in currBits]
+
+    def bitOf(num, bitNum):
+        # bit0 is the most significant bit (see parseEnglishToLTL.bitEncoding())
+        return (num >> (numBits-1-bitNum)) & 1
+
+    def nextTree(regions, bitNum):
+        # The next region must be one of ``regions``, which all agree on the bits before bitNum
+        if regions == []:
+            return FALSE
+        if bitNum == numBits:
+            return TRUE
+        return ifThenElse(nextBits[bitNum],
+                          nextTree([r for r in regions if bitOf(r, bitNum)], bitNum+1),
+                          nextTree([r for r in regions if not bitOf(r, bitNum)], bitNum+1))
+
+    def currTree(base, bitNum):
+        # The constraint for regions base ... base + 2**(numBits-bitNum) - 1, or None if there are none
+        if base >= len(neighbours):
+            return None
+        if bitNum == numBits:
+            return nextTree(sorted(set([base] + neighbours[base])), 0)
+        f0 = currTree(base, bitNum+1)
+        f1 = currTree(base + 2**(numBits-bitNum-1), bitNum+1)
+        if f1 is None:
+            return f0
+        return ifThenElse(currBits[bitNum], f1, f0)
+
+    return currTree(0, 0) or TRUE
+
+def createLTLfile(fileName, sensorList, robotPropList, adjData, spec, compactTopology=False):
     ''' This function writes the LTL file. It encodes the specification and 
     topological relation. 
     It takes as input a filename, the list of the
     sensor propositions, the list of robot propositions (without the regions),
     the adjacency data (transition data structure) and
     a dictionary containing the specification strings.
+    If compactTopology is True, the topological relation is written as one
+    shared formula (see compactTopologyFormula()) rather than a clause per region.
     '''
 
     fileName = fileName + '.ltl'
     ltlFile = open(fileName, 'w')
 
+    # (The encodings are formula trees, which are written straight to the file)
     numBits = int(numpy.ceil(numpy.log2(len(adjData))))
-    bitEncode = parseEnglishToLTL.bitEncoding(len(adjData), numBits)
+    bitEncode = parseEnglishToLTL.bitEncodingFormulas(len(adjData), numBits)
     currBitEnc = bitEncode['current']
     nextBitEnc = bitEncode['next']
     
@@ -104,23 +164,28 @@ def createLTLfile(fileName, sensorList, robotPropList, adjData, spec):
     ltlFile.write(spec['SysInit'])
 
     # The topological relation (adjacency)
-    for Origin in range(len(adjData)):
-        # from region i we can stay in region i
-        ltlFile.write('\t\t\t []( (')
-        ltlFile.write(currBitEnc[Origin])
-        ltlFile.write(') -> ( (')
-        ltlFile.write(nextBitEnc[Origin])
-        ltlFile.write(')')
-        
-        for dest in range(len(adjData)):
-            if adjData[Origin][dest]:
+    neighbours = neighbourLists(adjData)
+    if compactTopology:
+        ltlFile.write('\t\t\t [](')
+        compactTopologyFormula(neighbours, numBits).write(ltlFile)
+        ltlFile.write(') & \n ')
+    else:
+        for Origin in range(len(adjData)):
+            # from region i we can stay in region i
+            ltlFile.write('\t\t\t []( (')
+            currBitEnc[Origin].write(ltlFile)
+            ltlFile.write(') -> ( (')
+            nextBitEnc[Origin].write(ltlFile)
+            ltlFile.write(')')
+
+            for dest in neighbours[Origin]:
                 # not empty, hence there is a transition
                 ltlFile.write('\n\t\t\t\t\t\t\t\t\t| (')
-                ltlFile.write(nextBitEnc[dest])
+                nextBitEnc[dest].write(ltlFile)
                 ltlFile.write(') ')
 
-        # closing this region
-        ltlFile.write(' ) ) & \n ')
+            # closing this region
+            ltlFile.write(' ) ) & \n ')
     
 
     # The rest of the spec
@@ -113,6 +113,252 @@ class decomposition():
         return self.listOfConvexPoly
         #print "Mission Complete"
         
+    def HertelMehlhorn(self):
+        """
+        Decompose the polygon (with any holes) into convex polygons by triangulating it and
+        then greedily removing diagonals, as long as the two polygons on either side of a
+        diagonal can be merged into a convex polygon (Hertel & Mehlhorn, 1983).
+
+        Holes are handled directly, by bridging them to the outer boundary before triangulation.
+        The result has at most four times as many polygons as the optimal decomposition.
+        Return a list of convex polygon
+        """
+
+        outer = [tuple(pt) for pt in Polygon.Utils.pointList(self.P)]
+        if self.signedArea(outer) < 0:
+            outer.reverse()   # Outer boundary counterclockwise
+
+        holes = []
+        for hole in self.holeList:
+            pts = [tuple(pt) for pt in Polygon.Utils.pointList(hole)]
+            if self.signedArea(pts) > 0:
+                pts.reverse() # Holes clockwise
+            holes.append(pts)
+
+        triangles = self.earClip(self.bridgeHoles(outer, holes))
+
+        # Each piece is a list of counterclockwise vertices; pieceOfEdge tells us which piece
+        # each directed edge belongs to, so we can find the pieces on either side of a diagonal
+        pieces = {}
+        pieceOfEdge = {}
+        for i, tri in enumerate(triangles):
+            pieces[i] = list(tri)
+            for k in range(3):
+                pieceOfEdge[(tri[k], tri[(k+1)%3])] = i
+
+        # Diagonals are the edges that have a piece on both sides
+        diagonals = [e for e in pieceOfEdge if (e[1], e[0]) in pieceOfEdge and e[0] < e[1]]
+
+        for a, b in diagonals:
+            p = pieceOfEdge.get((a, b))
+            q = pieceOfEdge.get((b, a))
+            if p is None or q is None or p == q:
+                continue
+
+            # Rotate piece p to go from b around to a, and q to go from a around to b, then join them
+            P = pieces[p]
+            Q = pieces[q]
+            i = P.index(b)
+            P = P[i:] + P[:i]
+            j = Q.index(a)
+            Q = Q[j:] + Q[:j]
+            if P[-1] != a or Q[-1] != b:
+                continue
+            merged = P + Q[1:-1]
+
+            if not self.isConvex(merged):
+                continue
+
+            pieces[p] = merged
+            del pieces[q]
+            del pieceOfEdge[(a, b)]
+            del pieceOfEdge[(b, a)]
+            for k in range(len(merged)):
+                edge = (merged[k], merged[(k+1)%len(merged)])
+                if edge in pieceOfEdge:
+                    pieceOfEdge[edge] = p
+
+        return [Polygon.Polygon(pieces[k]) for k in sorted(pieces)]
+
+    def signedArea(self, pts):
+        """
+        Twice the signed area of the polygon with vertices pts (positive if counterclockwise)
+        """
+        return sum([pts[i-1][0]*pts[i][1] - pts[i][0]*pts[i-1][1] for i in range(len(pts))])
+
+    def cross(self, a, b, c):
+        """
+        Z component of (b - a) x (c - b): positive if a, b, c make a left turn
+        """
+        return (b[0]-a[0])*(c[1]-b[1]) - (b[1]-a[1])*(c[0]-b[0])
+
+    def isConvex(self, pts):
+        """
+        Return True if the counterclockwise polygon pts is convex (collinear vertices are allowed)
+        """
+        n = len(pts)
+        return all([self.cross(pts[i-2], pts[i-1], pts[i]) >= 0 for i in range(n)])
+
+    def pointInTriangle(self, p, a, b, c):
+        """
+        Return True if p is inside or on the boundary of the counterclockwise triangle abc
+        """
+        return self.cross(a, b, p) >= 0 and self.cross(b, c, p) >= 0 and self.cross(c, a, p) >= 0
+
+    def segmentsCross(self, a, b, c, d):
+        """
+        Return True if segments ab and cd cross at a single point in the interior of both
+        """
+        return self.cross(a, b, c)*self.cross(a, b, d) < 0 and self.cross(c, d, a)*self.cross(c, d, b) < 0
+
+    def cornerContains(self, a, b, c, p):
+        """
+        Return True if p is strictly inside the interior angle at vertex b of a counterclockwise
+        polygon, with neighbouring vertices a and c
+        """
+        if self.cross(a, b, c) >= 0:
+            return self.cross(a, b, p) > 0 and self.cross(b, c, p) > 0
+        else:
+            return self.cross(a, b, p) > 0 or self.cross(b, c, p) > 0
+
+    def bridgeHoles(self, outer, holes):
+        """
+        Join each (clockwise) hole to the (counterclockwise) outer boundary with a pair of
+        coincident edges, resulting in a single weakly simple polygon
+        """
+
+        poly = list(outer)
+
+        # Process the holes from right to left, so the bridges don't cross each other
+        for hole in sorted(holes, key=lambda h: -max([pt[0] for pt in h])):
+            m = max(range(len(hole)), key=lambda k: (hole[k][0], hole[k][1]))
+            M = hole[m]
+
+            # Cast a ray from M to the right, and find the closest edge it hits
+            best = None
+            for i in range(len(poly)):
+                p1 = poly[i]
+                p2 = poly[(i+1) % len(poly)]
+                if (p1[1] > M[1]) == (p2[1] > M[1]) and not (p1[1] == M[1] or p2[1] == M[1]):
+                    continue
+                if p1[1] == p2[1]:
+                    if p1[1] != M[1]:
+                        continue
+                    x = min(p1[0], p2[0])
+                else:
+                    x = p1[0] + (M[1]-p1[1])*(p2[0]-p1[0])/float(p2[1]-p1[1])
+                if x < M[0]:
+                    continue
+                if best is None or x < best[0]:
+                    best = (x, i)
+
+            if best is None:
+                # The hole isn't inside the polygon; just ignore it
+                continue
+
+            x, i = best
+            I = (x, M[1])
+
+            # Candidate vertex to connect to: the endpoint of the hit edge furthest to the right...
+            i2 = (i+1) % len(poly)
+            k = i if poly[i][0] > poly[i2][0] else i2
+            if poly[i] == I:
+                k = i
+            elif poly[i2] == I:
+                k = i2
+            else:
+                # ...unless some reflex vertex is in the way, in which case use the one closest in angle to the ray
+                P = poly[k]
+                tri = (M, I, P) if self.cross(M, I, P) > 0 else (M, P, I)
+                bestAngle = None
+                for j in range(len(poly)):
+                    V = poly[j]
+                    if V == P or V[0] < M[0]:
+                        continue
+                    if self.cross(poly[j-1], V, poly[(j+1) % len(poly)]) >= 0:
+                        continue
+                    if not self.pointInTriangle(V, *tri):
+                        continue
+                    angle = (abs(math.atan2(V[1]-M[1], V[0]-M[0])), (V[0]-M[0])**2 + (V[1]-M[1])**2)
+                    if bestAngle is None or angle < bestAngle:
+                        bestAngle = angle
+                        k = j
+
+            # If the vertex appears more than once (because an earlier hole was bridged to it), we
+            # have to connect to the copy whose corner the bridge actually leaves through
+            P = poly[k]
+            for j in range(len(poly)):
+                if poly[j] == P and self.cornerContains(poly[j-1], P, poly[(j+1) % len(poly)], M):
+                    k = j
+                    break
+
+            hole = hole[m:] + hole[:m]
+            poly = poly[:k+1] + hole + [M, poly[k]] + poly[k+1:]
+
+        return poly
+
+    def earClip(self, poly):
+        """
+        Triangulate a (counterclockwise, weakly simple) polygon by repeatedly cutting off ears.
+        Return a list of counterclockwise triangles.
+        """
+
+        # Work on a linked list of vertex indices
+        n = len(poly)
+        prev = [(i-1) % n for i in range(n)]
+        next = [(i+1) % n for i in range(n)]
+        remaining = n
+        triangles = []
+
+        i = 0
+        sinceLastEar = 0
+        while remaining > 3:
+            a, b, c = poly[prev[i]], poly[i], poly[next[i]]
+
+            isEar = False
+            if self.cross(a, b, c) > 0:
+                # It's convex; make sure no other reflex vertex is inside the triangle
+                # (only reflex vertices can stop this from being an ear), and that no edge
+                # crosses the diagonal ac (which can happen at the coincident vertices of a bridge)
+                isEar = True
+                j = next[next[i]]
+                while j != prev[i]:
+                    v = poly[j]
+                    if v != a and v != b and v != c and \
+                       self.cross(poly[prev[j]], v, poly[next[j]]) <= 0 and \
+                       self.pointInTriangle(v, a, b, c):
+                        isEar = False
+                        break
+                    if self.segmentsCross(a, c, v, poly[next[j]]):
+                        isEar = False
+                        break
+                    j = next[j]
+            elif self.cross(a, b, c) == 0 and sinceLastEar > remaining:
+                # We're stuck on a degenerate (collinear) vertex; just drop it
+                isEar = True
+
+            if isEar:
+                if self.cross(a, b, c) > 0:
+                    triangles.append((a, b, c))
+                next[prev[i]] = next[i]
+                prev[next[i]] = prev[i]
+                remaining -= 1
+                i = prev[i]
+                sinceLastEar = 0
+            else:
+                i = next[i]
+                sinceLastEar += 1
+                if sinceLastEar > 2*remaining:
+                    # No ears at all (the polygon must be self-intersecting); give up on the rest
+                    print "WARNING: Could not finish triangulating polygon."
+                    return triangles
+
+        a, b, c = poly[prev[i]], poly[i], poly[next[i]]
+        if self.cross(a, b, c) > 0:
+            triangles.append((a, b, c))
+
+        return triangles
+
     def removeContour(self,contour):
         pt1 = contour[0][0]
         pt2 = contour[0][1]
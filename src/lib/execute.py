@@ -6,7 +6,7 @@
 
     This module executes a hybrid controller for a robot in a simulated or real environment.
 
-    :Usage: ``execute.py [-hn] [-a automaton_file] [-s spec_file]``
+    :Usage: ``execute.py [-hnc] [-a automaton_file] [-s spec_file] [-r rate] [-p poll_rate] [-t max_staleness]``
 
     * The controlling automaton is imported from the specified ``automaton_file``.
 
@@ -15,13 +15,27 @@
 
     * Unless otherwise specified with the ``-n`` or ``--no_gui`` option, a status/control window
       will also be opened for informational purposes.
+
+    * If a ``rate`` is given, the main loop will be held to that many iterations per second.
+      Either way, timing statistics for each phase of execution are printed on exit, whenever
+      execution is paused, and (on POSIX systems) when the process receives ``SIGUSR1``.
+
+    * If a ``poll_rate`` is given, each sensor will be read on its own background thread at that
+      rate, and the main loop will use the most recent readings instead of waiting on the sensor handlers.
+      Only use this with sensor handlers that are safe to call from multiple threads.
+
+    * With the ``-c`` or ``--async-actuators`` option, actuator handlers are run on background threads
+      so that the robot can keep moving while they execute; a transition is only completed once all of
+      its actuators have finished.
 """
 
 import sys, os, getopt, textwrap
-import threading, subprocess, time
+import threading, subprocess, time, signal
 import fileMethods, regions, fsa, project
+from executionTimer import ExecutionTimer
+from sensorPoller import SensorPoller
+from actuatorExecutor import ActuatorExecutor
 from numpy import *
-from handlers.motionControl.__is_inside import is_inside
 from socket import *
 
 ####################
@@ -32,7 +46,7 @@ def usage(script_name):
     """ Print command-line usage information. """
 
     print textwrap.dedent("""\
-                              Usage: %s [-hn] [-a automaton_file] [-s spec_file]
+                              Usage: %s [-hnc] [-a automaton_file] [-s spec_file] [-r rate] [-p poll_rate] [-t max_staleness]
 
                               -h, --help:
                                   Display this message
@@ -41,7 +55,16 @@ def usage(script_name):
                               -a FILE, --aut-file FILE:
                                   Load automaton from FILE
                               -s FILE, --spec-file FILE:
-                                  Load experiment configuration from FILE """ % script_name)
+                                  Load experiment configuration from FILE
+                              -r HZ, --rate HZ:
+                                  Run the main loop at a fixed rate of HZ iterations per second
+                              -p HZ, --poll-sensors HZ:
+                                  Read sensors in the background, HZ times per second
+                              -t SECONDS, --max-staleness SECONDS:
+                                  When polling sensors, warn about readings older than this
+                                  (default: 1 second)
+                              -c, --async-actuators:
+                                  Run actuator handlers in the background """ % script_name)
 
 ####################
 # THREAD FUNCTIONS #
@@ -52,7 +75,7 @@ def guiListen():
     Processes messages from the GUI window, and reacts accordingly
     """
 
-    global guiListenInitialized, runFSA
+    global guiListenInitialized, runFSA, timer
 
     # Set up socket for communication from simGUI
     host = 'localhost'
@@ -84,6 +107,7 @@ def guiListen():
         elif input == "PAUSE":
             runFSA = False
             print "PAUSED."
+            timer.printReport()
         else:
             print "WARNING: Unknown command received from GUI: " + input
 
@@ -98,12 +122,18 @@ def main(argv):
     # Check command-line arguments #
     ################################
 
+    global timer  # For sharing with GUI listen thread
+
     aut_file = None
     spec_file = None
     show_gui = True
+    rate = None
+    poll_rate = None
+    max_staleness = 1.0
+    async_actuators = False
 
     try:
-        opts, args = getopt.getopt(argv[1:], "hna:s:", ["help", "no-gui", "aut-file=", "spec-file="])
+        opts, args = getopt.getopt(argv[1:], "hnca:s:r:p:t:", ["help", "no-gui", "async-actuators", "aut-file=", "spec-file=", "rate=", "poll-sensors=", "max-staleness="])
     except getopt.GetoptError, err:
         print str(err)
         usage(argv[0])
@@ -115,10 +145,39 @@ def main(argv):
             sys.exit()
         elif opt in ("-n", "--no-gui"):
             show_gui = False
+        elif opt in ("-c", "--async-actuators"):
+            async_actuators = True
         elif opt in ("-a", "--aut-file"):
             aut_file = arg
         elif opt in ("-s", "--spec-file"):
             spec_file = arg
+        elif opt in ("-r", "--rate"):
+            try:
+                rate = float(arg)
+                if rate <= 0:
+                    raise ValueError
+            except ValueError:
+                print "ERROR: Invalid rate '%s'." % arg
+                usage(argv[0])
+                sys.exit(2)
+        elif opt in ("-p", "--poll-sensors"):
+            try:
+                poll_rate = float(arg)
+                if poll_rate <= 0:
+                    raise ValueError
+            except ValueError:
+                print "ERROR: Invalid sensor polling rate '%s'." % arg
+                usage(argv[0])
+                sys.exit(2)
+        elif opt in ("-t", "--max-staleness"):
+            try:
+                max_staleness = float(arg)
+                if max_staleness <= 0:
+                    raise ValueError
+            except ValueError:
+                print "ERROR: Invalid maximum staleness '%s'." % arg
+                usage(argv[0])
+                sys.exit(2)
 
     if aut_file is None:
         print "ERROR: Automaton file needs to be specified."
@@ -130,6 +189,8 @@ def main(argv):
         usage(argv[0])
         sys.exit(2)
 
+    timer = ExecutionTimer(rate)
+
     print "\n[ LTLMOP HYBRID CONTROLLER EXECUTION MODULE ]\n"
     print "Hello. Let's do this!\n"
 
@@ -201,6 +262,12 @@ def main(argv):
     success = FSA.loadFile(aut_file, proj.enabled_sensors, proj.enabled_actuators, proj.all_customs)
     if not success: return
 
+    FSA.timer = timer
+
+    # Allow a timing report to be requested from outside
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: timer.printReport())
+
     #############################
     # Begin automaton execution #
     #############################
@@ -221,15 +288,7 @@ def main(argv):
 
     pose = proj.h_instance['pose'].getPose()
 
-    init_region = None
-
-    for i, r in enumerate(proj.rfi.regions):
-        pointArray = [proj.coordmap_map2lab(x) for x in r.getPoints()]
-        vertices = mat(pointArray).T
-
-        if is_inside([pose[0], pose[1]], vertices):
-            init_region = i
-            break
+    init_region = proj.rfi.locate([pose[0:2]], proj.coordmap_map2lab)[0]
 
     if init_region is None:
         print "Initial pose of ", pose, "not inside any region!"
@@ -253,35 +312,62 @@ def main(argv):
     else:
         print "Starting from state %s." % init_state.name
 
-    ### Get everything moving
+    # Start reading sensors in the background, if requested
+    if poll_rate:
+        print "Polling sensors at %gHz..." % poll_rate
+        FSA.sensor_poller = SensorPoller(FSA, poll_rate, max_staleness)
+        FSA.sensor_poller.start()
 
-    avg_freq = 0
-
-    while True:
-        # Idle if we're not running
-        while not runFSA:
-            proj.h_instance['drive'].setVelocity(0,0)
-            time.sleep(0.05) # We need to sleep to give up the CPU
-
-        tic = time.clock()
+    # Run actuators in the background from now on, if requested
+    # (the initial actuator values above were still set synchronously)
+    if async_actuators:
+        FSA.actuator_executor = ActuatorExecutor()
 
-        FSA.runIteration()
-
-        toc = time.clock()
-
-        # TODO: Possibly implement max rate-limiting?
-        #while (toc - tic) < 0.05:
-        #   time.sleep(0.01)
-        #   toc = time.time()
+    ### Get everything moving
 
-        # Update GUI, no faster than 20Hz
-        if show_gui and (time.time() - last_gui_update_time > 0.05):
-            avg_freq = 0.9*avg_freq + 0.1*1/(toc-tic) # IIR filter
-            UDPSockTo.sendto("Running at approximately %dHz..." % int(avg_freq),addrTo)
-            pose = proj.h_instance['pose'].getPose(cached=True)[0:2]
-            UDPSockTo.sendto("POSE:%d,%d" % tuple(map(int, proj.coordmap_lab2map(pose))),addrTo)
+    avg_freq = 0
 
-            last_gui_update_time = time.time()
+    try:
+        while True:
+            # Idle if we're not running
+            if not runFSA:
+                timer.pause()
+            while not runFSA:
+                proj.h_instance['drive'].setVelocity(0,0)
+                time.sleep(0.05) # We need to sleep to give up the CPU
+
+            timer.startIteration()
+
+            FSA.runIteration()
+
+            # Keep track of how out-of-date the sensor values we're acting on are
+            if FSA.sensor_poller is not None:
+                staleness = FSA.sensor_poller.getStaleness()
+                if staleness is not None:
+                    timer.record("sensor staleness", staleness)
+
+            # Update GUI, no faster than 20Hz
+            if show_gui and (time.time() - last_gui_update_time > 0.05):
+                tic = time.time()
+
+                freq = timer.getFrequency()
+                if freq is not None:
+                    avg_freq = 0.9*avg_freq + 0.1*freq # IIR filter
+                UDPSockTo.sendto("Running at approximately %dHz..." % int(avg_freq),addrTo)
+                pose = proj.h_instance['pose'].getPose(cached=True)[0:2]
+                UDPSockTo.sendto("POSE:%d,%d" % tuple(map(int, proj.coordmap_lab2map(pose))),addrTo)
+
+                last_gui_update_time = time.time()
+                timer.record("gui", last_gui_update_time - tic)
+
+            # Wait until it's time for the next iteration, if we're rate-limited
+            timer.endIteration()
+    finally:
+        if FSA.sensor_poller is not None:
+            FSA.sensor_poller.stop()
+        if FSA.actuator_executor is not None:
+            FSA.actuator_executor.shutdown()
+        timer.printReport()
 
 class RedirectText:
     """
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+""" ==================================================
+    executionTimer.py - Execution loop instrumentation
+    ==================================================
+
+    Paces the main execution loop at a fixed rate, and keeps track of how long
+    each phase of an iteration (sensor evaluation, transition search, motion control,
+    actuator execution, GUI updates) takes, so we can see where the time goes.
+"""
+
+import time, bisect
+
+# Upper edges (in seconds) of the latency histogram bins; the last bin catches everything else
+HISTOGRAM_BINS = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+
+class ExecutionTimer:
+    """
+    Keeps per-phase timing statistics for the execution loop, and optionally sleeps at the
+    end of each iteration to hold the loop at ``rate`` Hz.
+
+    Phases are identified by name, and are reported in the order they were first recorded.
+    Whenever an iteration overruns its period, it is counted as a deadline miss and the
+    schedule is restarted from the current time (rather than trying to catch up).
+    """
+
+    def __init__(self, rate=None):
+        if rate:
+            self.period = 1.0/rate
+        else:
+            self.period = None  # Run as fast as possible
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all statistics collected so far
+        """
+
+        self.phases = []            # Phase names, in order of first appearance
+        self.stats = {}             # Phase name -> [count, total time, max time]
+        self.histograms = {}        # Phase name -> list of counts, one per bin of HISTOGRAM_BINS (+1 for overflow)
+        self.iterations = 0
+        self.deadline_misses = 0
+        self.iteration_start = None
+        self.next_deadline = None
+        self.last_period = None     # Actual length of the last complete iteration (including sleep)
+
+    def record(self, phase, duration):
+        """
+        Add a measurement of ``duration`` seconds to the statistics for ``phase``
+        """
+
+        if phase not in self.stats:
+            self.phases.append(phase)
+            self.stats[phase] = [0, 0.0, 0.0]
+            self.histograms[phase] = [0] * (len(HISTOGRAM_BINS)+1)
+
+        stat = self.stats[phase]
+        stat[0] += 1
+        stat[1] += duration
+        stat[2] = max(stat[2], duration)
+        self.histograms[phase][bisect.bisect_left(HISTOGRAM_BINS, duration)] += 1
+
+    def startIteration(self):
+        """
+        Mark the beginning of an iteration of the execution loop
+        """
+
+        now = time.time()
+
+        if self.iteration_start is not None:
+            self.last_period = now - self.iteration_start
+
+        self.iteration_start = now
+
+        if self.next_deadline is None and self.period is not None:
+            self.next_deadline = now + self.period
+
+    def endIteration(self):
+        """
+        Mark the end of an iteration of the execution loop, and sleep until it is time for
+        the next one if we are running at a fixed rate
+        """
+
+        now = time.time()
+        self.record("iteration", now - self.iteration_start)
+        self.iterations += 1
+
+        if self.period is None:
+            return
+
+        if now > self.next_deadline:
+            # We're late; don't try to make up for lost time
+            self.deadline_misses += 1
+            self.next_deadline = now + self.period
+        else:
+            time.sleep(self.next_deadline - now)
+            self.next_deadline += self.period
+
+    def pause(self):
+        """
+        Call this when the loop is being suspended, so that the idle time isn't counted
+        against the next iteration
+        """
+
+        self.iteration_start = None
+        self.next_deadline = None
+        self.last_period = None
+
+    def getFrequency(self):
+        """
+        Returns the rate (in Hz) that the loop actually ran at during the last iteration,
+        or None if not known
+        """
+
+        if not self.last_period:
+            return None
+
+        return 1.0/self.last_period
+
+    def report(self):
+        """
+        Returns a list of lines summarizing the timing statistics collected so far
+        """
+
+        lines = []
+
+        if self.period is None:
+            lines.append("Timing report (%d iterations, no rate limit):" % self.iterations)
+        else:
+            lines.append("Timing report (%d iterations at %gHz target, %d deadline misses):" %
+                         (self.iterations, 1.0/self.period, self.deadline_misses))
+
+        lines.append("  %-20s %8s %10s %10s" % ("phase", "count", "mean (ms)", "max (ms)"))
+        for phase in self.phases:
+            [count, total, longest] = self.stats[phase]
+            lines.append("  %-20s %8d %10.3f %10.3f" % (phase, count, 1000*total/count, 1000*longest))
+
+        lines.append("Latency histogram (counts per bin, upper edge in ms):")
+        lines.append("  %-20s " % "phase" + " ".join(["%6g" % (1000*b) for b in HISTOGRAM_BINS] + ["   inf"]))
+        for phase in self.phases:
+            lines.append("  %-20s " % phase + " ".join(["%6d" % n for n in self.histograms[phase]]))
+
+        return lines
+
+    def printReport(self):
+        """
+        Print out the timing report, one line at a time (so as not to overflow the GUI socket)
+        """
+
+        for line in self.report():
+            print line
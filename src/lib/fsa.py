@@ -10,22 +10,38 @@
 """
 
 import math, re, sys, random, os, subprocess, time
+import mmap, struct, tempfile
 from regions import *
 import numpy
 import fileMethods
 
+# Binary automaton cache format (see Automaton.writeCache())
+AUT_CACHE_MAGIC = "LTLMoP automaton cache v1\n"
+AUT_CACHE_HEADER = struct.Struct("<dQIIII") # .aut mtime, .aut size, # of props, # of states, # of transitions, bytes per state
+AUT_CACHE_INT = numpy.dtype("<u4")
+
+# Region encoding propositions are named "bit0", "bit1", etc.
+BIT_PROP_RE = re.compile(r'^bit\d+$')
+
 
 ###########################################################
 
-class FSA_State:
+class FSA_State(object):
     """
     Each state in the automaton is an object.
 
     WARNING/FIXME: Since all states belong to a list within the Automaton object, the states may
     also be referred to just by their index within that list.  This can get confusing sometimes.
     """
+
+    # Large automata have tens of thousands of states, so don't give each one a __dict__
+    __slots__ = ('name', 'index', 'rank', 'inputs', 'outputs', 'transitions', 'region',
+                 'input_mask', 'input_value', 'output_mask', 'output_value')
+
     def __init__ (self, name, inputs, outputs, transitions):
         self.name = name                    # The name of the state (currently the number assigned by TLV)
+        self.index = None                   # The position of this state within Automaton.states
+        self.rank = None                    # The rank assigned by TLV
 
         # NOTE: All input/output values are STRINGS.  Please cast and compare appropriately.
 
@@ -38,6 +54,13 @@ class FSA_State:
         self.transitions = transitions      # A list of state objects that may be transitioned to
                                             # from this state
 
+        # These are filled in by Automaton.compileStates():
+        self.region = None                  # The number of the region encoded by the "bitX" outputs
+        self.input_mask = 0                 # Bitmask of the sensors this state constrains
+        self.input_value = 0                # Bitmask of the sensors that must be true
+        self.output_mask = 0                # Bitmask of the (non-"bitX") outputs this state defines
+        self.output_value = 0               # Bitmask of the (non-"bitX") outputs that are true
+
 ###########################################################
 
 class Automaton:
@@ -56,6 +79,7 @@ class Automaton:
         self.proj = proj
 
         self.states = []    # A collection of state objects belonging to the automaton
+        self.stateIndex = {}    # A mapping from state name to index in self.states
 
         self.regions = proj.rfi.regions # a list of region objects
         self.regionMapping = proj.regionMapping # mapping between original regions and decomposed regions
@@ -76,17 +100,44 @@ class Automaton:
         self.current_region = None
         self.current_outputs = {}
 
+        # Bit assignments for packing propositions into integers (see compileStates())
+        self.sensor_bits = {}
+        self.output_bits = {}
+        self.state_table = None
+
+        # Memoized results of findTransitionableStates(), keyed by (state index, packed sensor values)
+        self.successor_cache = {}
+        self.successor_cache_size = 100000  # Maximum number of entries to remember (0 to disable)
+
+        # An ExecutionTimer to record how long each phase of runIteration() takes (optional)
+        self.timer = None
+
+        # A SensorPoller to read sensor values from in the background, instead of querying
+        # the sensor handlers directly on every iteration (optional)
+        self.sensor_poller = None
+
+        # An ActuatorExecutor to run actuator handlers on in the background, instead of
+        # blocking the execution loop while they run (optional)
+        self.actuator_executor = None
+
 
     def stateWithName(self, name):
         """
         Find the state with the given name
         """
-        for i in range(len(self.states)):
-            if(self.states[i].name == name):
-                return self.states[i]
+        try:
+            return self.states[self.stateIndex[name]]
+        except KeyError:
+            print "ERROR: Can't find state with name %s!" % (name)
+            return None
 
-        print "ERROR: Can't find state with name %s!" % (name)
-        return None
+    def addState(self, state):
+        """
+        Add a state object to the automaton, indexing it by name
+        """
+        state.index = len(self.states)
+        self.stateIndex[state.name] = state.index
+        self.states.append(state)
 
     def dumpStates(self, range=None):
         """
@@ -116,11 +167,13 @@ class Automaton:
         if state is None:
             state = self.current_state
 
+        tic = time.time()
+
         print "Current goal: " + state.rank
 
         for key, output_val in state.outputs.iteritems():
             # Skip any "bitX" region encodings
-            if re.match('^bit\d+$', key): continue
+            if BIT_PROP_RE.match(key): continue
 
             new_val = (output_val == "1")
 
@@ -131,18 +184,41 @@ class Automaton:
 
                 # Run any actuator handlers if appropriate
                 if key in self.actuators:
-                    self.motion_handler.gotoRegion(self.current_region, self.current_region)  # Stop, in case actuation takes time
-                    #self.actuator_handler.setActuator(key, new_val)
-                    initial=False
-                    exec(self.actuator_handler[key])
+                    if self.actuator_executor is not None:
+                        # Let it run in the background; runIteration() will wait for it before
+                        # completing the transition
+                        self.actuator_executor.submit(key, self.executeActuator, key, new_val)
+                    else:
+                        self.motion_handler.gotoRegion(self.current_region, self.current_region)  # Stop, in case actuation takes time
+                        self.executeActuator(key, new_val)
 
                 self.current_outputs[key] = new_val
 
+        if self.timer is not None:
+            self.timer.record("actuators", time.time() - tic)
+
+    def executeActuator(self, actuator, new_val, initial=False):
+        """
+        Call the actuator handler to set the actuator proposition ``actuator`` to ``new_val``
+        """
+        #self.actuator_handler.setActuator(actuator, new_val)
+        exec(self.actuator_handler[actuator])
+
+    def evaluateSensor(self, sensor, initial=False):
+        """
+        Query the sensor handler for the current value of the sensor proposition ``sensor``
+        """
+        return eval(self.sensor_handler[sensor])
+
     def regionFromState(self, state):
         """
         Given a state object, look at its 'bitX' outputs to determine the region encoded,
         and return the NUMBER of this region.
         """
+        if state.region is not None:
+            # Already figured this out in compileStates()
+            return state.region
+
         try:
             region = 0
             for bit in range(self.num_bits):
@@ -155,13 +231,62 @@ class Automaton:
 
         return region
 
-    def loadFile(self, filename, sensors, actuators, custom_props):
+    def compileStates(self):
+        """
+        Precompute integer bitmask versions of the inputs and outputs of every state, along
+        with the region each state is in, so that finding transitionable states boils down to a
+        few integer operations per state.
+
+        Each sensor gets one bit (in the order of self.sensors), as does each non-"bitX" output.
+        If everything fits into 64 bits, we also build a table of arrays so that the search over all
+        states for an initial state can be done with NumPy.
+        """
+
+        self.sensor_bits = dict((sensor, 1 << i) for i, sensor in enumerate(self.sensors))
+        self.output_bits = {}
+        self.successor_cache = {}
+
+        for state in self.states:
+            state.input_mask = state.input_value = 0
+            for key, value in state.inputs.iteritems():
+                state.input_mask |= self.sensor_bits[key]
+                if int(value) == 1:
+                    state.input_value |= self.sensor_bits[key]
+
+            state.output_mask = state.output_value = 0
+            for key, value in state.outputs.iteritems():
+                # Ignore "bitX" output propositions
+                if BIT_PROP_RE.match(key): continue
+
+                if key not in self.output_bits:
+                    self.output_bits[key] = 1 << len(self.output_bits)
+                state.output_mask |= self.output_bits[key]
+                if int(value) == 1:
+                    state.output_value |= self.output_bits[key]
+
+            # Decode the region, if there is one (there isn't for e.g. mopsy's counter-strategy)
+            state.region = None
+            if all(("bit" + str(bit)) in state.outputs for bit in range(self.num_bits)):
+                state.region = self.regionFromState(state)
+
+        if len(self.sensor_bits) <= 64 and len(self.output_bits) <= 64:
+            self.state_table = [numpy.array([-1 if s.region is None else s.region for s in self.states], dtype=int)] + \
+                               [numpy.array([getattr(s, attr) for s in self.states], dtype=numpy.uint64)
+                                for attr in ['input_mask', 'input_value', 'output_mask', 'output_value']]
+        else:
+            self.state_table = None
+
+    def loadFile(self, filename, sensors, actuators, custom_props, progress_callback=None, use_cache=True):
         """
         Create an automaton by reading in a file produced by TLV.
 
         In addition to a filename, you also need to provide a list of sensor names (so that we can tell the difference between system and environment propositions when reading the file), and a list of actuator names (so we can distinguish internal state propositions from outputs).
 
-        Basically just a lot of regexes.
+        The file is read line-by-line in a single pass, so we never need to hold the whole thing in memory.
+        If ``progress_callback`` is given, it will be called periodically with the fraction of the file read so far.
+
+        Unless ``use_cache`` is False, a binary copy of the automaton is saved alongside the file the first time
+        it is parsed, and used instead of the text file for as long as the text file remains unchanged.
         """
 
         # These will be used later by updateOutputs() and findTransitionableState()
@@ -169,106 +294,301 @@ class Automaton:
         self.sensors = sensors
         self.custom_props = custom_props
 
-        FILE = open(filename,"r")
-        fsa_description = FILE.read()
-        FILE.close()
-
-        ###################
-        # Read in states: #
-        ###################
-
-        # A magical regex to slurp up a state and its information all at once
-        p = re.compile(r"State (?P<num>\d+) with rank (?P<rank>[\d\(\),-]+) -> <(?P<conds>(?:\w+:\d(?:, )?)+)>", re.IGNORECASE|re.MULTILINE)
         self.last_next_states = []
         self.next_state = None
         self.next_region = None
-        m = p.finditer(fsa_description)
 
-        # Now, for each state we find:
-        for match in m:
+        # Only cache automata that come entirely from this one file
+        use_cache = use_cache and len(self.states) == 0
 
-            # Get the number (at least the number that TLV assigned the state; TLV deletes states
-            # during optimization, resulting in non-consecutive numbering which would be bad for binary
-            # encoding efficiency, so we don't use these numbers internally except as state names)
-            # and rank (an irrelevant synthesis byproduct that we only read in for completeness).
-            # This is the easy part.
-
-            number = match.group('num')
-            rank = match.group('rank')
+        if use_cache and self.loadCache(filename):
+            if progress_callback is not None:
+                progress_callback(1.0)
+        else:
+            self.parseTextFile(filename, progress_callback)
+            if use_cache:
+                self.writeCache(filename)
 
-            # A regex so we can iterate over "PROP = VALUE" terms
-            p2 = re.compile(r"(?P<var>\w+):(?P<val>\d)", re.IGNORECASE|re.MULTILINE)
-            m2 = p2.finditer(match.group('conds'))
+        self.compileStates()
 
-            inputs = {}
-            outputs = {}
+        # All done, hooray!
+        print "Loaded %d states." % len(self.states)
+        #self.dumpStates()
 
-            # So, for each of these terms:
-            for new_condition in m2:
-                var = new_condition.group('var')
-                val = new_condition.group('val')
+        # Check that all necessary sensor and acuator handlers are present
+        if self.sensor_handler is None:
+            # We won't be executing anyways
+            return True
 
-                # Ignore internal "current goal" propositions
-                if var.startswith('s_'): continue
+        for sensor in self.sensors:
+            if sensor not in self.sensor_handler:
+                print "ERROR: No sensor proposition mapping exists for '%s'! Aborting." % sensor
+                return False
 
-                # And then put it in the right place!
+        for actuator in self.actuators:
+            if actuator not in self.actuator_handler:
+                print "ERROR: No actuator proposition mapping exists for '%s'! Aborting." % actuator
+                return False
 
-                if var not in sensors:
-                    # If it's not a sensor proposition, then it's an output proposition
-                    outputs[var]=val
-                else:
-                    # Oh hey it's a sensor
-                    inputs[var]=val
+        return True
 
-            # We'll add transitions later; first we have to create all the states so we can
-            # refer to them when we define transitions
-            transitions = []
+    def parseTextFile(self, filename, progress_callback=None):
+        """
+        Read in the states and transitions from a textual automaton file produced by TLV.
 
-            # Create the state and add it to our collection
-            newstate = FSA_State(number, inputs, outputs, transitions)
-            newstate.rank=rank
-            self.states.append(newstate)
+        Basically just a lot of regexes.
+        """
 
+        # A magical regex to slurp up a state and its information all at once
+        p_state = re.compile(r"State (?P<num>\d+) with rank (?P<rank>[\d\(\),-]+) -> <(?P<conds>(?:\w+:\d(?:, )?)+)>", re.IGNORECASE)
 
-        ########################
-        # Read in transitions: #
-        ########################
+        # A regex so we can iterate over "PROP = VALUE" terms
+        p_cond = re.compile(r"(?P<var>\w+):(?P<val>\d)", re.IGNORECASE)
 
         # Another simple regex, this time for reading in transition definitions
-        p = re.compile(r"State (?P<start>\d+)[^\n]+\s*With successors : (?P<ends>(?:\d+(?:, )?)+)", re.IGNORECASE|re.MULTILINE)
-        m = p.finditer(fsa_description)
+        p_trans = re.compile(r"\s*With successors : (?P<ends>(?:\d+(?:, )?)+)", re.IGNORECASE)
 
-        # For each line:
-        for match in m:
-            # Get the state that the transitions come FROM
-            start = match.group('start')
-            # And make a list of the states that the transitions go TO
-            ends = match.group('ends').split(', ')
+        sensors = set(self.sensors)
 
-            # Change the references to state names into references to the corresponding state objects
-            ends = map(lambda name: self.stateWithName(name), ends)
+        # Successors may refer to states we haven't seen yet, so we just remember the names
+        # and resolve them once the whole file has been read
+        successor_names = []    # Indexed the same as the states read from this file
+        first_index = len(self.states)
+        last_state = None
 
-            # Stick these transitions onto the appropriate state
-            self.stateWithName(start).transitions = ends
+        FILE = open(filename,"r")
+        file_size = float(max(os.path.getsize(filename), 1))
 
-        # All done, hooray!
-        print "Loaded %d states." % len(self.states)
-        #self.dumpStates()
+        for line_num, line in enumerate(FILE):
+            if progress_callback is not None and line_num % 10000 == 0:
+                progress_callback(FILE.tell()/file_size)
 
-        # Check that all necessary sensor and acuator handlers are present
-        if self.sensor_handler is None:
-            # We won't be executing anyways
-            return True
+            ###################
+            # Read in states: #
+            ###################
 
-        for sensor in self.sensors:
-            if sensor not in self.sensor_handler:
-                print "ERROR: No sensor proposition mapping exists for '%s'! Aborting." % sensor
+            match = p_state.search(line)
+            if match:
+                # Get the number (at least the number that TLV assigned the state; TLV deletes states
+                # during optimization, resulting in non-consecutive numbering which would be bad for binary
+                # encoding efficiency, so we don't use these numbers internally except as state names)
+                # and rank (an irrelevant synthesis byproduct that we only read in for completeness).
+                # This is the easy part.
+
+                number = match.group('num')
+                rank = match.group('rank')
+
+                inputs = {}
+                outputs = {}
+
+                # So, for each of these terms:
+                for new_condition in p_cond.finditer(match.group('conds')):
+                    # Proposition names repeat in every state, so share a single copy of each
+                    var = intern(new_condition.group('var'))
+                    val = new_condition.group('val')
+
+                    # Ignore internal "current goal" propositions
+                    if var.startswith('s_'): continue
+
+                    # And then put it in the right place!
+
+                    if var not in sensors:
+                        # If it's not a sensor proposition, then it's an output proposition
+                        outputs[var]=val
+                    else:
+                        # Oh hey it's a sensor
+                        inputs[var]=val
+
+                # Create the state and add it to our collection
+                # (transitions will be filled in at the end)
+                newstate = FSA_State(number, inputs, outputs, [])
+                newstate.rank=rank
+                self.addState(newstate)
+                successor_names.append([])
+                last_state = newstate
+                continue
+
+            ########################
+            # Read in transitions: #
+            ########################
+
+            match = p_trans.match(line)
+            if match and last_state is not None:
+                # Make a list of the states that the transitions go TO from the last state we read
+                successor_names[last_state.index - first_index] = match.group('ends').split(', ')
+
+        FILE.close()
+
+        # Change the references to state names into references to the corresponding state objects
+        for state, ends in zip(self.states[first_index:], successor_names):
+            state.transitions = map(self.stateWithName, ends)
+
+        if progress_callback is not None:
+            progress_callback(1.0)
+
+    def getCacheFilename(self, filename):
+        """
+        Returns the name of the binary cache file corresponding to the automaton file ``filename``
+        """
+        return filename + ".cache"
+
+    def writeCache(self, filename):
+        """
+        Save a compact binary copy of the automaton we have just loaded from ``filename``, so that
+        subsequent loads can skip parsing.  Returns True on success.
+
+        The cache stores a table of proposition names, the value of every proposition in each state
+        packed into a bit vector, and the transitions as a compressed sparse row (CSR) successor array.
+        It is tagged with the modification time and size of ``filename`` so we can tell if it is stale.
+        """
+
+        if len(self.states) == 0:
+            return False
+
+        # We can only pack the values if every state defines the same propositions
+        props = sorted(self.states[0].inputs.keys() + self.states[0].outputs.keys())
+        prop_set = set(props)
+        for state in self.states:
+            if len(state.inputs) + len(state.outputs) != len(props) or \
+               not prop_set.issuperset(state.inputs) or not prop_set.issuperset(state.outputs) or \
+               None in state.transitions:
                 return False
 
-        for actuator in self.actuators:
-            if actuator not in self.actuator_handler:
-                print "ERROR: No actuator proposition mapping exists for '%s'! Aborting." % actuator
+        values = numpy.zeros((len(self.states), len(props)), dtype=numpy.uint8)
+        for i, state in enumerate(self.states):
+            values[i] = [(state.inputs.get(p) or state.outputs.get(p)) == "1" for p in props]
+        values = numpy.packbits(values, axis=1)
+
+        offsets = numpy.zeros(len(self.states)+1, dtype=AUT_CACHE_INT)
+        offsets[1:] = numpy.cumsum([len(state.transitions) for state in self.states])
+        targets = numpy.array([t.index for state in self.states for t in state.transitions], dtype=AUT_CACHE_INT)
+
+        # Write to a temporary file first, so no one ever sees a half-written cache
+        # (with a unique name, in case someone else is writing the same cache at the same time)
+        cache_filename = self.getCacheFilename(filename)
+        try:
+            aut_stat = os.stat(filename)
+            fd, tmp_filename = tempfile.mkstemp(prefix=os.path.basename(cache_filename) + ".",
+                                                suffix=".tmp", dir=os.path.dirname(os.path.abspath(cache_filename)))
+            FILE = os.fdopen(fd, "wb")
+        except (IOError, OSError):
+            return False
+
+        FILE.write(AUT_CACHE_MAGIC)
+        FILE.write(AUT_CACHE_HEADER.pack(aut_stat.st_mtime, aut_stat.st_size, len(props),
+                                         len(self.states), len(targets), values.shape[1]))
+        for table in [props, [s.name for s in self.states], [s.rank for s in self.states]]:
+            blob = "\n".join(table)
+            FILE.write(struct.pack("<I", len(blob)))
+            FILE.write(blob)
+        for array in [values, offsets, targets]:
+            # Keep each array aligned so it can be used in-place from the memory map
+            FILE.write("\0" * (-FILE.tell() % AUT_CACHE_INT.itemsize))
+            FILE.write(array.tostring())
+        FILE.close()
+
+        try:
+            if os.name == "nt" and os.path.exists(cache_filename):
+                # Windows won't rename over an existing file
+                os.remove(cache_filename)
+            os.rename(tmp_filename, cache_filename)
+        except OSError:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            return False
+
+        return True
+
+    def loadCache(self, filename):
+        """
+        Create an automaton from the binary cache corresponding to the automaton file ``filename``, as written
+        by writeCache().  The cache is memory-mapped rather than read, so the packed arrays can be decoded
+        in place without copying the file first; the map is closed once the states have been created.
+
+        Returns False if there is no up-to-date cache available.
+        """
+
+        cache_filename = self.getCacheFilename(filename)
+        if not (os.path.exists(filename) and os.path.exists(cache_filename)):
+            return False
+
+        aut_stat = os.stat(filename)
+
+        try:
+            FILE = open(cache_filename, "rb")
+            try:
+                buf = mmap.mmap(FILE.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                FILE.close()
+        except (IOError, OSError, ValueError, mmap.error):
+            return False
+
+        try:
+            return self._loadCacheFromBuffer(buf, aut_stat, cache_filename)
+        finally:
+            # Everything has been copied out of the map by now
+            buf.close()
+
+    def _loadCacheFromBuffer(self, buf, aut_stat, cache_filename):
+        """
+        Helper for loadCache(): read the automaton from the memory-mapped cache ``buf``
+        """
+
+        try:
+            if buf[:len(AUT_CACHE_MAGIC)] != AUT_CACHE_MAGIC:
                 return False
+            pos = len(AUT_CACHE_MAGIC)
+            [mtime, size, num_props, num_states, num_edges, bytes_per_state] = \
+                AUT_CACHE_HEADER.unpack_from(buf, pos)
+            pos += AUT_CACHE_HEADER.size
+
+            if mtime != aut_stat.st_mtime or size != aut_stat.st_size:
+                # The automaton has changed since the cache was written
+                return False
+
+            tables = []
+            for i in range(3):
+                [length] = struct.unpack_from("<I", buf, pos)
+                pos += 4
+                tables.append(buf[pos:pos+length].split("\n"))
+                pos += length
+            [props, names, ranks] = tables
+
+            arrays = []
+            for dtype, count in [(numpy.uint8, num_states*bytes_per_state),
+                                 (AUT_CACHE_INT, num_states+1),
+                                 (AUT_CACHE_INT, num_edges)]:
+                pos += -pos % AUT_CACHE_INT.itemsize
+                arrays.append(numpy.frombuffer(buf, dtype=dtype, count=count, offset=pos))
+                pos += arrays[-1].nbytes
+            [values, offsets, targets] = arrays
+        except (struct.error, ValueError):
+            print "WARNING: Ignoring corrupt automaton cache %s" % cache_filename
+            return False
+
+        # Turn the packed bits back into the usual string-valued dictionaries
+        props = map(intern, props)
+        input_idx = [i for i, p in enumerate(props) if p in self.sensors]
+        output_idx = [i for i, p in enumerate(props) if p not in self.sensors]
+        input_props = [props[i] for i in input_idx]
+        output_props = [props[i] for i in output_idx]
+        bits = numpy.unpackbits(values.reshape(num_states, bytes_per_state), axis=1)[:, :num_props]
+        first_index = len(self.states)
+
+        for name, rank, row in zip(names, ranks, numpy.array(["0", "1"])[bits].tolist()):
+            inputs = dict(zip(input_props, [row[i] for i in input_idx]))
+            outputs = dict(zip(output_props, [row[i] for i in output_idx]))
+
+            newstate = FSA_State(name, inputs, outputs, [])
+            newstate.rank = rank
+            self.addState(newstate)
+
+        offsets = offsets.tolist()
+        targets = (targets + first_index).tolist()
+        for i, state in enumerate(self.states[first_index:]):
+            state.transitions = [self.states[j] for j in targets[offsets[i]:offsets[i+1]]]
 
         return True
 
@@ -305,7 +625,7 @@ class Automaton:
             stateRegion = self.regionFromState(state)
             FILE.write( self.getAnnotatedRegionName(stateRegion) + '\\n')
             for key in state.outputs.keys():
-                if re.match('^bit\d+$',key): continue
+                if BIT_PROP_RE.match(key): continue
                 if state.outputs[key] == '1':
                     FILE.write( key + '\\n')
                 else:
@@ -337,12 +657,7 @@ class Automaton:
         state selection as well.
         """
 
-        candidates = []
-
-        # Define our pool of states to select from
         if initial:
-            state_list = self.states
-
             # initialize all sensor and actuators
             for prop,codes in self.sensor_handler['initializing_handler'].iteritems():
                 if prop in self.sensors:
@@ -353,46 +668,84 @@ class Automaton:
                     new_val = self.current_outputs[prop]
                     for code in codes:
                         eval(code)
-        else:
-            state_list = self.current_state.transitions
 
-        # Take a snapshot of our current sensor readings
+        # Take a snapshot of our current sensor readings, packed into a bitmask
         # This is so we don't risk the readings changing in the middle of our state search
-        sensor_state = {}
-        for sensor in self.sensors:
-            sensor_state[sensor] = eval(self.sensor_handler[sensor])
+        tic = time.time()
+        sensor_value = 0
+        if self.sensor_poller is not None and not initial:
+            # Use the latest values read in the background
+            for sensor, value in self.sensor_poller.getSnapshot().iteritems():
+                if int(value):
+                    sensor_value |= self.sensor_bits[sensor]
+        else:
+            for sensor in self.sensors:
+                if int(self.evaluateSensor(sensor, initial)):
+                    sensor_value |= self.sensor_bits[sensor]
+        toc = time.time()
 
-        for state in state_list:
-            okay = True
+        if initial:
+            candidates = self.findInitialCandidates(sensor_value)
+        else:
+            candidates = self.findSuccessorCandidates(sensor_value)
+
+        if self.timer is not None:
+            self.timer.record("sensors", toc - tic)
+            self.timer.record("transition search", time.time() - toc)
+
+        return candidates
 
-            if initial:
-                # First see if we can be in the state given our current region
-                if self.regionFromState(state) != self.current_region: continue
-                
-                # Start only with Rank 0 states
-                #if int(state.rank) != 0: continue
+    def findSuccessorCandidates(self, sensor_value):
+        """
+        Returns a list of the successors of the current state whose inputs match the
+        packed sensor values ``sensor_value``
+        """
 
-                # Now check whether our current output values match those of the state
-                for key, value in state.outputs.iteritems():
-                    # Ignore "bitX" output propositions
-                    if re.match('^bit\d+$', key): continue
+        # See if we've already been in this state with these sensor values
+        key = (self.current_state.index, sensor_value)
+        if key in self.successor_cache:
+            # Hand out a copy, since the caller may modify the list
+            return list(self.successor_cache[key])
 
-                    if int(self.current_outputs[key]) != int(value):
-                        okay = False
-                        break
+        # Otherwise, check whether our current sensor values match those of each successor
+        candidates = [state for state in self.current_state.transitions
+                      if (sensor_value & state.input_mask) == state.input_value]
 
-                if not okay: continue
+        if self.successor_cache_size > 0:
+            if len(self.successor_cache) >= self.successor_cache_size:
+                # Don't let the cache grow without bound
+                self.successor_cache.clear()
+            self.successor_cache[key] = candidates
 
-            # Now check whether our current sensor values match those of the state
-            for key, value in state.inputs.iteritems():
-                if int(sensor_state[key]) != int(value):
-                    okay = False
-                    break
+        return list(candidates)
 
-            if okay:
-                candidates.append(state)
+    def findInitialCandidates(self, sensor_value):
+        """
+        Returns a list of all states consistent with the current region, the current outputs,
+        and the packed sensor values ``sensor_value``
+        """
 
-        return candidates
+        # Our current output values, packed the same way as the states' outputs
+        output_value = 0
+        for key, bit in self.output_bits.iteritems():
+            if self.current_outputs.get(key, False):
+                output_value |= bit
+
+        if self.state_table is not None:
+            # Check all the states at once
+            [regions, input_masks, input_values, output_masks, output_values] = self.state_table
+            region = -1 if self.current_region is None else self.current_region
+            okay = (regions == region) & \
+                   ((input_masks & numpy.uint64(sensor_value)) == input_values) & \
+                   ((output_masks & numpy.uint64(output_value)) == output_values)
+            return [self.states[i] for i in numpy.flatnonzero(okay)]
+
+        # First see if we can be in the state given our current region, and
+        # then check whether our current output and sensor values match those of the state
+        return [state for state in self.states
+                if state.region == self.current_region and
+                   (output_value & state.output_mask) == state.output_value and
+                   (sensor_value & state.input_mask) == state.input_value]
 
     def chooseInitialState(self, init_region, init_outputs):
         """
@@ -425,7 +778,7 @@ class Automaton:
         # Bring our actuator states up-to-date
         for key, output_val in self.current_state.outputs.iteritems():
             # Skip any "bitX" region encodings
-            if re.match('^bit\d+$', key): continue
+            if BIT_PROP_RE.match(key): continue
             if key in self.actuators:
                 new_val = output_val
                 initial=False
@@ -471,7 +824,10 @@ class Automaton:
                 print "Heading to region %s..." % self.regions[self.next_region].name
 
         # Move one step towards the next region (or stay in the same region)
+        tic = time.time()
         arrived = self.motion_handler.gotoRegion(self.current_region, self.next_region)
+        if self.timer is not None:
+            self.timer.record("motion", time.time() - tic)
 
         # Check for completion of motion
         if arrived or not self.transition_contains_motion:
@@ -484,6 +840,14 @@ class Automaton:
                 # Run actuators after motion
                 self.updateOutputs(self.next_state)
 
+            if self.actuator_executor is not None and not self.actuator_executor.isIdle():
+                # Hold here until the actuators have caught up; we'll check again next iteration
+                if self.next_region is not None:
+                    self.motion_handler.gotoRegion(self.next_region, self.next_region)
+                else:
+                    self.motion_handler.gotoRegion(self.current_region, self.current_region)
+                return
+
             self.current_state = self.next_state
             self.current_region = self.next_region
             #print "Now in state %s (z = %s)" % (self.current_state.name, self.current_state.rank)
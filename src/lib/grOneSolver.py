@@ -0,0 +1,827 @@
+#!/usr/bin/env python
+
+""" ===========================================
+    grOneSolver.py - In-process GR(1) synthesis
+    ===========================================
+
+    Synthesizes an automaton from the .smv and .ltl files written by
+    createJTLVinput.py, without running JTLV.  The game is played symbolically
+    using the BDDs in bdd.py, following the same fixpoint computations and
+    strategy extraction as etc/jtlv/GROne/GROneGame.java, and the result is
+    written out in the same .aut format so that fsa.py can read it.
+"""
+
+import re
+import sys
+import time
+from bdd import BDDManager
+
+class SpecificationError(Exception):
+    """ Raised when the .smv or .ltl file can't be understood """
+    pass
+
+#####################
+# Reading the input #
+#####################
+
+def parseSMVFile(filename):
+    """
+    Return the names of the environment and system variables declared in an .smv file,
+    as two lists (each in order of declaration)
+    """
+
+    variables = {"env": [], "sys": []}
+    module = None
+
+    f = open(filename, "r")
+    for line in f:
+        line = line.split("--")[0].strip()
+        m = re.match(r"MODULE\s+(\w+)", line)
+        if m:
+            module = m.group(1)
+            continue
+        m = re.match(r"(\w+)\s*:\s*boolean\s*;", line)
+        if m and module in variables:
+            variables[module].append(m.group(1))
+    f.close()
+
+    return variables["env"], variables["sys"]
+
+# Tokens of the LTL syntax, in order of priority
+p_token = re.compile(r"\s*(?:(?P<op>\[\]<>|\[\]|<>|<->|->|[()!&|;])|(?P<word>[A-Za-z_][\w.]*))")
+
+class LTLParser(object):
+    """
+    Parses the LTLSPEC sections of an .ltl file into nested tuples, e.g.
+    ``("and", [("var", "s.bit0"), ("not", ("next", ("var", "e.person")))])``.
+
+    Operators are (from loosest to tightest binding): ``->`` (right-associative),
+    ``<->``, ``|``, ``&``, and the unary ``!``, ``next``, ``[]``, ``<>`` and ``[]<>``.
+    """
+
+    def __init__(self, text):
+        # Strip comments
+        text = re.sub(r"--[^\n]*", "", text)
+
+        self.tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = p_token.match(text, pos)
+            if m is None:
+                raise SpecificationError("Unexpected character %r in LTL file" % text[pos:].lstrip()[:1])
+            self.tokens.append(m.group("op") or m.group("word"))
+            pos = m.end()
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise SpecificationError("Unexpected end of LTL file")
+        self.pos += 1
+        return token
+
+    def expect(self, token):
+        found = self.next()
+        if found != token:
+            raise SpecificationError("Expected '%s' in LTL file, but found '%s'" % (token, found))
+
+    def parseSpecs(self):
+        """ Return a list of the formulas in each LTLSPEC section """
+
+        specs = []
+        while self.peek() is not None:
+            self.expect("LTLSPEC")
+            specs.append(self.parseFormula())
+            if self.peek() == ";":
+                self.next()
+        return specs
+
+    def parseFormula(self):
+        left = self.parseIff()
+        if self.peek() == "->":
+            self.next()
+            return ("imp", left, self.parseFormula())
+        return left
+
+    def parseIff(self):
+        left = self.parseJunction("or")
+        while self.peek() == "<->":
+            self.next()
+            left = ("iff", left, self.parseJunction("or"))
+        return left
+
+    def parseJunction(self, kind):
+        if kind == "or":
+            op, parseChild = "|", lambda: self.parseJunction("and")
+        else:
+            op, parseChild = "&", self.parseUnary
+
+        children = [parseChild()]
+        while self.peek() == op:
+            self.next()
+            children.append(parseChild())
+
+        if len(children) == 1:
+            return children[0]
+        return (kind, children)
+
+    def parseUnary(self):
+        token = self.next()
+        if token == "!":
+            return ("not", self.parseUnary())
+        if token == "next":
+            return ("next", self.parseUnary())
+        if token == "[]":
+            return ("always", self.parseUnary())
+        if token == "<>":
+            return ("eventually", self.parseUnary())
+        if token == "[]<>":
+            return ("always", ("eventually", self.parseUnary()))
+        if token == "(":
+            formula = self.parseFormula()
+            self.expect(")")
+            return formula
+        if token == "TRUE":
+            return ("const", True)
+        if token == "FALSE":
+            return ("const", False)
+        if re.match(r"[A-Za-z_]", token) and token != "LTLSPEC":
+            return ("var", token)
+        raise SpecificationError("Unexpected '%s' in LTL file" % token)
+
+def parseLTLFile(filename):
+    """ Return the assumption and guarantee formulas from an .ltl file """
+
+    f = open(filename, "r")
+    specs = LTLParser(f.read()).parseSpecs()
+    f.close()
+
+    if len(specs) != 2:
+        raise SpecificationError("Expected two LTLSPEC sections (assumptions and guarantees), but found %d" % len(specs))
+
+    return specs
+
+def conjuncts(formula):
+    """ Split a formula into its top-level conjuncts """
+
+    if formula[0] == "and":
+        result = []
+        for child in formula[1]:
+            result.extend(conjuncts(child))
+        return result
+    return [formula]
+
+def isTemporal(formula):
+    """ Return True if the formula contains any temporal operators (other than next) """
+
+    if formula[0] in ["always", "eventually"]:
+        return True
+    if formula[0] in ["and", "or"]:
+        return any(isTemporal(f) for f in formula[1])
+    if formula[0] in ["not", "next"]:
+        return isTemporal(formula[1])
+    if formula[0] in ["imp", "iff"]:
+        return isTemporal(formula[1]) or isTemporal(formula[2])
+    return False
+
+#####################
+# The game          #
+#####################
+
+class GROneGame(object):
+    """
+    A GR(1) game between an environment and a system, each with initial conditions,
+    a transition relation and a list of liveness conditions ("justice").
+
+    All the BDDs are built in ``manager``, which can be shared between games
+    (e.g. on successive compilations of the same project) as long as the variables
+    are the same.
+    """
+
+    def __init__(self, envVars, sysVars, assumptions, guarantees, manager=None, checkpoint=None):
+        if manager is None:
+            manager = newManager(envVars, sysVars)
+        self.manager = m = manager
+
+        # Called regularly while solving and building automata; it can raise an exception to stop us
+        self.checkpoint = checkpoint or (lambda: None)
+
+        self.envVars = ["e." + v for v in envVars]
+        self.sysVars = ["s." + v for v in sysVars]
+        self.allVars = self.envVars + self.sysVars
+        self.allVarsSet = set(self.allVars)
+
+        self.envUnprime = m.varSet(self.envVars)
+        self.envPrime = m.varSet([v + "'" for v in self.envVars])
+        self.sysUnprime = m.varSet(self.sysVars)
+        self.sysPrime = m.varSet([v + "'" for v in self.sysVars])
+        self.allUnprime = self.envUnprime & self.sysUnprime
+
+        self.toPrime = m.renaming(dict((v, v + "'") for v in self.allVars))
+        self.toUnprime = m.renaming(dict((v + "'", v) for v in self.allVars))
+
+        # (Region bits are the system variables named bit0, bit1, etc.)
+        self.nonRegionProps = m.varSet([v for v in self.sysVars if not v.startswith("s.bit")])
+
+        self.envInit, self.envTrans, self.envJustice = self.addReactiveBehavior(assumptions)
+        self.sysInit, self.sysTrans, self.sysJustice = self.addReactiveBehavior(guarantees)
+
+    ### Building BDDs for the specification
+
+    def addReactiveBehavior(self, spec):
+        """
+        Sort the conjuncts of a specification into initial conditions, transition relation and
+        liveness conditions, as GROneParser.addReactiveBehavior() does, and return BDDs for each
+        """
+
+        m = self.manager
+        initial = m.true()
+        trans = m.true()
+        justice = []
+
+        for conjunct in conjuncts(spec):
+            if not isTemporal(conjunct):
+                initial = initial & self.toBDD(conjunct)
+            elif conjunct[0] == "always" and not isTemporal(conjunct[1]):
+                trans = trans & self.toBDD(conjunct[1])
+            elif conjunct[0] == "always" and conjunct[1][0] == "eventually" and not isTemporal(conjunct[1][1]):
+                justice.append(self.toBDD(conjunct[1][1], allowNext=False))
+            else:
+                raise SpecificationError("Each conjunct must be an initial condition without temporal operators, " +
+                                         "a transition relation starting with \"[]\", or a liveness condition " +
+                                         "starting with \"[]<>\" and without next.")
+
+        if justice == []:
+            justice.append(m.true())
+
+        return initial, trans, justice
+
+    def toBDD(self, formula, primed=False, allowNext=True):
+        m = self.manager
+        kind = formula[0]
+
+        if kind == "var":
+            name = formula[1]
+            if name not in self.allVarsSet:
+                raise SpecificationError("Unknown variable '%s'" % name)
+            if primed:
+                name += "'"
+            return m.var(name)
+        if kind == "const":
+            return m.true() if formula[1] else m.false()
+        if kind == "not":
+            return ~self.toBDD(formula[1], primed, allowNext)
+        if kind == "next":
+            if primed or not allowNext:
+                raise SpecificationError("next() is not allowed here")
+            return self.toBDD(formula[1], True, allowNext)
+        if kind == "and":
+            result = m.true()
+            for child in formula[1]:
+                result = result & self.toBDD(child, primed, allowNext)
+            return result
+        if kind == "or":
+            result = m.false()
+            for child in formula[1]:
+                result = result | self.toBDD(child, primed, allowNext)
+            return result
+        if kind == "imp":
+            return self.toBDD(formula[1], primed, allowNext).imp(self.toBDD(formula[2], primed, allowNext))
+        if kind == "iff":
+            return self.toBDD(formula[1], primed, allowNext).biimp(self.toBDD(formula[2], primed, allowNext))
+
+        raise SpecificationError("Unexpected temporal operator")
+
+    ### Basic game operations
+
+    def prime(self, b):
+        return b.rename(self.toPrime)
+
+    def unprime(self, b):
+        return b.rename(self.toUnprime)
+
+    def cox(self, to):
+        """
+        Return the states from which the system can force the next state to be in ``to``,
+        for every possible move of the environment (env.yieldStates(sys, to) in JTLV)
+        """
+
+        exy = self.prime(to).andExist(self.sysTrans, self.sysPrime)
+        return ~self.envTrans.andExist(~exy, self.envPrime)
+
+    def coxEnv(self, to):
+        """
+        The dual of cox(), with the roles of the players swapped (sys.yieldStates(env, to) in JTLV)
+        """
+
+        exy = self.prime(to).andExist(self.envTrans, self.envPrime)
+        return ~self.sysTrans.andExist(~exy, self.sysPrime)
+
+    def envSucc(self, state):
+        """ Return the possible next values of the environment variables, from ``state`` """
+        return self.unprime(self.envTrans.andExist(state, self.allUnprime))
+
+    def sysSucc(self, state):
+        """ Return the possible next states allowed by the system transition relation from ``state`` """
+        return self.unprime(self.sysTrans.andExist(state, self.allUnprime))
+
+    ### Solving the game
+
+    def calculateWin(self):
+        """
+        Calculate the system's winning states, remembering the intermediate fixpoint values
+        for use in strategy extraction.  (Cf. GROneGame.calculate_win())
+        """
+
+        m = self.manager
+        envJustNum = len(self.envJustice)
+
+        z = m.true()
+        while True:
+            zStart = z
+            for j, sysJustice in enumerate(self.sysJustice):
+                xMem = [[] for i in range(envJustNum)]
+                yMem = []
+
+                startZ = sysJustice & self.cox(z)
+                y = m.false()
+                while True:
+                    start = startZ | self.cox(y)
+                    yNew = m.false()
+                    for i, envJustice in enumerate(self.envJustice):
+                        negp = ~envJustice
+                        x = z
+                        while True:
+                            self.checkpoint()
+                            xNew = (negp & self.cox(x)) | start
+                            if xNew == x:
+                                break
+                            x = xNew
+                        xMem[i].append(x)
+                        yNew = yNew | x
+                    yMem.append(yNew)
+                    if yNew == y:
+                        break
+                    y = yNew
+
+                z = y
+                self.xMem[j] = xMem
+                self.yMem[j] = yMem
+
+            if z == zStart:
+                break
+
+        return z
+
+    def calculateLoss(self):
+        """
+        Calculate the environment's winning states, remembering the intermediate fixpoint values
+        for use in counterstrategy extraction.  (Cf. GROneGame.calculate_loss())
+        """
+
+        m = self.manager
+
+        self.z2Mem = []
+        self.y2Mem = [[] for j in self.sysJustice]
+        self.x2Mem = [[[] for i in self.envJustice] for j in self.sysJustice]
+
+        z = m.false()
+        while True:
+            zStart = z
+            for j, sysJustice in enumerate(self.sysJustice):
+                startZ = ~sysJustice | ~self.cox(~z)
+                y = m.true()
+                while True:
+                    start = startZ & ~self.cox(~y)
+                    yNew = y
+                    for i, envJustice in enumerate(self.envJustice):
+                        xMem = []
+                        x = m.false()
+                        while True:
+                            self.checkpoint()
+                            xNew = x | ((envJustice | ~self.cox(~x)) & start)
+                            xMem.append(xNew)
+                            if xNew == x:
+                                break
+                            x = xNew
+                        self.x2Mem[j][i][len(self.z2Mem):] = [xMem]
+                        yNew = yNew & x
+                    if yNew == y:
+                        break
+                    y = yNew
+
+                self.y2Mem[j].append(y)
+                z = z | y
+
+            self.z2Mem.append(z)
+            if z == zStart:
+                break
+
+        return z
+
+    def solve(self):
+        """ Calculate the system's winning states """
+
+        self.xMem = [None] * len(self.sysJustice)
+        self.yMem = [None] * len(self.sysJustice)
+        self.winning = self.calculateWin()
+        return self.winning
+
+    ### Extracting automata
+
+    def stateKey(self, assignment):
+        return tuple(assignment.get(v) for v in self.allVars)
+
+    def stateString(self, assignment):
+        """ Format a state as in JTLV: e.g. <person:0, bit0:1> (omitting any unassigned variables) """
+        return "<" + ", ".join("%s:%d" % (v[2:], assignment[v]) for v in self.allVars if v in assignment) + ">"
+
+    def iterStates(self, states, varSet):
+        """ Iterate over the states in the BDD ``states``, as pairs of (assignment, BDD) """
+
+        for assignment in states.iterAssignments(varSet):
+            yield assignment, self.manager.cube(assignment)
+
+    def writeAutomaton(self, f, automaton, formatRank):
+        """
+        Write out a list of [assignment, rank, successors] entries in .aut format
+        (successors are indices into the list)
+        """
+
+        f.write("\n\n")
+        for num, (assignment, rank, succ) in enumerate(automaton):
+            f.write("State %d with rank %s -> %s\n" % (num, formatRank(rank), self.stateString(assignment)))
+            if succ == []:
+                f.write("\tWith no successors.\n")
+            else:
+                f.write("\tWith successors : " + ", ".join(str(s) for s in succ) + "\n")
+        f.write("\n\n")
+
+    def calculateStrategy(self, ini):
+        """
+        Extract a deterministic strategy for the system from the initial states ``ini``, following
+        GROneGame.calculate_strategy() with priority 3 (Z Y X).  Returns the automaton as a list of
+        [assignment, rank, successors] entries, where the rank is the system goal being pursued.
+        """
+
+        m = self.manager
+        sysJustNum = len(self.sysJustice)
+        envJustNum = len(self.envJustice)
+
+        automaton = []
+        index = {}          # (state key, rank) -> index in automaton
+        valuations = set()  # state keys in automaton
+
+        def addState(assignment, rank):
+            key = (self.stateKey(assignment), rank)
+            if key in index:
+                return index[key], False
+            index[key] = len(automaton)
+            valuations.add(key[0])
+            automaton.append([assignment, rank, []])
+            return index[key], True
+
+        for iniAssignment, iniState in self.iterStates(ini, self.allUnprime):
+            if self.stateKey(iniAssignment) in valuations:
+                # This initial state is already in the automaton
+                continue
+
+            stack = [(iniAssignment, iniState, 0)]
+            while stack:
+                self.checkpoint()
+                pAssignment, pState, pj = stack.pop()
+                newIndex, isNew = addState(pAssignment, pj)
+
+                # Find the Y and X indices of the current state
+                pcy = min(r for r, y in enumerate(self.yMem[pj]) if y.evaluate(pAssignment))
+                pi = min(i for i in range(envJustNum) if self.xMem[pj][i][pcy].evaluate(pAssignment))
+
+                currentRegion = pState.exist(self.envUnprime).exist(self.nonRegionProps)
+
+                # For each environment successor, find a strategy successor
+                for envAssignment, envState in self.iterStates(self.envSucc(pState), self.envUnprime):
+                    nextOp = self.unprime((self.sysTrans & self.prime(envState)).andExist(pState, self.allUnprime))
+
+                    candidate = m.false()
+                    jcand = pj
+
+                    # First, try to satisfy the current goal and move on to the next one
+                    if self.sysJustice[pj].evaluate(pAssignment):
+                        nextPj = (pj + 1) % sysJustNum
+
+                        # Skip goals that are trivially satisfied by staying in the same state
+                        while self.sysJustice[nextPj].evaluate(pAssignment) and nextPj != pj:
+                            nextPj = (nextPj + 1) % sysJustNum
+
+                        # Find the lowest-rank reachable state in the direction of the next goal
+                        for y in self.yMem[nextPj]:
+                            opt = nextOp & y
+                            if not opt.isZero():
+                                candidate = opt
+                                jcand = nextPj
+                                break
+
+                        # If possible, prefer not to move
+                        if not (candidate & currentRegion).isZero():
+                            candidate = candidate & currentRegion
+
+                    # Second, try to move closer to the current goal
+                    if candidate.isZero() and pcy > 0:
+                        for r in range(pcy):
+                            opt = nextOp & self.yMem[pj][r]
+                            if not opt.isZero():
+                                candidate = opt
+                                break
+
+                    # Third, try to falsify the environment's liveness condition
+                    if candidate.isZero() and not self.envJustice[pi].evaluate(pAssignment):
+                        candidate = nextOp & self.xMem[pj][pi][pcy]
+
+                    # Finally, just stay in the same level set
+                    if candidate.isZero():
+                        candidate = nextOp & self.yMem[pj][pcy]
+
+                    if candidate.isZero():
+                        raise SpecificationError("No successor was found for state %s" % self.stateString(pAssignment))
+
+                    for succAssignment, succState in self.iterStates(candidate, self.allUnprime):
+                        succIndex, isNew = addState(succAssignment, jcand)
+                        if isNew:
+                            stack.append((succAssignment, succState, jcand))
+                        automaton[newIndex][2].append(succIndex)
+                        break
+
+        return automaton
+
+    def calculateCounterstrategy(self, ini):
+        """
+        Extract a deterministic counterstrategy for the environment from the initial states ``ini``,
+        following GROneGame.calculate_counterstrategy().  Returns the automaton as a list of
+        [assignment, (rank_i, rank_j), successors] entries, where rank_i is the environment goal
+        being pursued and rank_j is the system goal being prevented.
+        """
+
+        m = self.manager
+        envJustNum = len(self.envJustice)
+
+        self.calculateLoss()
+
+        automaton = []
+        index = {}  # (state key, rank) -> index in automaton
+
+        def addState(assignment, rank):
+            key = (self.stateKey(assignment), rank)
+            if key in index:
+                return index[key], False
+            index[key] = len(automaton)
+            automaton.append([assignment, rank, []])
+            return index[key], True
+
+        def firstIndex(bdds, assignment):
+            for k, b in enumerate(bdds):
+                if b.evaluate(assignment):
+                    return k
+            raise SpecificationError("State %s is not winning for the environment" % self.stateString(assignment))
+
+        for iniAssignment, iniState in self.iterStates(ini, self.allUnprime):
+            stack = [(iniAssignment, iniState, 0, -1)]
+            while stack:
+                self.checkpoint()
+                pAssignment, pState, rankI, rankJ = stack.pop()
+                newIndex, isNew = addState(pAssignment, (rankI, rankJ))
+
+                newI, newJ = 0, -1
+
+                # Find the Z, Y and X indices of the current state
+                paz = firstIndex(self.z2Mem, pAssignment)
+                pj = firstIndex([self.y2Mem[j][paz] for j in range(len(self.sysJustice))], pAssignment)
+                pc = firstIndex(self.x2Mem[pj][rankI][paz], pAssignment)
+
+                if paz == 0:
+                    forcedLower = self.coxEnv(m.false())
+                else:
+                    forcedLower = self.coxEnv(self.z2Mem[paz-1])
+
+                move = m.false()
+                for envAssignment, envState in self.iterStates(self.envSucc(pState), self.envUnprime):
+                    primedEnvState = self.prime(envState)
+                    here = pState & primedEnvState
+
+                    # Force a safety violation, or move to a lower Z iterate
+                    move = here & forcedLower
+                    if not move.isZero():
+                        newI, newJ = rankI, -1
+                        break
+
+                    # Stay in this Z iterate, and start preventing system goal pj
+                    if rankJ == -1:
+                        move = here & self.coxEnv(envState & self.y2Mem[pj][paz]) & ~forcedLower
+                        if not move.isZero():
+                            newI, newJ = rankI, pj
+                            break
+
+                    # Satisfy environment goal rankI while preventing system goal pj
+                    if rankJ != -1 and rankI != -1 and self.envJustice[rankI].evaluate(pAssignment):
+                        move = here & self.coxEnv(envState & self.y2Mem[pj][paz]) & ~forcedLower
+                        if not move.isZero():
+                            newI, newJ = (rankI + 1) % envJustNum, pj
+                            break
+
+                    # Move towards environment goal rankI while preventing system goal rankJ
+                    if rankI != -1 and rankJ != -1:
+                        xs = self.x2Mem[rankJ][rankI][paz]
+                        if pc == 0:
+                            target = ~self.sysJustice[rankJ] & envState & self.envJustice[rankI] & xs[0]
+                        else:
+                            target = ~self.sysJustice[rankJ] & envState & xs[min(pc, len(xs)) - 1]
+                        move = here & self.coxEnv(target) & ~forcedLower
+                        if not move.isZero():
+                            newI, newJ = rankI, rankJ
+                            break
+
+                if move.isZero():
+                    # (JTLV gives up at this point.)  This happens when the state is only in this Y iterate
+                    # because the environment can force its way into the part of the Z iterate found for an
+                    # earlier system goal, so head there instead -- or failing that, just stay within the
+                    # environment's winning states -- and then choose a system goal to prevent afresh.
+                    earlier = m.false()
+                    if paz > 0:
+                        earlier = self.z2Mem[paz-1]
+                    for j in range(pj):
+                        earlier = earlier | self.y2Mem[j][paz]
+
+                    for target in [earlier, self.z2Mem[-1]]:
+                        for envAssignment, envState in self.iterStates(self.envSucc(pState), self.envUnprime):
+                            move = pState & self.prime(envState) & self.coxEnv(envState & target)
+                            if not move.isZero():
+                                break
+                        if not move.isZero():
+                            break
+                    newI, newJ = rankI, -1
+
+                if move.isZero():
+                    raise SpecificationError("No successor was found for state %s" % self.stateString(pAssignment))
+
+                # Add the system's possible responses to the chosen environment move
+                inputAssignment, inputState = self.iterStates(move, self.envPrime).next()
+                input = self.unprime(inputState)
+                unprimedInput = dict((v[:-1], val) for v, val in inputAssignment.iteritems())
+
+                sysSuccs = self.sysSucc(pState & inputState)
+                if sysSuccs.isZero():
+                    # The system has no legal move, so this is a dead end
+                    succIndex, isNew = addState(unprimedInput, (newI, newJ))
+                    automaton[newIndex][2].append(succIndex)
+                    continue
+
+                for succAssignment, succState in self.iterStates(sysSuccs & input, self.allUnprime):
+                    # Make sure this is a safe successor state
+                    if (succState & self.sysTrans).isZero():
+                        continue
+                    succIndex, isNew = addState(succAssignment, (newI, newJ))
+                    if isNew:
+                        stack.append((succAssignment, succState, newI, newJ))
+                    automaton[newIndex][2].append(succIndex)
+
+        return automaton
+
+    def calculateSafetyAutomaton(self, ini):
+        """
+        Return an automaton of all the moves allowed by the system's transition relation
+        from the initial states ``ini``, as in GROneGame.generate_safety_aut()
+        """
+
+        automaton = []
+        index = {}  # state key -> index in automaton
+
+        def addState(assignment):
+            key = self.stateKey(assignment)
+            if key in index:
+                return index[key], False
+            index[key] = len(automaton)
+            automaton.append([assignment, 0, []])
+            return index[key], True
+
+        for iniAssignment, iniState in self.iterStates(ini, self.allUnprime):
+            if self.stateKey(iniAssignment) in index:
+                continue
+
+            stack = [(iniAssignment, iniState)]
+            while stack:
+                self.checkpoint()
+                pAssignment, pState = stack.pop()
+                newIndex, isNew = addState(pAssignment)
+
+                for succAssignment, succState in self.iterStates(self.sysSucc(pState), self.allUnprime):
+                    succIndex, isNew = addState(succAssignment)
+                    if isNew:
+                        stack.append((succAssignment, succState))
+                    automaton[newIndex][2].append(succIndex)
+
+        return automaton
+
+def newManager(envVars, sysVars):
+    """
+    Create a BDD manager with variables for the given environment and system propositions,
+    with each primed (next-state) variable placed right after its unprimed version
+    """
+
+    m = BDDManager()
+    for v in ["e." + v for v in envVars] + ["s." + v for v in sysVars]:
+        m.addVar(v)
+        m.addVar(v + "'")
+    return m
+
+def managerVariables(envVars, sysVars):
+    """ Return the variable order newManager() would use, for checking whether a manager can be reused """
+
+    names = []
+    for v in ["e." + v for v in envVars] + ["s." + v for v in sysVars]:
+        names.extend([v, v + "'"])
+    return names
+
+def synthesize(smvFile, ltlFile, autFile, safetyAutFile=None, manager=None, out=sys.stdout, checkpoint=None):
+    """
+    Synthesize an automaton from ``smvFile`` and ``ltlFile``, and write it to ``autFile``.
+    If the specification is unrealizable, a counterstrategy is written there instead.
+    If ``safetyAutFile`` is given, an automaton of all the moves allowed by the system's
+    transition relation is written to it as well.
+
+    Progress messages (in the same style as JTLV's) are written to ``out``.
+    ``checkpoint`` is called regularly, and can stop synthesis by raising an exception;
+    no output files are left half-written if it does.
+    Returns True if the specification is realizable.
+    """
+
+    envVars, sysVars = parseSMVFile(smvFile)
+    assumptions, guarantees = parseLTLFile(ltlFile)
+
+    if manager is not None and manager.varNames != managerVariables(envVars, sysVars):
+        manager = None
+
+    out.write("==== Constructing and playing the game ======\n")
+    startTime = time.time()
+
+    game = GROneGame(envVars, sysVars, assumptions, guarantees, manager, checkpoint)
+    game.solve()
+    out.write("Games time: %d\n" % (1000*(time.time() - startTime)))
+
+    allInit = game.sysInit & game.envInit
+
+    if safetyAutFile is not None:
+        out.write("Exporting safety constraints automaton...\n")
+        automaton = game.calculateSafetyAutomaton(allInit)
+        f = open(safetyAutFile, "w")
+        game.writeAutomaton(f, automaton, str)
+        f.close()
+
+    # Check that every initial system state is winning for every initial environment state
+    counterexample = allInit & ~game.winning
+    if not counterexample.isZero():
+        out.write("Specification is unsynthesizable even assuming instantaneous actions...\n")
+        out.write("The env player can win from states:\n")
+        for assignment in counterexample.iterAssignments(game.allUnprime):
+            out.write("\t" + game.stateString(assignment) + "\n")
+        out.write("==== Computing counterstrategy =========\n")
+        out.write("-----------------------------------------\n")
+        automaton = game.calculateCounterstrategy(counterexample)
+        f = open(autFile, "w")
+        game.writeAutomaton(f, automaton, lambda r: "(%d,%d)" % r)
+        f.close()
+        out.write("-----------------------------------------\n")
+        out.write("Strategy time: %d\n" % (1000*(time.time() - startTime)))
+        out.write("===== Done ==============================\n")
+        return False
+
+    out.write("Specification is realizable assuming instantaneous actions...\n")
+    out.write("==== Building an implementation =========\n")
+    out.write("-----------------------------------------\n")
+    automaton = game.calculateStrategy(allInit)
+    f = open(autFile, "w")
+    game.writeAutomaton(f, automaton, str)
+    f.close()
+    out.write("-----------------------------------------\n")
+    out.write("Strategy time: %d\n" % (1000*(time.time() - startTime)))
+    out.write("===== Done ==============================\n")
+    return True
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print "Usage: %s <smv_file> <ltl_file> [--safety]" % sys.argv[0]
+        sys.exit(1)
+
+    autFile = re.sub(r"\.[^\.]+$", ".aut", sys.argv[2])
+    safetyAutFile = None
+    if "--safety" in sys.argv[3:]:
+        safetyAutFile = re.sub(r"\.[^\.]+$", "_safety.aut", sys.argv[2])
+
+    if synthesize(sys.argv[1], sys.argv[2], autFile, safetyAutFile):
+        sys.exit(0)
+    else:
+        sys.exit(1)
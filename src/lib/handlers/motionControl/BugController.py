@@ -641,14 +641,10 @@ class motionControlHandler:
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    #print "I think I'm in " + r.name
-                    #print pose
-                    break
+            r = self.rfi.locate([pose[0:2]], self.coordmap_map2lab)[0]
+            #if r is not None:
+            #    print "I think I'm in " + self.rfi.regions[r].name
+            #    print pose
             self.last_warning = time.time()
 
         return arrived
@@ -5,10 +5,46 @@ is_inside.py - Polygon/Point Test Python Function
 =================================================
     
 A Python implementation of the ray to infinity even-odd test to determin if a point is inside the specified polygon.
+
+The test is vectorized with numpy, so many points can be checked against one polygon (``is_inside_many``),
+or one point against many polygons (``is_inside_polys``), in a single call.
 """
 
 from numpy import *
 
+def _edges(vert):
+    """
+    Returns the start and end coordinates (x0, y0, x1, y1) of each edge of the polygon
+    with vertices ``vert`` (a (2,N) array), as flat float arrays
+    """
+
+    vert = asarray(vert, dtype=float)
+    x0 = vert[0]
+    y0 = vert[1]
+    x1 = roll(x0, -1)
+    y1 = roll(y0, -1)
+
+    return x0, y0, x1, y1
+
+def _crossings(x, y, x0, y0, x1, y1):
+    """
+    Returns a boolean array indicating which edges are crossed by the horizontal ray
+    starting at each (x, y) and going to +inf in x.  The point coordinates and the edge
+    coordinates are broadcast against each other.
+    """
+
+    # Skip edges with both verts to the left of the ray, with both verts on the same side
+    # of the ray, or that are horizontal (another horz line can't intersect them)
+    candidate = ~((x0 < x) & (x1 < x)) & \
+                ~(((y0 < y) & (y1 < y)) | ((y0 > y) & (y1 > y))) & \
+                (y0 != y1)
+
+    # compute x intersection value (horizontal edges have already been excluded above)
+    dy = where(y0 != y1, y1 - y0, 1.0)
+    xisect = x0 + (x1 - x0)*((y - y0)/dy)
+
+    return candidate & (xisect >= x)
+
 def is_inside(p, vert):
     """
     This function tests whether the point p is inside the specified shape.
@@ -22,25 +58,49 @@ def is_inside(p, vert):
     Uses the 'ray to infinity' even-odd test.
     Let the ray be the horizontal ray starting at p and going to +inf in x.
     """
-    
-    V = hstack((vert, [[vert[0,0]],[vert[1,0]]]))
-
-    inside = False
-    x,y=p[0],p[1]
-    for i in range(V.shape[1]-1):
-        v0 = V[:, i]
-        v1 = V[:, i+1]
-        # Check if both verts to the left of ray
-        if v0[0]<x and v1[0]<x:
-            continue
-        # check if both on the same side of ray
-        if (v0[1]<y and v1[1]<y) or (v0[1]>y and v1[1]>y):
-            continue
-        #check for horizontal line - another horz line can't intersect it
-        if (v0[1]==v1[1]):
-            continue
-        # compute x intersection value
-        xisect = v0[0] + (v1[0]-v0[0])*((y-v0[1])/(v1[1]-v0[1]))
-        if xisect >= x:
-            inside = not inside
-    return inside
+
+    x0, y0, x1, y1 = _edges(vert)
+
+    return bool(count_nonzero(_crossings(float(p[0]), float(p[1]), x0, y0, x1, y1)) % 2)
+
+def is_inside_many(points, vert):
+    """
+    Test many points against one polygon.
+    Arguments:
+    	points - sequence of 2d points (or an (M,2) array)
+    	vert - (2,N) array of points difining the polygon
+
+    Returns:
+    - Boolean array of length M, True for each point that is inside the polygon.
+    """
+
+    points = asarray(points, dtype=float).reshape(-1, 2)
+    x0, y0, x1, y1 = _edges(vert)
+
+    # Points along the first axis, edges along the second
+    hits = _crossings(points[:, 0:1], points[:, 1:2], x0, y0, x1, y1)
+
+    return (hits.sum(axis=1) % 2) == 1
+
+def is_inside_polys(p, verts):
+    """
+    Test one point against many polygons.
+    Arguments:
+    	p - the 2d point
+    	verts - list of (2,N) arrays of points, each defining one polygon
+
+    Returns:
+    - Boolean array with one entry per polygon, True for each polygon that contains the point.
+    """
+
+    if len(verts) == 0:
+        return zeros(0, dtype=bool)
+
+    # Put all the edges of all the polygons together, and keep track of which is which
+    edges = [_edges(v) for v in verts]
+    x0, y0, x1, y1 = [concatenate(e) for e in zip(*edges)]
+    owner = repeat(arange(len(verts)), [len(e[0]) for e in edges])
+
+    hits = _crossings(float(p[0]), float(p[1]), x0, y0, x1, y1)
+
+    return (bincount(owner[hits], minlength=len(verts)) % 2) == 1
@@ -33,9 +33,7 @@ class motionControlHandler:
         pose = self.pose_handler.getPose()
 
         # NOTE: Information about region geometry can be found in self.rfi.regions:
-        pointArray = [x for x in self.rfi.regions[current_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
+        vertices = self.rfi.getRegionVertices(current_reg, self.coordmap_map2lab)
 
         # TODO: Calculate a velocity vector in the *GLOBAL REFERENCE FRAME* 
         # that will get us on our way to the next region
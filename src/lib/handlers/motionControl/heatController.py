@@ -43,9 +43,8 @@ class motionControlHandler:
 
         self.drive_handler.setVelocity(X[0,0], X[1,0], pose[2])
         
-        # Transform the region vertices into real coordinates
-        pointArray = [self.fwd_coordmap(x) for x in self.rfi.regions[next_reg].getPoints()]
-        vertices = mat(pointArray).T 
+        # Get the region vertices in real coordinates
+        vertices = self.rfi.getRegionVertices(next_reg, self.fwd_coordmap)
 
         # Figure out whether we've reached the destination region
         if is_inside([pose[0], pose[1]], vertices):
@@ -56,14 +55,10 @@ class motionControlHandler:
         if (arrived != (not inside)) and (time.time()-self.last_warning) > 0.5:
             print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.fwd_coordmap(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T 
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.rfi.locate([pose[0:2]], self.fwd_coordmap)[0]
+            if r is not None:
+                print "I think I'm in " + self.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         return arrived
@@ -90,31 +85,13 @@ class motionControlHandler:
             transFace = None
         else:
             # Find a face to go through
-            # TODO: Account for non-determinacy?
-            # For now, let's just choose the largest face available, because we are probably using a big clunky robot
-            max_magsq = 0
-            for tf in self.rfi.transitions[current][next]:
-                magsq = (tf[0].x - tf[1].x)**2 + (tf[0].y - tf[1].y)**2
-                if magsq > max_magsq:
-                    pt1, pt2 = tf
-                    max_magsq = magsq
-            
-            transFace = None
-            # Find the index of this face
-            # TODO: Why don't we just store this as the index?
-            for i, face in enumerate([x for x in self.rfi.regions[current].getFaces()]):
-                # Account for both face orientations...
-                if (pt1 == face[0] and pt2 == face[1]) or (pt1 == face[1] and pt2 == face[0]):
-                    transFace = i
-                    break
-            
+            transFace = self.rfi.getExitFaceIndex(current, next)
+
             if transFace is None:
                 print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current].name, self.rfi.regions[next].name)
          
-        # Transform the region vertices into real coordinates
-        pointArray = [x for x in self.rfi.regions[current].getPoints()]
-        pointArray = map(self.fwd_coordmap, pointArray)
-        vertices = mat(pointArray).T 
+        # Get the region vertices in real coordinates
+        vertices = self.rfi.getRegionVertices(current, self.fwd_coordmap)
         
         # Get a controller function
         controller = heatControllerHelper.getController(vertices, transFace, last)
@@ -50,33 +50,16 @@ class motionControlHandler:
             time.sleep(1)
             return False
 
-        # NOTE: Information about region geometry can be found in self.rfi.regions:
-        pointArray = [x for x in self.rfi.regions[current_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
+        # NOTE: Information about region geometry can be found in self.rfi.regions
+        # (the lab-frame vertices are cached by the rfi, so we don't need to re-map them every time)
+        vertices = self.rfi.getRegionVertices(current_reg, self.coordmap_map2lab)
 
         if last:
             transFace = None
         else:
             # Find a face to go through
-            # TODO: Account for non-determinacy?
-            # For now, let's just choose the largest face available, because we are probably using a big clunky robot
-            max_magsq = 0
-            for tf in self.rfi.transitions[current_reg][next_reg]:
-                magsq = (tf[0].x - tf[1].x)**2 + (tf[0].y - tf[1].y)**2
-                if magsq > max_magsq:
-                    pt1, pt2 = tf
-                    max_magsq = magsq
-            
-            transFace = None
-            # Find the index of this face
-            # TODO: Why don't we just store this as the index?
-            for i, face in enumerate([x for x in self.rfi.regions[current_reg].getFaces()]):
-                # Account for both face orientations...
-                if (pt1 == face[0] and pt2 == face[1]) or (pt1 == face[1] and pt2 == face[0]):
-                    transFace = i
-                    break
-            
+            transFace = self.rfi.getExitFaceIndex(current_reg, next_reg)
+
             if transFace is None:
                 print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current_reg].name, self.rfi.regions[next_reg].name)
          
@@ -87,24 +70,19 @@ class motionControlHandler:
         # Pass this desired velocity on to the drive handler
         self.drive_handler.setVelocity(V[0], V[1], pose[2])
         
-        departed = not is_inside([pose[0], pose[1]], vertices)
-        pointArray = [x for x in self.rfi.regions[next_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T 
-        # Figure out whether we've reached the destination region
-        arrived = is_inside([pose[0], pose[1]], vertices)
+        # Figure out whether we've left the current region and reached the destination region
+        next_vertices = self.rfi.getRegionVertices(next_reg, self.coordmap_map2lab)
+        inside = is_inside_polys([pose[0], pose[1]], [vertices, next_vertices])
+        departed = not inside[0]
+        arrived = bool(inside[1])
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             #print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T 
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    #print "I think I'm in " + r.name
-                    #print pose
-                    break
+            r = self.rfi.locate([pose[0:2]], self.coordmap_map2lab)[0]
+            #if r is not None:
+            #    print "I think I'm in " + self.rfi.regions[r].name
+            #    print pose
             self.last_warning = time.time()
 
         return arrived
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+""" =================================================
+    ltlFormula.py - Shared trees for LTL subformulas
+    =================================================
+
+    Classes for building LTL formulas as trees rather than strings.  Nodes are
+    hash-consed: creating a node identical to one that already exists returns the
+    existing one, so common subterms (e.g. the literals that make up the bit
+    encodings of thousands of regions) are only stored once.
+
+    Formulas are written out in the syntax used in the JTLV .ltl files, either with
+    str() or, for large formulas, streamed straight to a file with write().
+"""
+
+import weakref
+from cStringIO import StringIO
+
+class Formula(object):
+    """
+    Base class for all formula nodes.  Don't instantiate this directly.
+
+    Nodes are immutable, and equal nodes are the same object, so they can be
+    compared with ``is`` and used as dictionary keys cheaply.
+    """
+
+    __slots__ = ['args', '__weakref__']
+
+    # All the nodes that currently exist, keyed by their type and arguments
+    _nodes = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args):
+        key = (cls,) + args
+        node = Formula._nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node.args = args
+            Formula._nodes[key] = node
+        return node
+
+    def write(self, out):
+        """
+        Write the formula to the file-like object ``out``
+        """
+        raise NotImplementedError
+
+    def __str__(self):
+        out = StringIO()
+        self.write(out)
+        return out.getvalue()
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, str(self))
+
+class Prop(Formula):
+    """ A proposition, e.g. Prop("s.bit0") """
+    __slots__ = []
+
+    def write(self, out):
+        out.write(self.args[0])
+
+class Not(Formula):
+    """ !f """
+    __slots__ = []
+
+    def write(self, out):
+        out.write("!")
+        self.args[0].write(out)
+
+class Next(Formula):
+    """ next(f) """
+    __slots__ = []
+
+    def write(self, out):
+        out.write("next(")
+        self.args[0].write(out)
+        out.write(")")
+
+class _Junction(Formula):
+    """ Base class for parenthesized conjunctions and disjunctions of any number of subformulas """
+    __slots__ = []
+    operator = None
+
+    def write(self, out):
+        out.write("(")
+        for i, f in enumerate(self.args):
+            if i > 0:
+                out.write(self.operator)
+            f.write(out)
+        out.write(")")
+
+class And(_Junction):
+    """ (f1 & f2 & ...) """
+    __slots__ = []
+    operator = " & "
+
+class Or(_Junction):
+    """ (f1 | f2 | ...) """
+    __slots__ = []
+    operator = " | "
+
+class Constant(Formula):
+    """ TRUE or FALSE """
+    __slots__ = []
+
+    def write(self, out):
+        out.write(self.args[0])
+
+TRUE = Constant("TRUE")
+FALSE = Constant("FALSE")
+
+def conjoin(f1, f2):
+    """
+    Return (f1 & f2), simplifying away constants and flattening nested conjunctions
+    """
+    if f1 is FALSE or f2 is FALSE:
+        return FALSE
+    if f1 is TRUE:
+        return f2
+    if f2 is TRUE:
+        return f1
+
+    args = []
+    for f in [f1, f2]:
+        if isinstance(f, And):
+            args.extend(f.args)
+        else:
+            args.append(f)
+    return And(*args)
+
+def ifThenElse(cond, f1, f0):
+    """
+    Return a formula equivalent to ((cond & f1) | (!cond & f0)), simplifying where possible
+    """
+    if f1 is f0:
+        return f1
+    if f0 is FALSE:
+        return conjoin(cond, f1)
+    if f1 is FALSE:
+        return conjoin(Not(cond), f0)
+    if f1 is TRUE:
+        return Or(cond, f0)
+    if f0 is TRUE:
+        return Or(Not(cond), f1)
+    return Or(conjoin(Not(cond), f0), conjoin(cond, f1))
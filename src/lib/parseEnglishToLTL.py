@@ -9,14 +9,28 @@
 import re
 import copy
 import numpy
+from ltlFormula import Prop, Not, Next, And
 
 #nextify = lambda x: " next(%s) " % x
 
+# A single identifier (i.e. what "\\b...\\b" around a proposition name will match)
+r_word = re.compile('\\w+')
+r_nextWord = re.compile('next\\((\\w+)\\)')
+
+def replaceWords(text, replacements):
+    ''' Replace every whole word in text that is a key of the dictionary
+        replacements with the corresponding value, in a single pass.
+        This is equivalent to (but much faster than) calling
+        re.sub("\\b"+word+"\\b", replacement, text) for each word.
+    '''
+    return r_word.sub(lambda m: replacements.get(m.group(0), m.group(0)), text)
+
+r_parens = re.compile('^\s*\((?P<inside>.*)\)\s*$',re.IGNORECASE)
+r_logic = re.compile('^(?P<left>.*) (?P<op>(or|and|\||\&)) (?P<right>.*)$',re.IGNORECASE)
+
 def nextify(p):
     # Recursive function for aggressively applying the next operator
 
-    r_parens = re.compile('^\s*\((?P<inside>.*)\)\s*$',re.IGNORECASE)
-    r_logic = re.compile('^(?P<left>.*) (?P<op>(or|and|\||\&)) (?P<right>.*)$',re.IGNORECASE)
     m_parens = r_parens.search(p)
     m_logic = r_logic.search(p)
 
@@ -44,21 +58,26 @@ def writeSpec(text, sensorList, regionList, robotPropList):
     robotPropList = copy.deepcopy(robotPropList)
 
     # Prepend "e." or "s." to propositions for JTLV
-    for i, sensor in enumerate(sensorList):
-        text = re.sub("\\b"+sensor+"\\b", "e." + sensor, text)
-        sensorList[i] = "e." + sensorList[i]
+    # (All in one pass over the text; only names that aren't simple identifiers need their own)
+    prefixes = {}
+    for prefix, propList in [("e.", sensorList), ("s.", robotPropList)]:
+        for i, prop in enumerate(propList):
+            if re.match('\\w+$', prop):
+                prefixes.setdefault(prop, prefix + prop)
+            else:
+                text = re.sub("\\b"+prop+"\\b", prefix + prop, text)
+            propList[i] = prefix + propList[i]
 
-    for i, prop in enumerate(robotPropList):
-        text = re.sub("\\b"+prop+"\\b", "s." + prop, text)
-        robotPropList[i] = "s." + robotPropList[i]
+    text = replaceWords(text, prefixes)
 
     # initializing the dictionary
+    # (each subformula is built up as a list of pieces, which are joined together at the end)
     spec = {}
-    spec['EnvInit']= ''
-    spec['EnvTrans']= ''
-    spec['EnvGoals']= ''
-    spec['SysTrans']= ''
-    spec['SysGoals']= ''
+    spec['EnvInit']= []
+    spec['EnvTrans']= []
+    spec['EnvGoals']= []
+    spec['SysTrans']= []
+    spec['SysGoals']= []
 
 
     linemap = {}
@@ -86,10 +105,10 @@ def writeSpec(text, sensorList, regionList, robotPropList):
     #  region encoding. This may be redundent if an initial region is
     #  specified, but it is here to ensure the system cannot start from
     #  an invalid encoding
-    spec['SysInit']= '\t\t\t( ' + currBitEnc[0] + ' \n'
+    spec['SysInit']= ['\t\t\t( ' + currBitEnc[0] + ' \n']
     for regionInd in range(1,len(regionList)):
-        spec['SysInit'] = spec['SysInit'] + '\t\t\t\t | ' + currBitEnc[regionInd] + '\n'
-    spec['SysInit'] = spec['SysInit'] + '\t\t\t) & \n'
+        spec['SysInit'].append('\t\t\t\t | ' + currBitEnc[regionInd] + '\n')
+    spec['SysInit'].append('\t\t\t) & \n')
     
 
     # Regular expressions to help us out
@@ -213,7 +232,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                 failed = True
                 continue
 
-            spec['EnvInit']= spec['EnvInit'] + LTLsubformula
+            spec['EnvInit'].append(LTLsubformula)
             linemap['EnvInit'].append(lineInd)
             
         # If the sentence describes the initial state of the robot
@@ -257,7 +276,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
             elif QuantifierFlag == "ALL":
                 LTLRegSubformula = LTLRegSubformula.replace("QUANTIFIER_PLACEHOLDER", quant_and_string['current'])
 
-            spec['SysInit']= spec['SysInit'] + LTLRegSubformula + LTLActSubformula
+            spec['SysInit'].append(LTLRegSubformula + LTLActSubformula)
             linemap['SysInit'].append(lineInd)
 
 
@@ -339,7 +358,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                     CondFormulaInfo['type'] = 'SysTrans'
                     if CondFormulaInfo['formula'] == '': failed = True
 
-                    spec[CondFormulaInfo['type']] = spec[CondFormulaInfo['type']] + CondFormulaInfo['formula']
+                    spec[CondFormulaInfo['type']].append(CondFormulaInfo['formula'])
                     linemap[CondFormulaInfo['type']].append(lineInd)
                 else:
                     # parse requirement normally
@@ -384,7 +403,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                 # Parse the condition and add it to the requirement
                 CondFormulaInfo = parseConditional(Condition,ReqFormulaInfo,CondType,sensorList,allRobotProp,lineInd)
                 if CondFormulaInfo['formula'] == '': failed = True
-                spec[CondFormulaInfo['type']] = spec[CondFormulaInfo['type']] + CondFormulaInfo['formula']
+                spec[CondFormulaInfo['type']].append(CondFormulaInfo['formula'])
                 linemap[CondFormulaInfo['type']].append(lineInd)
             elif QuantifierFlag == "ALL":
                 for r in RegionGroups[quant_group]:
@@ -394,13 +413,13 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                     # Parse the condition and add it to the requirement
                     CondFormulaInfo = parseConditional(Condition,tmp_req,CondType,sensorList,allRobotProp,lineInd)
                     if CondFormulaInfo['formula'] == '': failed = True
-                    spec[CondFormulaInfo['type']] = spec[CondFormulaInfo['type']] + CondFormulaInfo['formula']
+                    spec[CondFormulaInfo['type']].append(CondFormulaInfo['formula'])
                     linemap[CondFormulaInfo['type']].append(lineInd)
             else:
                 # Parse the condition and add it to the requirement
                 CondFormulaInfo = parseConditional(Condition,ReqFormulaInfo,CondType,sensorList,allRobotProp,lineInd)
                 if CondFormulaInfo['formula'] == '': failed = True
-                spec[CondFormulaInfo['type']] = spec[CondFormulaInfo['type']] + CondFormulaInfo['formula']
+                spec[CondFormulaInfo['type']].append(CondFormulaInfo['formula'])
                 linemap[CondFormulaInfo['type']].append(lineInd)
 
         # An event definition
@@ -424,7 +443,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                 EventFormula = EventFormula.replace("next(QUANTIFIER_PLACEHOLDER)", quant_and_string['next'])
                 EventFormula = EventFormula.replace("QUANTIFIER_PLACEHOLDER", quant_and_string['current'])
 
-            spec['SysTrans'] = spec['SysTrans'] + EventFormula
+            spec['SysTrans'].append(EventFormula)
             linemap['SysTrans'].append(lineInd)
 
 
@@ -447,7 +466,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                 EventFormula = EventFormula.replace("next(QUANTIFIER_PLACEHOLDER)", quant_and_string['next'])
                 EventFormula = EventFormula.replace("QUANTIFIER_PLACEHOLDER", quant_and_string['current'])
 
-            spec['SysTrans'] = spec['SysTrans'] + EventFormula
+            spec['SysTrans'].append(EventFormula)
             linemap['SysTrans'].append(lineInd)
 
         # A 'Go to and stay there' requirement
@@ -478,7 +497,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                 continue
 
             # Add the liveness ('go to') to the spec
-            spec[formulaInfo['type']] = spec[formulaInfo['type']] + formulaInfo['formula']
+            spec[formulaInfo['type']].append(formulaInfo['formula'])
             linemap[formulaInfo['type']].append(lineInd)
 
 
@@ -487,7 +506,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
             regCond = regCond.replace('& \n','')
             condStayFormula = '\t\t\t [](' + regCond + ' -> ' + StayFormula + ') & \n'
 
-            spec['SysTrans'] = spec['SysTrans'] + condStayFormula
+            spec['SysTrans'].append(condStayFormula)
             linemap['SysTrans'].append(lineInd)
 
 
@@ -505,16 +524,16 @@ def writeSpec(text, sensorList, regionList, robotPropList):
             if QuantifierFlag == "ANY":
                 formulaInfo['formula'] = formulaInfo['formula'].replace("QUANTIFIER_PLACEHOLDER", quant_or_string['current'])
 
-                spec[formulaInfo['type']] = spec[formulaInfo['type']] + formulaInfo['formula']
+                spec[formulaInfo['type']].append(formulaInfo['formula'])
                 linemap[formulaInfo['type']].append(lineInd)
             elif QuantifierFlag == "ALL":
                 for r in RegionGroups[quant_group]:
                     tmp_req = copy.deepcopy(formulaInfo)
                     tmp_req['formula'] = tmp_req['formula'].replace("QUANTIFIER_PLACEHOLDER", r)
-                    spec[tmp_req['type']] = spec[tmp_req['type']] + tmp_req['formula']
+                    spec[tmp_req['type']].append(tmp_req['formula'])
                     linemap[tmp_req['type']].append(lineInd)
             else:
-                spec[formulaInfo['type']] = spec[formulaInfo['type']] + formulaInfo['formula']
+                spec[formulaInfo['type']].append(formulaInfo['formula'])
                 linemap[formulaInfo['type']].append(lineInd)
 
         # A safety requirement
@@ -539,10 +558,10 @@ def writeSpec(text, sensorList, regionList, robotPropList):
                     tmp_req = copy.deepcopy(formulaInfo)
                     tmp_req['formula'] = tmp_req['formula'].replace("next(QUANTIFIER_PLACEHOLDER)", nextify(r))
                     tmp_req['formula'] = tmp_req['formula'].replace("QUANTIFIER_PLACEHOLDER", r)
-                    spec[tmp_req['type']] = spec[tmp_req['type']] + tmp_req['formula']
+                    spec[tmp_req['type']].append(tmp_req['formula'])
                     linemap[tmp_req['type']].append(lineInd)
             else:
-                spec[formulaInfo['type']] = spec[formulaInfo['type']] + formulaInfo['formula']
+                spec[formulaInfo['type']].append(formulaInfo['formula'])
                 linemap[formulaInfo['type']].append(lineInd)
 
             
@@ -583,7 +602,7 @@ def writeSpec(text, sensorList, regionList, robotPropList):
 
     # replace all region names with the bit encoding
     for key in spec:
-        spec[key] = replaceRegionName(spec[key],bitEncode,regionList)
+        spec[key] = replaceRegionName(''.join(spec[key]),bitEncode,regionList)
         
     
     # Setting all empty subformulas to TRUE, and removing last & in 'EnvGoals' and 'SysGoals'
@@ -1126,28 +1145,23 @@ def replaceRegionName(formula,bitEncode,regionList):
     ''' This function replaces the region names with the appropriate bit encoding.
     '''
     tempFormula = formula[:]
-    
+
+    # index of each region name (the first one, if there are duplicates)
+    regionIndex = {}
+    for ind, prop in enumerate(regionList):
+        regionIndex.setdefault(prop, ind)
+
     # first replace all 'next' region names with the next encoding
-    for nextProp in re.findall('(next\(\w+\))',tempFormula):
-        prop = nextProp.replace('next(','')
-        prop = prop.replace(')','')
-
-        if prop in regionList:
-            ind = regionList.index(prop)
-            tempFormula = tempFormula.replace(nextProp, bitEncode['next'][ind])
-            # 'replace' is fine here because we are replacing next(region) and that cannot be a partial name
+    def replaceNext(m):
+        if m.group(1) in regionIndex:
+            return bitEncode['next'][regionIndex[m.group(1)]]
+        return m.group(0)
+    tempFormula = r_nextWord.sub(replaceNext, tempFormula)
                
     # replace all leftover region names with the current encoding
-    for prop in re.findall('(\w+)',tempFormula):
-        if prop in regionList:
-            ind = regionList.index(prop)
-            # replace every occurrence of the proposition with the bit encoding
-            # it is written this way to prevent partial word replacements (as with the .replace method)
-            #tempFormula = re.sub('\s+'+prop, ' '+bitEncode['current'][ind],tempFormula) # if following a space
-            #tempFormula = re.sub('\('+prop, '('+bitEncode['current'][ind],tempFormula) # if in ()
-            tempFormula = re.sub('\\b'+prop+'\\b', bitEncode['current'][ind],tempFormula)
-
-            #tempFormula = tempFormula.replace(prop, bitEncode['current'][ind])
+    # (only whole words, to prevent partial word replacements)
+    current = dict([(prop, bitEncode['current'][ind]) for prop, ind in regionIndex.iteritems()])
+    tempFormula = replaceWords(tempFormula, current)
     
     LTLsubformula = tempFormula 
 
@@ -1174,40 +1188,33 @@ def bitEncoding(numRegions,numBits):
         and 'next' as keys, each containing a list of the respective encodings.
     '''
 
-    # initializing the dictionary
-    bitEncode = {}
+    bitEncode = bitEncodingFormulas(numRegions,numBits)
+
+    return {'current': [str(f) for f in bitEncode['current']],
+            'next': [str(f) for f in bitEncode['next']]}
+
+def bitEncodingFormulas(numRegions,numBits):
+    ''' Same as bitEncoding(), but the encodings are returned as ltlFormula trees
+        rather than strings.  All the encodings share the same literal nodes.
+    '''
+
+    # the literals: the value of each bit, now and next
+    bits = [Prop('s.bit' + str(bitNum)) for bitNum in range(numBits)]
+    currLiterals = [(Not(b), b) for b in bits]
+    nextLiterals = [(Not(Next(b)), Next(b)) for b in bits]
 
     # create an encoding of the regions, both current and next
+    # regions encoding start with 0, with the most significant bit as bit0
     currBitEnc = []
     nextBitEnc = []
     for num in range(numRegions):
-        binary = numpy.binary_repr(num) # regions encoding start with 0
-        # Adding zeros
-        bitString = '0'*(numBits-len(binary)) + binary
-
-        # Encoding the string
-        currTempString = '('
-        nextTempString = '('
-        for bitNum in range(numBits):
-            if bitNum>0:
-                currTempString = currTempString + ' & '
-                nextTempString = nextTempString + ' & '
-            if bitString[bitNum]=='1':
-                currTempString = currTempString + 's.bit' + str(bitNum)
-                nextTempString = nextTempString + 'next(s.bit' + str(bitNum) + ')'
-            if bitString[bitNum]=='0':
-                currTempString = currTempString + '!s.bit' + str(bitNum)
-                nextTempString = nextTempString + '!next(s.bit' + str(bitNum) + ')'
-
-        currTempString = currTempString + ')'
-        nextTempString = nextTempString + ')'
-       
-        currBitEnc.append(currTempString)
-        nextBitEnc.append(nextTempString)
-
+        bitString = [(num >> (numBits-1-bitNum)) & 1 for bitNum in range(numBits)]
+        currBitEnc.append(And(*[currLiterals[bitNum][bit] for bitNum, bit in enumerate(bitString)]))
+        nextBitEnc.append(And(*[nextLiterals[bitNum][bit] for bitNum, bit in enumerate(bitString)]))
 
+    # initializing the dictionary
+    bitEncode = {}
     bitEncode['current'] = currBitEnc
     bitEncode['next'] = nextBitEnc
 
     return bitEncode
-
@@ -1,22 +1,55 @@
 #!/usr/bin/env python
 
 import math,re, os, random
+import cPickle
+import multiprocessing
 import Polygon, Polygon.IO, Polygon.Utils
 import wx
 import project
 import regions
-import itertools
 import decomposition
 
 Polygon.setTolerance(0.1)
 
+# Bump this whenever the decomposition output changes, to invalidate old decomposition caches
+DECOMPOSITION_CACHE_VERSION = 1
+
+def decomposePortion(args):
+    """
+    Convexify a single portion, given as a tuple of its polygon and the name of the method to use.
+    Return a list of convex polygons.
+
+    This is a module-level function so that it can be run in a worker process by parseLP.decomp()
+    """
+    poly, method = args
+
+    if len(poly)>1:
+        # the polygon contains holes
+        holes = [] # list holds polygon stands for holes
+        for i,contour in enumerate(poly):
+            if poly.isHole(i):
+                holes.append(Polygon.Polygon(poly[i]))
+            else:
+                newPoly = Polygon.Polygon(poly[i])
+
+        de = decomposition.decomposition(newPoly,holes)
+    else:
+        # if the polygon doesn't have any hole, decompose it if it is concave,
+        # nothing will be done if it is convex
+        de = decomposition.decomposition(poly)
+
+    if method == 'hertel-mehlhorn':
+        return de.HertelMehlhorn()
+    else:
+        return de.MP5()
+
 class parseLP:
     """
     A parser to parse the locative prepositions in specification
     """
     def __init__(self):
         
-        pass
+        self.processes = None # Number of worker processes to use for decomposition (None = one per CPU)
 
     def main(self,argv):
         """ Main function; run automatically when called from command-line """
@@ -50,12 +83,12 @@ class parseLP:
         # get all regions that need to find "region near"
         # the items in the list are tuple with region name and distance from the region boundary, default value is 50
         for m in re.finditer(r'near (?P<rA>\w+)', spec):
-            if m.group("rA") not in self.regionNear:
+            if (m.group("rA"),50) not in self.regionNear:
                 self.regionNear.append((m.group("rA"),50))
                 
         # find "within distance from a region" is just special case of find "region near"
         for m in re.finditer(r'within (?P<dist>\d+) (from|of) (?P<rA>\w+)', spec):
-            if m.group("rA") not in self.regionNear:
+            if (m.group("rA"),int(m.group("dist"))) not in self.regionNear:
                 self.regionNear.append((m.group("rA"),int(m.group("dist"))))
                 
         # get all regions that need to find "region between"
@@ -66,14 +99,25 @@ class parseLP:
             
         # generate new regions
         self.generateNewRegion()
-        # break the overlapped regions into seperated parts
-        self.checkOverLapping()
-        # remove small regions
-        self.removeSmallRegions()
-        
-        # decompose any regions with holes or are concave
-        if self.proj.compile_options['convexify']:
-            self.decomp()
+
+        # if we are allowed to, only redo the parts of the previous decomposition that changed
+        previous = None
+        if self.proj.compile_options.get('decompose_incrementally', False):
+            previous = self.loadPreviousDecomposition()
+
+        if previous is None:
+            # break the overlapped regions into seperated parts
+            self.checkOverLapping()
+            # remove small regions
+            self.removeSmallRegions()
+
+            # decompose any regions with holes or are concave
+            if self.proj.compile_options['convexify']:
+                self.decomp()
+        else:
+            self.updateDecomposition(previous)
+
+        self.savePreviousDecomposition()
 
         # store the regionMapping data to project file
         self.proj.regionMapping = self.newPolysMap
@@ -109,93 +153,251 @@ class parseLP:
             newRegion = regions.findRegionBetween(regionA,regionB,name='between$'+regionNameA+'$and$'+regionNameB+"$")
             self.proj.rfi.regions.append(newRegion)            
             
-    def checkOverLapping(self):
+    def getRegionPolygons(self):
+        """
+        Return a dictionary of the (integer-coordinate) polygons of all the regions, keyed by name
+        """
+        polys = {}
+        for region in self.proj.rfi.regions:
+            points = [(pt.x,pt.y) for pt in region.getPoints()]
+            polys[region.name] = self.intAllPoints(Polygon.Polygon(points))
+        return polys
+
+    def getBoundaryPolygon(self):
+        return self.intAllPoints(Polygon.Polygon([(pt.x,pt.y) for pt in self.boundaryRegion.getPoints()]))
+
+    def checkOverLapping(self, within=None):
         """
         Check if and regions overlap each other
         Break the ones that overlap into portions that don't overlap
+        If a polygon ``within`` is given, only the part of the workspace inside it is considered.
+
+        Rather than trying every one of the 2^N combinations of included/excluded regions,
+        we build up the arrangement one region at a time, only splitting those faces whose
+        bounding boxes actually touch the region being added.
         """
         oldRegionNames=[]
-        self.oldPolys = {} # {"nameOfRegion":polygon of that region}
+        self.oldPolys = self.getRegionPolygons() # {"nameOfRegion":polygon of that region}
         self.newPolysMap = {} # {"nameOfRegion":a list holds name of portion}
         self.portionOfRegion = {} # {"nameOfPortion":polygon of that portion}
-        for region in self.proj.rfi.regions:
-            points = [(pt.x,pt.y) for pt in region.getPoints()]
-            poly = Polygon.Polygon(points)
-            self.oldPolys[region.name] = self.intAllPoints(poly)
-            self.newPolysMap[region.name] = []
+        for regionName in self.oldPolys:
+            self.newPolysMap[regionName] = []
         oldRegionNames = sorted(self.oldPolys.keys())
         self.newPolysMap['others'] = [] # parts out side of all regions
-        
-        # set up a iterator of lists of boolean value (0/1) for finding overlapping regions
-        # each item is corrsponding to one possible overlapping
-        # each boolean value is corresponding to one region
-        boolList = itertools.product([0,1],repeat=len(oldRegionNames))
-        
+
+        # each face of the arrangement is stored as a tuple of boolean values (0/1), one for
+        # each region, indicating whether the face is inside that region, along with its polygon
+        # and bounding box.  Everything starts inside the boundary region (or the part of it
+        # we've been asked to look at).
+        boundaryPoly = self.getBoundaryPolygon()
+        if within is not None:
+            boundaryPoly = boundaryPoly & within
+        if boundaryPoly.nPoints() > 0:
+            faces = [((), boundaryPoly, boundaryPoly.boundingBox())]
+        else:
+            faces = []
+
+        for regionName in oldRegionNames:
+            regionPoly = self.oldPolys[regionName]
+            regionBox = regionPoly.boundingBox()
+            newFaces = []
+            for expr, face, faceBox in faces:
+                if not self.boundingBoxesOverlap(faceBox, regionBox):
+                    # The region can't possibly cut this face, so it lies entirely outside
+                    newFaces.append((expr + (0,), face, faceBox))
+                    continue
+
+                # when the region is included
+                result = face & regionPoly
+                if result.nPoints()>0:
+                    newFaces.append((expr + (1,), result, result.boundingBox()))
+
+                # when the region is excluded
+                result = face - regionPoly
+                if result.nPoints()>0:
+                    newFaces.append((expr + (0,), result, result.boundingBox()))
+            faces = newFaces
+
+        # name the portions in the same order the exhaustive enumeration would have produced them
+        faces.sort(key=lambda f: f[0])
+
         self.count = 1 # for naming the portion
-        # break the overlapping regions
-        for expr in boolList:
-            tempRegionList = []
-            result = self.intAllPoints(Polygon.Polygon([(pt.x,pt.y) for pt in self.boundaryRegion.getPoints()])) # starts with the boundary region
-            for i,item in enumerate(expr):
-                if item == 1:
-                    # when the region is included
-                    result = result & self.oldPolys[oldRegionNames[i]]
-                    tempRegionList.append(oldRegionNames[i])
+        for expr, result, faceBox in faces:
+            tempRegionList = [oldRegionNames[i] for i,item in enumerate(expr) if item == 1]
+
+            # there is a portion of region left
+            holeList = []
+            nonHoleList = []
+            for i,contour in enumerate(result):
+                if not result.isHole(i):
+                    nonHoleList.append(Polygon.Polygon(result[i]))
                 else:
-                    # when the region is excluded
-                    result = result - self.oldPolys[oldRegionNames[i]]
-                   
-            if result.nPoints()>0:
-                # there is a portion of region left
-                holeList = []
-                nonHoleList = []
-                for i,contour in enumerate(result):
-                    if not result.isHole(i):
-                        nonHoleList.append(Polygon.Polygon(result[i]))
-                    else:
-                        holeList.append(Polygon.Polygon(result[i]))
-                for poly in nonHoleList:
-                    portionName = 'p'+str(self.count)
-                    p = self.intAllPoints(poly)
-                    for hole in holeList:
-                        p = p - self.intAllPoints(hole)
-                    self.portionOfRegion[portionName] = p
-                    if len(tempRegionList) == 0:
-                        self.newPolysMap['others'].append(portionName)
-                    else:
-                        for regionName in tempRegionList:
-                            # update the maping dictionary
-                            self.newPolysMap[regionName].append(portionName)
-                
-                    self.count = self.count + 1
+                    holeList.append(Polygon.Polygon(result[i]))
+            for poly in nonHoleList:
+                portionName = 'p'+str(self.count)
+                p = self.intAllPoints(poly)
+                for hole in holeList:
+                    p = p - self.intAllPoints(hole)
+                self.portionOfRegion[portionName] = p
+                if len(tempRegionList) == 0:
+                    self.newPolysMap['others'].append(portionName)
+                else:
+                    for regionName in tempRegionList:
+                        # update the maping dictionary
+                        self.newPolysMap[regionName].append(portionName)
+
+                self.count = self.count + 1
+
+    def getDecompositionCacheFilename(self):
+        return self.proj.getFilenamePrefix() + ".decomposition_cache"
+
+    def getDecompositionSettings(self):
+        """
+        Return the options that affect the decomposition; a previous decomposition made
+        with different settings can't be reused
+        """
+        return (self.proj.compile_options['convexify'],
+                self.proj.compile_options.get('convexify_method', 'mp5'))
+
+    def savePreviousDecomposition(self):
+        """
+        Remember the regions we were given and the portions we made out of them,
+        so that the next decomposition can be done incrementally
+        """
+        state = {"settings": self.getDecompositionSettings(),
+                 "boundary": self.getBoundaryPolygon(),
+                 "regions": self.getRegionPolygons(),
+                 "portions": self.portionOfRegion,
+                 "mapping": self.newPolysMap}
+
+        try:
+            f = open(self.getDecompositionCacheFilename(), "wb")
+            cPickle.dump((DECOMPOSITION_CACHE_VERSION, state), f, cPickle.HIGHEST_PROTOCOL)
+            f.close()
+        except IOError, e:
+            print "WARNING: Could not save decomposition cache: %s" % e
+
+    def loadPreviousDecomposition(self):
+        """
+        Return the state saved by savePreviousDecomposition() last time, or None
+        if there isn't one we can build on
+        """
+        try:
+            f = open(self.getDecompositionCacheFilename(), "rb")
+            version, state = cPickle.load(f)
+            f.close()
+        except Exception:
+            return None
+
+        if version != DECOMPOSITION_CACHE_VERSION or state["settings"] != self.getDecompositionSettings():
+            return None
+
+        # If the boundary moved, everything might have changed
+        if not self.polygonsEqual(state["boundary"], self.getBoundaryPolygon()):
+            return None
+
+        return state
+
+    def polygonsEqual(self, polyA, polyB):
+        return [list(c) for c in polyA] == [list(c) for c in polyB]
+
+    def updateDecomposition(self, previous):
+        """
+        Bring the previous decomposition up to date with the current regions.
+
+        Only the portions that overlap a region that was added, removed or changed are
+        thrown away; the area they covered is then decomposed again from scratch.  All other
+        portions keep their names, and the new portions take the lowest free numbers.
+        """
+
+        # Find the area that might be affected: anywhere covered by a changed region, before or after
+        newRegionPolys = self.getRegionPolygons()
+        oldRegionPolys = previous["regions"]
+        changedArea = Polygon.Polygon()
+        for regionName in set(newRegionPolys) | set(oldRegionPolys):
+            newPoly = newRegionPolys.get(regionName)
+            oldPoly = oldRegionPolys.get(regionName)
+            if newPoly is not None and oldPoly is not None and self.polygonsEqual(newPoly, oldPoly):
+                continue
+            for poly in [newPoly, oldPoly]:
+                if poly is not None:
+                    changedArea = changedArea + poly
+
+        # Split the old portions into ones we can keep, and ones that need to be redone
+        # (the changed area itself is always redone, in case it wasn't completely covered before)
+        keptPortions = {}
+        redoArea = Polygon.Polygon(changedArea)
+        changedBox = changedArea.boundingBox() if changedArea.nPoints() > 0 else None
+        for nameOfPortion,poly in previous["portions"].iteritems():
+            if changedBox is not None and self.boundingBoxesOverlap(poly.boundingBox(), changedBox) and \
+               (poly & changedArea).area() > 0:
+                redoArea = redoArea + poly
+            else:
+                keptPortions[nameOfPortion] = poly
+
+        print "Regions changed; redecomposing %d of %d portions." % (len(previous["portions"]) - len(keptPortions),
+                                                                    len(previous["portions"]))
+
+        # Decompose the affected area (if there is one) as usual
+        if redoArea.nPoints() > 0:
+            self.checkOverLapping(within=redoArea)
+            self.removeSmallRegions()
+            if self.proj.compile_options['convexify']:
+                self.decomp()
+        else:
+            self.portionOfRegion = {}
+            self.newPolysMap = dict([(regionName, []) for regionName in newRegionPolys])
+            self.newPolysMap['others'] = []
 
+        # Give the new portions names that don't clash with the ones we kept
+        usedNumbers = set([int(name[1:]) for name in keptPortions])
+        renaming = {}
+        number = 1
+        for nameOfPortion in sorted(self.portionOfRegion.keys(), key=lambda name: int(name[1:])):
+            while number in usedNumbers:
+                number += 1
+            renaming[nameOfPortion] = 'p' + str(number)
+            number += 1
+
+        portionOfRegion = dict(keptPortions)
+        for nameOfPortion,poly in self.portionOfRegion.iteritems():
+            portionOfRegion[renaming[nameOfPortion]] = poly
+        self.portionOfRegion = portionOfRegion
+        self.count = max([int(name[1:]) for name in portionOfRegion] + [0]) + 1
+
+        # The kept portions don't overlap any changed region, so they belong to the same regions as before
+        for regionName,portionList in self.newPolysMap.iteritems():
+            newPortionList = [renaming[name] for name in portionList]
+            newPortionList.extend([name for name in previous["mapping"].get(regionName, []) if name in keptPortions])
+            self.newPolysMap[regionName] = sorted(newPortionList, key=lambda name: int(name[1:]))
+
+    def boundingBoxesOverlap(self, boxA, boxB):
+        """
+        Check whether two bounding boxes of the form (xmin, xmax, ymin, ymax) overlap
+        """
+        return not (boxA[1] < boxB[0] or boxB[1] < boxA[0] or
+                    boxA[3] < boxB[2] or boxB[3] < boxA[2])
 
     def decomp(self):
         """
         Decompose the region with holes or are concave
+
+        The portions are independent of each other, so they are decomposed in parallel.
+        New portions are then named in order of the portions they came from, so the
+        result doesn't depend on which worker finished first.
         """
         tempDic = {} # temporary variable for storing polygon
                      # will be merged at the end to self.portionOfRegion
 
-        for nameOfPortion,poly in self.portionOfRegion.iteritems():
-            result = [] # result list of polygon from decomposition
-            if len(poly)>1:
-                # the polygon contains holes
-                holes = [] # list holds polygon stands for holes
-                for i,contour in enumerate(poly):
-                    if poly.isHole(i):
-                        holes.append(Polygon.Polygon(poly[i]))
-                    else:
-                        newPoly = Polygon.Polygon(poly[i])
-                        
-                de = decomposition.decomposition(newPoly,holes)
-                result = de.MP5()
-            else:
-                # if the polygon doesn't have any hole, decompose it if it is concave, 
-                # nothing will be done if it is convex
-                de = decomposition.decomposition(poly)
-                result = de.MP5()
-            
+        method = self.proj.compile_options.get('convexify_method', 'mp5')
+        if method not in ['mp5', 'hertel-mehlhorn']:
+            print "WARNING: Unknown convexification method '%s'; using MP5 instead." % method
+            method = 'mp5'
+
+        portionNames = sorted(self.portionOfRegion.keys(), key=lambda name: int(name[1:]))
+        results = self.mapInParallel(decomposePortion, [(self.portionOfRegion[name], method) for name in portionNames])
+
+        for nameOfPortion,result in zip(portionNames, results):
             if len(result)>1:
                 # the region is decomposed to smaller parts
                 newPortionName=[]
@@ -215,6 +417,40 @@ class parseLP:
             else:
                 tempDic[nameOfPortion] = Polygon.Polygon(result[0])
         self.portionOfRegion = tempDic
+
+    def mapInParallel(self, func, jobs):
+        """
+        Return [func(job) for job in jobs], using a pool of worker processes if it's worth it.
+        Falls back to running everything in this process if a pool can't be created.
+        """
+        processes = self.processes
+        if processes is None:
+            try:
+                processes = multiprocessing.cpu_count()
+            except NotImplementedError:
+                processes = 1
+        processes = min(processes, len(jobs))
+
+        if processes <= 1:
+            return map(func, jobs)
+
+        try:
+            pool = multiprocessing.Pool(processes)
+        except (OSError, ImportError, NotImplementedError), e:
+            print "WARNING: Could not start worker processes (%s); decomposing serially." % e
+            return map(func, jobs)
+
+        try:
+            # (Use get() with a timeout so that KeyboardInterrupt still gets through)
+            results = pool.map_async(func, jobs, chunksize=1).get(999999)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return results
                         
     def drawAllPortions(self):
         """
@@ -289,11 +525,9 @@ class parseLP:
                 
             self.proj.rfi.regions.append(newRegion)
         
-        # Giant loop!
-        for obj1 in self.proj.rfi.regions:
-            for obj2 in self.proj.rfi.regions:
-                self.proj.rfi.splitSubfaces(obj1, obj2)
+        # Split any faces that partially overlap faces of other regions
+        self.proj.rfi.splitAllSubfaces()
 
         self.proj.rfi.recalcAdjacency()
-        self.proj.rfi.writeFile(fileName)
+        self.proj.rfi.writeFile(fileName, binary=self.proj.compile_options.get('binary_regions', False))
         
@@ -16,6 +16,33 @@ from numpy import *
 import handlerSubsystem
 import inspect
 
+class AffineCoordMap:
+    """
+    A coordinate mapping defined by a 3x3 homogeneous transformation matrix.
+
+    Calling it on a single point returns the mapped point as a list ``[x, y]``;
+    ``transformPoints()`` maps a whole set of points at once.
+    """
+
+    def __init__(self, T):
+        T = asarray(T, dtype=float)
+        self.matrix = T
+        self.A = T[0:2, 0:2].copy()  # Linear part
+        self.b = T[0:2, 2].copy()    # Translation part
+
+    def __call__(self, pt):
+        return [self.A[0,0]*pt[0] + self.A[0,1]*pt[1] + self.b[0],
+                self.A[1,0]*pt[0] + self.A[1,1]*pt[1] + self.b[1]]
+
+    def transformPoints(self, pts):
+        """
+        Map a sequence of points (or an (N,2) array), and return them as a (2,N) matrix
+        (i.e. in the format expected by is_inside() and the motion controllers)
+        """
+
+        pts = array([[pt[0], pt[1]] for pt in pts], dtype=float).reshape(-1, 2)
+        return mat(dot(self.A, pts.T) + self.b.reshape(2, 1))
+
 class Project:
     """
     A project object.
@@ -38,6 +65,13 @@ class Project:
 
         # Compilation options (with defaults)
         self.compile_options = {"convexify": True,  # Decompose workspace into convex regions
+                                "convexify_method": "mp5",  # Algorithm to use for convexification ("mp5" or "hertel-mehlhorn")
+                                "decompose_incrementally": False,  # Only redecompose the parts of the workspace that changed
+                                "binary_regions": False,  # Save the decomposed regions in the (faster to load) binary format
+                                "compact_topology": False,  # Encode the region adjacency as one shared decision-tree formula
+                                "synthesizer": "jtlv",  # Synthesis backend to use ("jtlv" or "bdd"; see synthesisBackends.py)
+                                "synthesis_time_limit": False,  # Stop synthesis after this many seconds (False for no limit)
+                                "synthesis_memory_limit": "512m",  # Memory available to synthesis (in the format of Java's -Xmx)
                                 "fastslow": False}  # Enable "fast-slow" synthesis algorithm
 
         # Climb the tree to find out where we are
@@ -131,8 +165,9 @@ class Project:
             T = eye(3)
 
         #### Create the coordmap functions
-        coordmap_map2lab = lambda pt: (linalg.inv(T) * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
-        coordmap_lab2map = lambda pt: (T * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
+        # (The matrices are only inverted once, here, and not on every call)
+        coordmap_map2lab = AffineCoordMap(linalg.inv(T))
+        coordmap_lab2map = AffineCoordMap(T)
 
         return coordmap_map2lab, coordmap_lab2map
 
@@ -161,7 +196,12 @@ class Project:
                     continue
 
                 k,v = l.split(":", 1)
-                self.compile_options[k.strip().lower()] = (v.strip().lower() in ['true', 't', '1'])
+                v = v.strip().lower()
+                if v in ['true', 't', '1']:
+                    v = True
+                elif v in ['false', 'f', '0', '']:
+                    v = False
+                self.compile_options[k.strip().lower()] = v
 
         return spec_data
 
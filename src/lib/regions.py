@@ -20,6 +20,10 @@ import fileMethods
 import re, random, math
 import Polygon, Polygon.Utils, os
 import json
+import struct
+import tempfile
+import numpy
+from handlers.motionControl.__is_inside import is_inside, is_inside_many
 
 Polygon.setTolerance(0.01)
 
@@ -134,6 +138,15 @@ else:
 [handle_NONE,           handle_TOP_LEFT,        handle_TOP_RIGHT,
  handle_BOTTOM_RIGHT,   handle_BOTTOM_LEFT] = range(-1, 4)
 
+# Binary region files (see RegionFileInterface.writeFile()) start with this string
+BINARY_REGION_FILE_MAGIC = "\x89LTLMoP-regions\r\n\x1a\n"
+BINARY_REGION_FILE_VERSION = 1
+
+# Results of offsetPolygon() and findRegionBetween(), keyed by the geometry of the input
+# regions and the other arguments, so repeated compilations don't have to redo them
+geometryCache = {}
+GEOMETRY_CACHE_SIZE = 1000
+
 ############################################################
 
 class prettierJSONEncoder(json.JSONEncoder):
@@ -157,17 +170,26 @@ class RegionFileInterface:
 
         - background (string): relative path of background image file
         - regions (list): list of Region objects, with properties defined below
-        - transitions (list of lists):
+        - adjacency (dict of dicts): sparse adjacency information
             * key1 = Region object index
             * key2 = Region object index
-            * values = Lists of faces connecting the two regions
+            * values = Lists of faces connecting the two regions (only present for adjacent regions)
+        - transitions (list of lists): dense view of ``adjacency``, for compatibility
+            * transitions[key1][key2] = List of faces connecting the two regions (empty if not adjacent)
     """
 
     def __init__(self, background="None", regions=[], transitions=None):
         self.background = background
         self.regions = regions
-        self.transitions = transitions
+        if transitions is None:
+            self.adjacency = None
+            self.transitions = None
+        else:
+            self.setAdjacency(dict((i, dict((j, faces) for j, faces in enumerate(row) if faces != []))
+                                   for i, row in enumerate(transitions)))
         self.filename = None
+        self.point_index = None  # See locate() and getRegionVertices()
+        self.exit_faces = {}     # See getExitFaceIndex()
 
     def setToDefaultName(self, region):
         if region.name is '':
@@ -270,6 +292,107 @@ class RegionFileInterface:
                             clean = False
                             break
 
+    def setAdjacency(self, adjacency):
+        """
+        Replace the adjacency information with ``adjacency`` (a dict of dicts, as described
+        in the class docstring), and update the dense ``transitions`` view to match
+        """
+
+        self.adjacency = adjacency
+        self.transitions = DenseAdjacencyView(self)
+        self.exit_faces = {}
+
+    def splitAllSubfaces(self):
+        """
+        Equivalent to calling splitSubfaces() on every (ordered) pair of regions, but much faster:
+        all faces are put into a grid so that only faces that are close together get compared,
+        and all the points that need to be added to a face are added at once.
+
+        Since adding points creates new faces, this is repeated until nothing changes (which usually
+        only takes one more pass).
+        """
+
+        COLLINEAR_TOLERANCE = 1  # pixel
+
+        while True:
+            # Gather the faces of every region, as (region index, index of starting vertex, pta, ptb)
+            # with the endpoints sorted the same way as in getFaces()
+            faces = []
+            for i, obj in enumerate(self.regions):
+                points = [(pt.x, pt.y) for pt in obj.getPoints()]
+                for k in range(len(points)):
+                    pta, ptb = sorted((points[k], points[(k+1) % len(points)]))
+                    faces.append((i, k, Point(*pta), Point(*ptb)))
+
+            if faces == []:
+                return
+
+            # Bucket the faces into a grid by their bounding boxes (padded by the tolerance)
+            xmin = min([min(f[2].x, f[3].x) for f in faces]) - COLLINEAR_TOLERANCE
+            ymin = min([min(f[2].y, f[3].y) for f in faces]) - COLLINEAR_TOLERANCE
+            cell_size = max(1.0, sum([abs(f[3].x - f[2].x) + abs(f[3].y - f[2].y) for f in faces]) / len(faces))
+            cellOf = lambda x, y: (int(math.floor((x - xmin) / cell_size)), int(math.floor((y - ymin) / cell_size)))
+
+            grid = {}
+            for n, (i, k, pta, ptb) in enumerate(faces):
+                col0, row0 = cellOf(min(pta.x, ptb.x) - COLLINEAR_TOLERANCE, min(pta.y, ptb.y) - COLLINEAR_TOLERANCE)
+                col1, row1 = cellOf(max(pta.x, ptb.x) + COLLINEAR_TOLERANCE, max(pta.y, ptb.y) + COLLINEAR_TOLERANCE)
+                for col in range(col0, col1+1):
+                    for row in range(row0, row1+1):
+                        grid.setdefault((col, row), []).append(n)
+
+            # Find every vertex that lies in the middle of a collinear face of another region.
+            # A point can only be on a face if it's inside the face's (padded) bounding box,
+            # so we only need to look at faces in the same grid cells as the endpoints.
+            new_points = {}  # (region index, index of starting vertex) -> {(x, y): Point}
+            for i, k, pta, ptb in faces:
+                candidates = set(grid.get(cellOf(pta.x, pta.y), [])) | set(grid.get(cellOf(ptb.x, ptb.y), []))
+                for n in candidates:
+                    other_i, other_k, other_pta, other_ptb = faces[n]
+                    if other_i == i:
+                        continue
+
+                    [on_segment_a, d_a, pint_a] = pointLineIntersection(other_pta, other_ptb, pta)
+                    [on_segment_b, d_b, pint_b] = pointLineIntersection(other_pta, other_ptb, ptb)
+                    if d_a < COLLINEAR_TOLERANCE and d_b < COLLINEAR_TOLERANCE: # Check for collinearity
+                        for pt, on_segment in ((pta, on_segment_a), (ptb, on_segment_b)):
+                            if on_segment and not (pt == other_pta or pt == other_ptb):
+                                new_points.setdefault((other_i, other_k), {})[(pt.x, pt.y)] = pt
+
+            if new_points == {}:
+                return
+
+            # Add the new points to their faces, in order along each face
+            for i in set([key[0] for key in new_points]):
+                obj = self.regions[i]
+                points = [x for x in obj.getPoints()]
+                if obj.type == reg_RECT:
+                    # Convert from rect to poly :(
+                    obj.pointArray = [p for p in obj.getPoints(relative=True)]
+                    obj.type = reg_POLY
+
+                pointArray = []
+                alignmentPoints = []
+                for k, start in enumerate(points):
+                    pointArray.append(obj.pointArray[k])
+                    alignmentPoints.append(obj.alignmentPoints[k])
+
+                    extra = new_points.get((i, k), {}).values()
+                    extra.sort(key=lambda pt: (pt.x - start.x)**2 + (pt.y - start.y)**2)
+                    extra = [pt - obj.position for pt in extra]
+
+                    if k == len(points) - 1:
+                        # Points on the closing face go at the beginning, like splitSubfaces() does
+                        pointArray[0:0] = extra
+                        alignmentPoints[0:0] = [False] * len(extra)
+                    else:
+                        pointArray.extend(extra)
+                        alignmentPoints.extend([False] * len(extra))
+
+                obj.pointArray = pointArray
+                obj.alignmentPoints = alignmentPoints
+                obj.recalcBoundingBox()
+
     def recalcAdjacency(self):
         """
         Calculate the region adjacency matrix and a list of shared faces
@@ -278,41 +401,33 @@ class RegionFileInterface:
         """
 
         # Calculate adjoining faces:
-        self.transitions = [[[] for j in range(len(self.regions))] for i in range(len(self.regions))]
+        faceOwners = {} # Face -> indices of the regions that have that face
 
-        transitionFaces = {} # This is just a list of faces to draw dotted lines on
+        # Prevent detection of adjoining faces when Duplicate command creates
+        # object on top of itself, by identifying each region by its outline
+        outlines = [(obj.position.x, obj.position.y, tuple([(pt.x, pt.y) for pt in obj.getPoints()]))
+                    for obj in self.regions]
 
-        for obj in self.regions:
-            for face in obj.getFaces(includeHole=True):                
-                if face not in transitionFaces: transitionFaces[face] = []
-                ignore = False
-                for other_obj in transitionFaces[face]:
-                    # Prevent detection of adjoining faces when Duplicate 
-                    # command creates object on top of itself
-                    if other_obj.position == obj.position and \
-                       [x for x in other_obj.getPoints()] == [x for x in obj.getPoints()]:
-                        ignore = True
-    
-                if not ignore:
-                    transitionFaces[face].append(obj)
+        for i, obj in enumerate(self.regions):
+            for face in obj.getFaces(includeHole=True):
+                owners = faceOwners.setdefault(face, [])
+                if not any([outlines[j] == outlines[i] for j in owners]):
+                    owners.append(i)
+
+        adjacency = {}
+        transitionFaces = {} # This is just a list of faces to draw dotted lines on
 
-        toDelete = []
-        for face, objarray in transitionFaces.iteritems():
-            if len(objarray) > 1:
+        for face, owners in faceOwners.iteritems():
+            if len(owners) > 1:
                 # If this face is shared by multiple regions
-                for obj in objarray:
-                    key = self.regions.index(obj)
-                    for other_obj in objarray:
-                        if other_obj == obj: continue
-                        key2 = self.regions.index(other_obj)
-                        self.transitions[key][key2].append(face)
-            else:
-                # Otherwise mark for deletion (we can't delete it in the middle of iteration)
-                toDelete.append(face)
+                for i in owners:
+                    for j in owners:
+                        if i == j: continue
+                        adjacency.setdefault(i, {}).setdefault(j, []).append(face)
+
+                transitionFaces[face] = [self.regions[i] for i in owners]
 
-        # Delete all those dudes
-        for unused_face in toDelete:
-            del transitionFaces[unused_face]                    
+        self.setAdjacency(adjacency)
 
         return transitionFaces
 
@@ -327,11 +442,94 @@ class RegionFileInterface:
 
         return (leftMargin, topMargin, rightExtent, downExtent)
 
-    def writeFile(self, filename):
+    def locate(self, points, coordmap=None):
+        """
+        Find which region each of the given points is in.  If ``coordmap`` is given, the points
+        are taken to be in the coordinate frame that it maps region vertices into (e.g. pass
+        ``proj.coordmap_map2lab`` to look up robot poses in lab coordinates).
+
+        Returns a list containing, for each point, the index of the first region containing it,
+        or None if it's not inside any region.
+
+        A spatial index of the regions is built on the first call, and reused after that as
+        long as the regions and coordmap stay the same.  Call ``invalidatePointIndex()``
+        after modifying region geometry.
+        """
+
+        return self._getPointIndex(coordmap).locateMany(points)
+
+    def getRegionVertices(self, region_index, coordmap=None):
+        """
+        Returns the vertices of the given region, mapped through ``coordmap`` if given,
+        as a (2,N) matrix (the format expected by is_inside() and the motion controllers).
+
+        The mapped vertices of every region are cached together with the index used by
+        ``locate()``, so they are only recomputed when the coordmap (i.e. the calibration)
+        changes.  Don't modify the returned matrix.
+        """
+
+        return self._getPointIndex(coordmap).vertices[region_index]
+
+    def getExitFaceIndex(self, current_reg, next_reg):
+        """
+        Returns the index (into ``regions[current_reg].getFaces()``) of the face to use to get
+        from region ``current_reg`` to region ``next_reg``, or None if there isn't one.
+        If there are multiple shared faces, the largest one is chosen.
+        """
+
+        key = (current_reg, next_reg)
+        if key in self.exit_faces:
+            return self.exit_faces[key]
+
+        # TODO: Account for non-determinacy?
+        # For now, let's just choose the largest face available, because we are probably using a big clunky robot
+        max_magsq = 0
+        pt1 = pt2 = None
+        for tf in self.transitions[current_reg][next_reg]:
+            magsq = (tf[0][0] - tf[1][0])**2 + (tf[0][1] - tf[1][1])**2
+            if magsq > max_magsq:
+                pt1, pt2 = tf
+                max_magsq = magsq
+
+        transFace = None
+        if pt1 is not None:
+            for i, face in enumerate([x for x in self.regions[current_reg].getFaces()]):
+                # Account for both face orientations...
+                if (pt1 == face[0] and pt2 == face[1]) or (pt1 == face[1] and pt2 == face[0]):
+                    transFace = i
+                    break
+
+        self.exit_faces[key] = transFace
+
+        return transFace
+
+    def _getPointIndex(self, coordmap):
+        index = self.point_index
+        if index is None or index.coordmap is not coordmap or index.num_regions != len(self.regions):
+            index = self.point_index = RegionPointIndex(self.regions, coordmap)
+
+        return index
+
+    def invalidatePointIndex(self):
+        """
+        Throw away the spatial index used by ``locate()`` and the cached region geometry,
+        so that they will be rebuilt
+        """
+        self.point_index = None
+        self.exit_faces = {}
+
+    def writeFile(self, filename, binary=False):
         """
         File format is described inside the comments variable. 
+
+        If ``binary`` is True, the regions are instead saved in a compact binary format
+        (see _writeBinaryFile()), which is much faster to load for large maps.
+        readFile() can read either format.
         """
 
+        if binary:
+            return self._writeBinaryFile(filename)
+
         comments = {"FILE_HEADER":"This is a region definition file for the LTLMoP toolkit.\n" +
                                   "Format details are described at the beginning of each section below.\n" +
                                   "Note that all values are separated by *tabs*.",
@@ -352,18 +550,18 @@ class RegionFileInterface:
         regionData = [je.encode(regionData)]
        
         transitionData = []
-        for region1, destinations in enumerate(self.transitions):
+        for region1 in sorted(self.adjacency):
             # Note: We are assuming all transitions are bidirectional so we only have to include
             # the parts of the adjacency matrix above the diagonal
-            for region2, faces in enumerate(destinations[region1+1:]):
-                if faces == []: continue    # No transition between these regions, so skip
+            for region2 in sorted(self.adjacency[region1]):
+                if region2 <= region1: continue
 
                 faceData = []
-                for face in faces:
+                for face in self.adjacency[region1][region2]:
                     faceData.extend([face[0][0], face[0][1], face[1][0], face[1][1]])
 
                 transitionData.append("\t".join([self.regions[region1].name,
-                                                 self.regions[region1 + 1 + region2].name] +
+                                                 self.regions[region2].name] +
                                                  map(str, faceData)))
 
         calibPoints = []
@@ -394,6 +592,12 @@ class RegionFileInterface:
         if not os.path.exists(filename):
             return False
 
+        f = open(filename, "rb")
+        magic = f.read(len(BINARY_REGION_FILE_MAGIC))
+        f.close()
+        if magic == BINARY_REGION_FILE_MAGIC:
+            return self._readBinaryFile(filename)
+
         data = fileMethods.readFromFile(filename)
 
         if data is None:
@@ -405,6 +609,7 @@ class RegionFileInterface:
             self.background = "None"
 
         self.regions = []
+        self.invalidatePointIndex()
         rdata = data["Regions"]
 
         try:
@@ -423,35 +628,509 @@ class RegionFileInterface:
 
             self.regions.append(newRegion)
 
-        # Make an empty adjacency matrix of size (# of regions) x (# of regions)
-        self.transitions = [[[] for j in range(len(self.regions))] for i in range(len(self.regions))]
+        # Look up each name in a dictionary, rather than searching the list of regions every time
+        regionIndices = {}
+        for i, region in enumerate(self.regions):
+            regionIndices.setdefault(region.name.lower(), i)
+
+        def indexOfRegionWithName(name):
+            if name.lower() in regionIndices:
+                return regionIndices[name.lower()]
+            return self.indexOfRegionWithName(name)  # (Prints a warning)
+
+        adjacency = {}
         for transition in data["Transitions"]:
             transData = transition.split("\t");
-            region1 = self.indexOfRegionWithName(transData[0])
-            region2 = self.indexOfRegionWithName(transData[1])
+            region1 = indexOfRegionWithName(transData[0])
+            region2 = indexOfRegionWithName(transData[1])
             faces = []
             for i in range(2, len(transData), 4):
-                p1 = Point(int(transData[i]), int(transData[i+1]))
-                p2 = Point(int(transData[i+2]), int(transData[i+3]))
+                # (Decomposed regions have non-integer coordinates)
+                p1 = Point(float(transData[i]), float(transData[i+1]))
+                p2 = Point(float(transData[i+2]), float(transData[i+3]))
                 faces.append(tuple(sorted((p1, p2))))
                 
             # During adjacency matrix reconstruction, we'll mirror over the diagonal
-            self.transitions[region1][region2] = faces
-            self.transitions[region2][region1] = faces
+            adjacency.setdefault(region1, {})[region2] = faces
+            adjacency.setdefault(region2, {})[region1] = faces
+
+        self.setAdjacency(adjacency)
 
         if "CalibrationPoints" in data:
             for point in data["CalibrationPoints"]:
                 [name, index] = point.split("\t")
-                self.regions[self.indexOfRegionWithName(name)].alignmentPoints[int(index)] = True
+                self.regions[indexOfRegionWithName(name)].alignmentPoints[int(index)] = True
 
         if "Obstacles" in data:
             for rname in data["Obstacles"]:
-                self.regions[self.indexOfRegionWithName(rname)].isObstacle = True
+                self.regions[indexOfRegionWithName(rname)].isObstacle = True
             
         self.filename = filename
 
         return True
-   
+
+    def _writeBinaryFile(self, filename):
+        """
+        Save the regions in a binary format, made up of a short header followed by
+        a set of flat arrays (one per attribute, rather than one record per region):
+
+            - the magic string BINARY_REGION_FILE_MAGIC
+            - the format version and the length of the header, as two little-endian uint32s
+            - a JSON header with the background, the region names (transitions and calibration
+              points refer to regions by their index in this list), and the dtype, shape and
+              offset (from the start of the file) of each array
+            - the arrays themselves, in C order, each starting at a multiple of 8 bytes
+
+        The vertices of all regions (relative to the region positions, as in getData()) are stored
+        in one array; ``region_contours`` gives the range of contours belonging to each region
+        (its boundary first, then any holes), and ``contour_vertices`` the range of vertices
+        belonging to each contour.  Transition faces are stored the same way.
+        """
+
+        regionContours = [0]
+        contourVertices = [0]
+        vertices = []
+        alignment = []
+        for i, r in enumerate(self.regions):
+            if r.type == reg_POLY:
+                for contour in [r.pointArray] + r.holeList:
+                    vertices.extend([(pt.x, pt.y) for pt in contour])
+                    contourVertices.append(len(vertices))
+            regionContours.append(len(contourVertices) - 1)
+            alignment.extend([(i, index) for index, isAP in enumerate(r.alignmentPoints) if isAP])
+
+        transitions = []
+        transitionFaces = [0]
+        faces = []
+        for region1 in sorted(self.adjacency):
+            # As in the text format, only the transitions above the diagonal are stored
+            for region2 in sorted(self.adjacency[region1]):
+                if region2 <= region1: continue
+                transitions.append((region1, region2))
+                faces.extend([(face[0][0], face[0][1], face[1][0], face[1][1])
+                              for face in self.adjacency[region1][region2]])
+                transitionFaces.append(len(faces))
+
+        positions = [(r.position.x, r.position.y) for r in self.regions]
+        sizes = [(r.size.width, r.size.height) for r in self.regions]
+
+        # Use integer coordinates if we can get away with it
+        coords = [v for pt in vertices + positions + sizes for v in pt] + [v for face in faces for v in face]
+        if all([float(v).is_integer() for v in coords]):
+            coordType = numpy.int64
+        else:
+            coordType = numpy.float64
+
+        arrays = [("position", numpy.array(positions, dtype=coordType).reshape(-1, 2)),
+                  ("size", numpy.array(sizes, dtype=coordType).reshape(-1, 2)),
+                  ("color", numpy.array([(r.color.Red(), r.color.Green(), r.color.Blue())
+                                         for r in self.regions], dtype=numpy.uint8).reshape(-1, 3)),
+                  ("type", numpy.array([r.type for r in self.regions], dtype=numpy.uint8)),
+                  ("obstacle", numpy.array([r.isObstacle for r in self.regions], dtype=numpy.uint8)),
+                  ("region_contours", numpy.array(regionContours, dtype=numpy.int64)),
+                  ("contour_vertices", numpy.array(contourVertices, dtype=numpy.int64)),
+                  ("vertices", numpy.array(vertices, dtype=coordType).reshape(-1, 2)),
+                  ("alignment", numpy.array(alignment, dtype=numpy.int64).reshape(-1, 2)),
+                  ("transitions", numpy.array(transitions, dtype=numpy.int64).reshape(-1, 2)),
+                  ("transition_faces", numpy.array(transitionFaces, dtype=numpy.int64)),
+                  ("faces", numpy.array(faces, dtype=coordType).reshape(-1, 4))]
+
+        # Work out where everything goes.  The offsets depend on the length of the header,
+        # so just keep trying until the header stops growing.
+        headerLength = 0
+        while True:
+            offset = len(BINARY_REGION_FILE_MAGIC) + 8 + headerLength
+            layout = {}
+            for name, a in arrays:
+                offset += -offset % 8
+                layout[name] = (a.dtype.str, a.shape, offset)
+                offset += a.nbytes
+
+            header = json.dumps({"background": self.background,
+                                 "names": [r.name for r in self.regions],
+                                 "arrays": layout})
+            if len(header) <= headerLength:
+                break
+            headerLength = len(header)
+        header = header.ljust(headerLength)
+
+        # Write to a temporary file and then move it into place.  On POSIX systems, anyone who
+        # still has the old file memory-mapped (see _readBinaryFile()) keeps seeing the old version.
+        # Windows won't let us replace a file that is mapped, so in that case we give up (and
+        # return False) rather than leave a half-written file behind.
+        fd, tempFilename = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp",
+                                            dir=os.path.dirname(os.path.abspath(filename)))
+        f = os.fdopen(fd, "wb")
+        f.write(BINARY_REGION_FILE_MAGIC)
+        f.write(struct.pack("<II", BINARY_REGION_FILE_VERSION, headerLength))
+        f.write(header)
+        for name, a in arrays:
+            f.write("\0" * (layout[name][2] - f.tell()))
+            f.write(a.tostring())
+        f.close()
+
+        try:
+            try:
+                os.rename(tempFilename, filename)
+            except OSError:
+                # Windows won't rename over an existing file
+                os.remove(filename)
+                os.rename(tempFilename, filename)
+        except OSError, e:
+            print "ERROR: Could not replace region file %s (is it still open?): %s" % (filename, e)
+            os.remove(tempFilename)
+            return False
+
+        return True
+
+    def _readBinaryFile(self, filename):
+        """
+        Load a file saved by _writeBinaryFile().
+
+        The file is memory-mapped, and Region objects are only created when they are
+        first accessed (see LazyRegionList), so loading even very large maps is quick.
+        """
+
+        f = open(filename, "rb")
+        f.seek(len(BINARY_REGION_FILE_MAGIC))
+        version, headerLength = struct.unpack("<II", f.read(8))
+        if version != BINARY_REGION_FILE_VERSION:
+            print "ERROR: Region file %s has unsupported binary format version %d" % (filename, version)
+            f.close()
+            return False
+        header = json.loads(f.read(headerLength))
+        f.close()
+
+        data = numpy.memmap(filename, dtype=numpy.uint8, mode="r")
+        arrays = {}
+        for name, (dtype, shape, offset) in header["arrays"].iteritems():
+            dtype = numpy.dtype(dtype)
+            nbytes = dtype.itemsize * int(numpy.prod(shape))
+            arrays[name] = data[offset:offset+nbytes].view(dtype).reshape(shape)
+
+        self.background = header["background"]
+        self.regions = LazyRegionList(header["names"], arrays)
+        self.invalidatePointIndex()
+
+        adjacency = {}
+        transitions = arrays["transitions"].tolist()
+        transitionFaces = arrays["transition_faces"].tolist()
+        faces = arrays["faces"].tolist()
+        for t, (region1, region2) in enumerate(transitions):
+            faceList = [tuple(sorted((Point(x1, y1), Point(x2, y2))))
+                        for x1, y1, x2, y2 in faces[transitionFaces[t]:transitionFaces[t+1]]]
+
+            # During adjacency matrix reconstruction, we'll mirror over the diagonal
+            adjacency.setdefault(region1, {})[region2] = faceList
+            adjacency.setdefault(region2, {})[region1] = faceList
+
+        self.setAdjacency(adjacency)
+
+        self.filename = filename
+
+        return True
+
+class DenseAdjacencyView:
+    """
+    Makes the sparse adjacency information of a RegionFileInterface look like a dense
+    (# of regions) x (# of regions) list of lists of faces, without actually storing one.
+    """
+
+    def __init__(self, rfi):
+        self.rfi = rfi
+
+    def __len__(self):
+        return len(self.rfi.regions)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("region index out of range")
+        return DenseAdjacencyRow(self.rfi, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield DenseAdjacencyRow(self.rfi, i)
+
+class DenseAdjacencyRow:
+    """
+    A single row of a DenseAdjacencyView (i.e. the faces shared by one region and every other region)
+    """
+
+    def __init__(self, rfi, i):
+        self.rfi = rfi
+        self.i = i
+
+    def __len__(self):
+        return len(self.rfi.regions)
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return [self[k] for k in range(*j.indices(len(self)))]
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError("region index out of range")
+        return self.rfi.adjacency.get(self.i, {}).get(j, [])
+
+    def __setitem__(self, j, faces):
+        if faces == []:
+            self.rfi.adjacency.get(self.i, {}).pop(j, None)
+        else:
+            self.rfi.adjacency.setdefault(self.i, {})[j] = faces
+
+    def __iter__(self):
+        for j in range(len(self)):
+            yield self[j]
+
+class LazyRegionList(list):
+    """
+    The list of regions loaded from a binary region file.  It behaves like a normal list of
+    Region objects, but each Region is only created (from the memory-mapped arrays described
+    in RegionFileInterface._writeBinaryFile()) the first time it is accessed.
+
+    Operations that need to look at every element (searching, comparing, sorting) create all
+    the regions first.
+    """
+
+    class Unloaded:
+        """ Placeholder for a region that hasn't been created yet """
+        def __init__(self, index):
+            self.index = index
+
+    def __init__(self, names, arrays):
+        list.__init__(self, [LazyRegionList.Unloaded(i) for i in range(len(names))])
+        self.names = names
+        self.arrays = arrays
+
+        # Alignment points are stored as one list for the whole file, so split them up now
+        self.alignmentPoints = {}
+        for i, index in arrays["alignment"].tolist():
+            self.alignmentPoints.setdefault(i, []).append(index)
+
+    def _load(self, k):
+        """
+        Return the region at position k, creating it if necessary
+        """
+        item = list.__getitem__(self, k)
+        if not isinstance(item, LazyRegionList.Unloaded):
+            return item
+
+        i = item.index
+        a = self.arrays
+        region = Region(type=int(a["type"][i]),
+                        position=Point(*a["position"][i].tolist()),
+                        size=Size(*a["size"][i].tolist()),
+                        color=Color(*a["color"][i].tolist()),
+                        name=self.names[i])
+        if region.type == reg_POLY:
+            contours = [[Point(*pt) for pt in a["vertices"][a["contour_vertices"][c]:a["contour_vertices"][c+1]].tolist()]
+                        for c in range(a["region_contours"][i], a["region_contours"][i+1])]
+            region.pointArray = contours[0]
+            region.holeList = contours[1:]
+        alignment = self.alignmentPoints.get(i, [])
+        region.alignmentPoints = [(index in alignment) for index, pt in enumerate(region.getPoints())]
+        region.isObstacle = bool(a["obstacle"][i])
+
+        list.__setitem__(self, k, region)
+        return region
+
+    def peekPoints(self, k):
+        """
+        If the region at position k hasn't been created yet, return its boundary (in absolute
+        coordinates) as an (N,2) array without creating it.  Otherwise, return None.
+        """
+        item = list.__getitem__(self, k)
+        if not isinstance(item, LazyRegionList.Unloaded):
+            return None
+
+        i = item.index
+        a = self.arrays
+        if a["type"][i] == reg_RECT:
+            w, h = a["size"][i]
+            pts = numpy.array([(0, 0), (w, 0), (w, h), (0, h)], dtype=float)
+        else:
+            c = a["region_contours"][i]
+            pts = numpy.asarray(a["vertices"][a["contour_vertices"][c]:a["contour_vertices"][c+1]], dtype=float)
+        return pts + a["position"][i]
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self._load(j) for j in range(*k.indices(len(self)))]
+        return self._load(k)
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(max(0, i), max(0, j)))
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self._load(k)
+
+    def __reversed__(self):
+        for k in reversed(range(len(self))):
+            yield self._load(k)
+
+    def __add__(self, other):
+        return list(self) + other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def pop(self, k=-1):
+        region = self._load(k)
+        list.pop(self, k)
+        return region
+
+    def _loadAll(self):
+        for k in range(len(self)):
+            self._load(k)
+
+    def sort(self, *args, **kwds):
+        self._loadAll()
+        list.sort(self, *args, **kwds)
+
+    def index(self, *args):
+        self._loadAll()
+        return list.index(self, *args)
+
+    def count(self, item):
+        self._loadAll()
+        return list.count(self, item)
+
+    def remove(self, item):
+        self._loadAll()
+        list.remove(self, item)
+
+    def __contains__(self, item):
+        self._loadAll()
+        return list.__contains__(self, item)
+
+    def __eq__(self, other):
+        self._loadAll()
+        if isinstance(other, LazyRegionList):
+            other._loadAll()
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+class RegionPointIndex:
+    """
+    A uniform grid over the bounding boxes of a list of regions, for quickly finding the region
+    containing a point.  Each grid cell lists the regions whose bounding boxes overlap it, so only
+    a handful of regions need to be checked with a full point-in-polygon test for any given point.
+
+    The grid has about as many cells as there are regions, so lookups take constant time on
+    average (for reasonably evenly-sized regions).
+    """
+
+    def __init__(self, regions, coordmap=None):
+        self.coordmap = coordmap
+        self.num_regions = len(regions)
+
+        # Vertices of each region as a (2,N) matrix (as used by is_inside()), and bounding boxes
+        self.vertices = []
+        self.bboxes = []   # (xmin, xmax, ymin, ymax)
+        for k in range(len(regions)):
+            # (Avoid creating regions from a binary file just to get their vertices)
+            pts = None
+            if isinstance(regions, LazyRegionList):
+                pts = regions.peekPoints(k)
+            if pts is None:
+                pts = [x for x in regions[k].getPoints()]
+            if hasattr(coordmap, "transformPoints"):
+                v = coordmap.transformPoints(pts)
+            else:
+                if coordmap is not None:
+                    pts = map(coordmap, pts)
+                v = numpy.mat([[pt[0], pt[1]] for pt in pts], dtype=float).T
+            self.vertices.append(v)
+            self.bboxes.append((v[0].min(), v[0].max(), v[1].min(), v[1].max()))
+
+        self.grid = {}     # (column, row) -> list of region indices, in ascending order
+
+        if self.bboxes == []:
+            self.extent = None
+            return
+
+        self.extent = (min([b[0] for b in self.bboxes]), max([b[1] for b in self.bboxes]),
+                       min([b[2] for b in self.bboxes]), max([b[3] for b in self.bboxes]))
+
+        cells_per_side = max(1, int(math.ceil(math.sqrt(len(regions)))))
+        self.cell_width = (self.extent[1] - self.extent[0]) / cells_per_side or 1.0
+        self.cell_height = (self.extent[3] - self.extent[2]) / cells_per_side or 1.0
+
+        for i, (xmin, xmax, ymin, ymax) in enumerate(self.bboxes):
+            col0, row0 = self._cellOf(xmin, ymin)
+            col1, row1 = self._cellOf(xmax, ymax)
+            for col in range(col0, col1+1):
+                for row in range(row0, row1+1):
+                    self.grid.setdefault((col, row), []).append(i)
+
+    def _cellOf(self, x, y):
+        return (int(math.floor((x - self.extent[0]) / self.cell_width)),
+                int(math.floor((y - self.extent[2]) / self.cell_height)))
+
+    def locate(self, pt):
+        """
+        Returns the index of the first region containing point ``pt``, or None
+        """
+
+        if self.extent is None:
+            return None
+
+        x, y = pt[0], pt[1]
+
+        for i in self.grid.get(self._cellOf(x, y), []):
+            xmin, xmax, ymin, ymax = self.bboxes[i]
+            if x < xmin or x > xmax or y < ymin or y > ymax:
+                continue
+            if is_inside([x, y], self.vertices[i]):
+                return i
+
+        return None
+
+    def locateMany(self, points):
+        """
+        Returns a list of the index of the first region containing each of ``points`` (or None).
+        The points that fall in each grid cell are tested against each candidate region together.
+        """
+
+        result = [None] * len(points)
+        if self.extent is None:
+            return result
+
+        byCell = {}
+        for k, pt in enumerate(points):
+            byCell.setdefault(self._cellOf(pt[0], pt[1]), []).append(k)
+
+        for cell, ks in byCell.iteritems():
+            # The points in this cell that we haven't found a region for yet
+            ks = numpy.array(ks)
+            pts = numpy.array([(points[k][0], points[k][1]) for k in ks], dtype=float)
+
+            for i in self.grid.get(cell, []):
+                xmin, xmax, ymin, ymax = self.bboxes[i]
+                inBox = (pts[:, 0] >= xmin) & (pts[:, 0] <= xmax) & (pts[:, 1] >= ymin) & (pts[:, 1] <= ymax)
+                if not inBox.any():
+                    continue
+
+                hit = numpy.zeros(len(ks), dtype=bool)
+                hit[inBox] = is_inside_many(pts[inBox], self.vertices[i])
+                for k in ks[hit]:
+                    result[k] = i
+
+                ks = ks[~hit]
+                pts = pts[~hit]
+                if len(ks) == 0:
+                    break
+
+        return result
+
 ############################################################
  
 class Region:
@@ -792,23 +1471,19 @@ class Region:
         # The algorithm used here was taken from:
         # http://local.wasp.uwa.edu.au/~pbourke/geometry/insidepoly/
 
-        sum = 0
-        n = len(poly_pts)
-        for i in range(n):
-            v1_y = poly_pts[i].y - y
-            v1_x = poly_pts[i].x - x
-            v2_y = poly_pts[(i+1)%n].y - y
-            v2_x = poly_pts[(i+1)%n].x - x
-            angle_v1 = math.atan2(v1_y, v1_x)
-            angle_v2 = math.atan2(v2_y, v2_x)
-            angle = angle_v2 - angle_v1
-            while(angle > math.pi):
-                angle -= 2 * math.pi
-            while(angle < -math.pi):
-                angle += 2 * math.pi
-            sum += angle
-
-        return not (abs(sum) < math.pi)
+        # Sum up the angles subtended by each edge, all at once
+        px = numpy.array([pt.x for pt in poly_pts], dtype=float)
+        py = numpy.array([pt.y for pt in poly_pts], dtype=float)
+
+        angle_v1 = numpy.arctan2(py - y, px - x)
+        angle_v2 = numpy.roll(angle_v1, -1)
+        angle = angle_v2 - angle_v1
+
+        # Wrap into [-pi, pi]
+        angle = numpy.where(angle > math.pi, angle - 2*math.pi, angle)
+        angle = numpy.where(angle < -math.pi, angle + 2*math.pi, angle)
+
+        return not (abs(angle.sum()) < math.pi)
 
     def getSelectionHandleContainingPoint(self, x, y, boundFunc=None):
         """ Return the selection handle containing the given point, if any.
@@ -912,6 +1587,10 @@ class Region:
         """
         Given a region object and a distance value, return a new region object which covers
         the area that is within the 'distance' away from the given region.
+
+        In 'overEstimate' mode the new region contains that whole area, and in 'underEstimate'
+        mode it is contained in it (see offsetPolygon()).  'convexHull' mode uses the old method
+        of shifting each face out and taking the convex hull of the result.
         """
         
         if distance<0:
@@ -925,8 +1604,20 @@ class Region:
         newRegion.color             = Color(255-self.color[0], 255-self.color[1], 255-self.color[2])
         newRegion.pointArray        = []
         center=self.getCenter()
-        
-        if mode == 'overEstimate':
+
+        if mode in ['overEstimate', 'underEstimate']:
+            # Buffer the region by the distance; the arcs around the vertices are approximated
+            # by polygons that lie outside (or inside) the true arcs
+            poly = offsetPolygon([(pt.x, pt.y) for pt in self.getPoints()], distance,
+                                 overEstimate=(mode == 'overEstimate'))
+            setRegionContours(newRegion, poly)
+            newRegion.alignmentPoints   = [False] * len([x for x in newRegion.getPoints()])
+            newRegion.recalcBoundingBox()
+
+            return newRegion
+
+        # The old approach, which shifts each face out by the distance and takes the convex hull
+        if mode == 'convexHull':
             for i,pt in enumerate(self.getPoints()):
                 twoFaces = [face for face in self.getFaces() if pt in face] # faces that connected by pt
                         
@@ -1040,18 +1731,108 @@ def findRegionBetween(regionA, regionB,name = 'newRegion'):
     newRegion.name = name
     newRegion.type              = reg_POLY
     
-    polyA = Polygon.Polygon([x for x in regionA.getPoints()])
-    polyB = Polygon.Polygon([x for x in regionB.getPoints()])
-    
-    betw_AB = Polygon.Utils.convexHull(polyA+polyB)-polyA-polyB
-    
-    newRegion.pointArray = [Point(*x) for x in Polygon.Utils.pointList(betw_AB)]
+    ptsA = tuple([(pt.x, pt.y) for pt in regionA.getPoints()])
+    ptsB = tuple([(pt.x, pt.y) for pt in regionB.getPoints()])
+
+    key = ("between", ptsA, ptsB)
+    if key not in geometryCache:
+        polyA = Polygon.Polygon(ptsA)
+        polyB = Polygon.Polygon(ptsB)
+
+        betw_AB = Polygon.Utils.convexHull(polyA+polyB)-polyA-polyB
+        storeGeometry(key, betw_AB)
+
+    setRegionContours(newRegion, Polygon.Polygon(geometryCache[key]))
     newRegion.alignmentPoints   = [False] * len([x for x in newRegion.getPoints()])    
     
     newRegion.recalcBoundingBox()
 
     return newRegion
 
+def storeGeometry(key, poly):
+    """
+    Remember the result of a geometric computation in geometryCache
+    """
+
+    if len(geometryCache) >= GEOMETRY_CACHE_SIZE:
+        geometryCache.clear()
+    geometryCache[key] = Polygon.Polygon(poly)
+
+def offsetPolygon(points, distance, overEstimate=True, arcSegments=16):
+    """
+    Return (as a Polygon) the set of all points within ``distance`` of the polygon with
+    vertices ``points``, i.e. the Minkowski sum of the polygon and a disc.
+
+    The disc is approximated by a regular polygon with ``arcSegments`` sides. If ``overEstimate``
+    is True, the disc approximation surrounds the true disc, so the result contains the exact
+    answer; otherwise it is inscribed in the disc, so the result is contained in the exact answer.
+
+    Results are memoized, keyed by the vertices and the other arguments.
+    """
+
+    points = tuple([(float(x), float(y)) for x, y in points])
+    key = ("offset", points, float(distance), bool(overEstimate), arcSegments)
+    if key in geometryCache:
+        return Polygon.Polygon(geometryCache[key])
+
+    if overEstimate:
+        # Push the vertices out so that the sides of the polygon touch the circle
+        radius = distance / math.cos(math.pi / arcSegments)
+    else:
+        radius = distance
+    disc = [(radius*math.cos(2*math.pi*k/arcSegments), radius*math.sin(2*math.pi*k/arcSegments))
+            for k in range(arcSegments)]
+
+    # The sum is the union of the polygon itself and each edge swept along the disc
+    # (which is just the convex hull of a copy of the disc at each end of the edge)
+    pieces = [Polygon.Polygon(points)]
+    if distance > 0:
+        for i in range(len(points)):
+            (x1, y1), (x2, y2) = points[i-1], points[i]
+            pieces.append(Polygon.Utils.convexHull(Polygon.Polygon([(x1+dx, y1+dy) for dx, dy in disc] +
+                                                                   [(x2+dx, y2+dy) for dx, dy in disc])))
+
+    # Combine the pieces pairwise, which keeps the intermediate polygons small
+    while len(pieces) > 1:
+        pieces = [pieces[k] + pieces[k+1] if k+1 < len(pieces) else pieces[k]
+                  for k in range(0, len(pieces), 2)]
+
+    storeGeometry(key, pieces[0])
+
+    return pieces[0]
+
+def setRegionContours(region, poly):
+    """
+    Set the boundary of ``region`` to the largest (non-hole) contour of ``poly``,
+    and its holes to the holes of ``poly`` inside that contour.
+
+    A Region only has one boundary, so if ``poly`` is in several pieces (e.g. the area
+    between two overlapping regions), the smaller ones are dropped with a warning.
+    """
+
+    outlines = [i for i in range(len(poly)) if not poly.isHole(i)]
+    if outlines == []:
+        region.pointArray = []
+        region.holeList = []
+        return
+
+    outline = max(outlines, key=lambda i: Polygon.Polygon(poly[i]).area())
+    outlinePoly = Polygon.Polygon(poly[outline])
+
+    # (Slivers left behind by rounding errors aren't worth mentioning)
+    dropped = [i for i in outlines if i != outline and Polygon.Polygon(poly[i]).area() > 1e-9*outlinePoly.area()]
+    if dropped != []:
+        print "WARNING: Region %s is made up of %d separate pieces; only the largest one will be used." % \
+              (region.name, len(dropped) + 1)
+    region.pointArray = [Point(*x) for x in poly[outline]]
+
+    # (Ignore any slivers left behind by rounding errors)
+    region.holeList = []
+    for i in range(len(poly)):
+        hole = Polygon.Polygon(poly[i])
+        if poly.isHole(i) and hole.area() > 1e-9*outlinePoly.area() and outlinePoly.covers(hole):
+            region.holeList.append([Point(*x) for x in poly[i]])
+
 def pointLineIntersection(pt1, pt2, test_pt):
     """
     Given two points (pt1, pt2), find the point on the line formed by those points that is nearest
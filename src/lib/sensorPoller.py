@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+""" ============================================
+    sensorPoller.py - Background sensor sampling
+    ============================================
+
+    Polls each sensor proposition on its own thread, so that the execution loop can read
+    the latest value of every sensor without waiting on slow (e.g. networked) sensor handlers.
+"""
+
+import threading, time
+
+class SensorPoller:
+    """
+    Samples each sensor of an automaton on a separate thread at up to ``rate`` Hz, and
+    keeps the most recent value of each one in a snapshot that can be read at any time.
+
+    The automaton's ``evaluateSensor()`` method is used to take readings, so the sensor
+    handlers are called exactly as they would be by the automaton itself.  Note that this means
+    sensor handlers will be called from threads other than the main one.
+
+    Once a sensor has been read, its handler is only ever called from its own polling thread.
+    If a polling thread falls behind (e.g. because its handler is hanging or raising errors),
+    the snapshot keeps the last value it read, and a warning is printed once that value is
+    more than ``max_staleness`` seconds old.  Use ``getStaleness()`` to keep track of how old
+    the values are.
+    """
+
+    def __init__(self, aut, rate=50, max_staleness=1.0):
+        self.aut = aut
+        self.period = 1.0/rate
+        self.max_staleness = max_staleness
+
+        self.lock = threading.Lock()
+        self.values = {}        # Sensor name -> most recent value
+        self.timestamps = {}    # Sensor name -> time the most recent value was read
+        self.ready = threading.Event()  # Set once every sensor has been read at least once
+        self.stale = set()      # Sensors we have already warned about being stale
+
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        """
+        Start a polling thread for each sensor
+        """
+
+        if self.running:
+            return
+
+        self.running = True
+
+        if len(self.aut.sensors) == 0:
+            self.ready.set()
+
+        for sensor in self.aut.sensors:
+            t = threading.Thread(target=self._poll, args=(sensor,), name="SensorPoller-" + sensor)
+            t.daemon = True  # Don't keep the process alive just to read sensors
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        """
+        Ask all polling threads to stop, and wait for them to finish
+        """
+
+        self.running = False
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+    def _poll(self, sensor):
+        """
+        Polling loop for a single sensor; run in its own thread
+        """
+
+        while self.running:
+            tic = time.time()
+
+            try:
+                value = self.aut.evaluateSensor(sensor)
+            except Exception, e:
+                print "WARNING: Error reading sensor '%s': %s" % (sensor, e)
+            else:
+                self.lock.acquire()
+                self.values[sensor] = value
+                self.timestamps[sensor] = time.time()
+                if len(self.values) == len(self.aut.sensors):
+                    self.ready.set()
+                self.lock.release()
+
+            # Wait until it's time for the next reading
+            delay = self.period - (time.time() - tic)
+            if delay > 0:
+                time.sleep(delay)
+
+    def getSnapshot(self):
+        """
+        Returns a dictionary of the most recent value of each sensor.  The values are all
+        copied at the same time, so they won't change under the caller.
+
+        Waits (for up to ``max_staleness`` seconds) for every sensor to be read at least once.
+        Any sensor that still has never been read is then read directly.
+        """
+
+        if not self.ready.is_set():
+            # (A timeout also keeps the wait interruptible with Ctrl-C)
+            self.ready.wait(self.max_staleness)
+
+        now = time.time()
+        self.lock.acquire()
+        snapshot = dict(self.values)
+        ages = dict((sensor, now - t) for sensor, t in self.timestamps.iteritems())
+        self.lock.release()
+
+        for sensor, age in ages.iteritems():
+            if age > self.max_staleness:
+                if sensor not in self.stale:
+                    print "WARNING: Sensor '%s' has not been updated for %.1f seconds; using its last value." % (sensor, age)
+                    self.stale.add(sensor)
+            else:
+                self.stale.discard(sensor)
+
+        for sensor in self.aut.sensors:
+            if sensor in snapshot:
+                continue
+
+            # We have nothing to go on for this one, so wait for a reading
+            value = self.aut.evaluateSensor(sensor)
+            snapshot[sensor] = value
+
+            self.lock.acquire()
+            self.values[sensor] = value
+            self.timestamps[sensor] = time.time()
+            if len(self.values) == len(self.aut.sensors):
+                self.ready.set()
+            self.lock.release()
+
+        return snapshot
+
+    def getStaleness(self):
+        """
+        Returns the age (in seconds) of the oldest sensor value in the snapshot
+        """
+
+        now = time.time()
+
+        self.lock.acquire()
+        ages = [now - t for t in self.timestamps.itervalues()]
+        self.lock.release()
+
+        if ages == []:
+            return None
+
+        return max(ages)
@@ -1,20 +1,43 @@
 import os, sys
 import re
-import time
 import subprocess
+import hashlib
+import cPickle
+from copy import copy, deepcopy
 
 sys.path.append("lib")
 
 import project
 import parseLP
+import fsa
+import synthesisBackends
 from createJTLVinput import createLTLfile, createSMVfile
 from parseEnglishToLTL import writeSpec
 
+# Bump this whenever the output of any compilation stage changes, to invalidate old caches
+# (The cache keys only cover the inputs, so a stale cache would otherwise be used as-is)
+COMPILE_CACHE_VERSION = 2
+
 class SpecCompiler(object):
     def __init__(self, spec_filename):
         self.proj = project.Project()
         self.proj.loadProject(spec_filename)
 
+        # Results of previous runs of each compilation stage, so that stages whose inputs
+        # haven't changed since last time can be skipped (see _checkCache())
+        self.use_cache = True
+        self.cache = self._loadCache()
+
+        # If set, this is called with each line of output from synthesis and analysis as it is produced
+        self.progress_callback = None
+
+        # Synthesis and analysis runs that are in progress, so that cancel() can stop them
+        self.jobs = []
+        self.cancelled = False
+
+        # Compile options we have already complained about (see _checkCompileOption())
+        self.reported_options = set()
+
         # Check to make sure this project is complete
         if self.proj.rfi is None:
             print "ERROR: Please define regions before compiling."
@@ -26,7 +49,113 @@ class SpecCompiler(object):
 
         self.decomposedSpecText = None
 
+    def _getCacheFilename(self):
+        return self.proj.getFilenamePrefix() + ".compile_cache"
+
+    def _loadCache(self):
+        """
+        Load the results of previous compilations of this project, if there are any
+        """
+
+        try:
+            f = open(self._getCacheFilename(), "rb")
+            version, cache = cPickle.load(f)
+            f.close()
+        except Exception:
+            return {}
+
+        if version != COMPILE_CACHE_VERSION:
+            return {}
+
+        return cache
+
+    def _saveCache(self):
+        try:
+            f = open(self._getCacheFilename(), "wb")
+            cPickle.dump((COMPILE_CACHE_VERSION, self.cache), f, cPickle.HIGHEST_PROTOCOL)
+            f.close()
+        except IOError, e:
+            print "WARNING: Could not save compilation cache: %s" % e
+
+    def _hashFile(self, filename):
+        """
+        Returns a hash of the contents of the given file, or None if it doesn't exist
+        """
+
+        try:
+            f = open(filename, "rb")
+        except IOError:
+            return None
+
+        h = hashlib.sha1()
+        for chunk in iter(lambda: f.read(65536), ""):
+            h.update(chunk)
+        f.close()
+
+        return h.hexdigest()
+
+    def _hashInputs(self, *inputs):
+        """
+        Returns a hash identifying the given inputs to a compilation stage.  The inputs should
+        only be made up of strings, numbers, booleans, None, lists and tuples.
+        """
+
+        return hashlib.sha1(repr(inputs)).hexdigest()
+
+    def _checkCache(self, stage, key, filenames):
+        """
+        Returns the result that ``stage`` produced last time it was run with inputs hashing to
+        ``key``, or None if it needs to be run again.  The stage's output files ``filenames``
+        must also still be exactly as it left them.
+        """
+
+        if not self.use_cache or stage not in self.cache:
+            return None
+
+        old_key, file_hashes, result = self.cache[stage]
+
+        if old_key != key:
+            return None
+
+        if file_hashes != [self._hashFile(fn) for fn in filenames]:
+            return None
+
+        return result
+
+    def _storeCache(self, stage, key, filenames, result):
+        """
+        Remember the result and output files of a successful run of ``stage``
+        """
+
+        if not self.use_cache:
+            return
+
+        self.cache[stage] = (key, [self._hashFile(fn) for fn in filenames], result)
+        self._saveCache()
+
     def _decompose(self):
+        filename = self.proj.getFilenamePrefix() + '_decomposed.regions'
+        key = self._hashInputs(self._hashFile(self.proj.rfi.filename), self.proj.specText,
+                               self.proj.compile_options['convexify'],
+                               self.proj.compile_options.get('convexify_method'),
+                               self.proj.compile_options.get('decompose_incrementally'),
+                               self.proj.compile_options.get('binary_regions'))
+
+        cached = self._checkCache("decompose", key, [filename])
+        if cached is not None:
+            print "Regions and specification unchanged; using previous decomposition."
+            regionMapping, self.decomposedSpecText = cached
+
+            # Set up the parser as if it had just done the decomposition
+            self.parser = parseLP.parseLP()
+            self.parser.proj = copy(self.proj)
+            self.parser.proj.rfi = self.proj.loadRegionFile(decomposed=True)
+            self.parser.proj.regionMapping = regionMapping
+
+            self.proj.regionMapping = regionMapping
+            self.proj.writeSpecFile()
+            return
+
         self.parser = parseLP.parseLP()
         self.parser.main(self.proj.getFilenamePrefix() + ".spec")
 
@@ -49,9 +178,8 @@ class SpecCompiler(object):
         #self.proj.rfi.regions = filter(lambda r: not (r.isObstacle or r.name == "boundary"), self.proj.rfi.regions)
                     
         # save the regions into new region file
-        filename = self.proj.getFilenamePrefix() + '_decomposed.regions'
         self.parser.proj.rfi.recalcAdjacency()
-        self.parser.proj.rfi.writeFile(filename)
+        saved = self.parser.proj.rfi.writeFile(filename, binary=self.proj.compile_options.get('binary_regions', False))
 
         self.proj.regionMapping = self.parser.proj.regionMapping
         self.proj.writeSpecFile()
@@ -70,13 +198,24 @@ class SpecCompiler(object):
 
         self.decomposedSpecText = text
 
+        # (Don't remember a decomposition whose region file didn't get saved)
+        if saved:
+            self._storeCache("decompose", key, [filename], (self.proj.regionMapping, self.decomposedSpecText))
+
     def _writeSMVFile(self):
         numRegions = len(self.parser.proj.rfi.regions)
         sensorList = self.proj.enabled_sensors
         robotPropList = self.proj.enabled_actuators + self.proj.all_customs
 
+        filename = self.proj.getFilenamePrefix() + ".smv"
+        key = self._hashInputs(numRegions, sensorList, robotPropList)
+        if self._checkCache("smv", key, [filename]) is not None:
+            return
+
         createSMVfile(self.proj.getFilenamePrefix(), numRegions, sensorList, robotPropList)
 
+        self._storeCache("smv", key, [filename], True)
+
     def _writeLTLFile(self):
         regionList = [r.name for r in self.parser.proj.rfi.regions]
         sensorList = self.proj.enabled_sensors
@@ -88,15 +227,26 @@ class SpecCompiler(object):
         else:
             text = self.proj.specText
 
+        adjData = self.parser.proj.rfi.transitions
+
+        filename = self.proj.getFilenamePrefix() + ".ltl"
+        key = self._hashInputs(regionList, sensorList, robotPropList, text,
+                               sorted([(i, sorted(js)) for i, js in self.parser.proj.rfi.adjacency.iteritems()]),
+                               self.proj.compile_options.get('compact_topology'))
+        cached = self._checkCache("ltl", key, [filename])
+        if cached is not None:
+            return cached
+
         spec, traceback, failed = writeSpec(text, sensorList, regionList, robotPropList)
 
         # Abort compilation if there were any errors
         if failed:
             return None
 
-        adjData = self.parser.proj.rfi.transitions
+        createLTLfile(self.proj.getFilenamePrefix(), sensorList, robotPropList, adjData, spec,
+                      compactTopology=self.proj.compile_options.get('compact_topology', False))
 
-        createLTLfile(self.proj.getFilenamePrefix(), sensorList, robotPropList, adjData, spec)
+        self._storeCache("ltl", key, [filename], traceback)
 
         return traceback
         
@@ -125,43 +275,209 @@ class SpecCompiler(object):
                     print err_message
                     err = 1
 
+    def _getSynthesisLimits(self):
+        """
+        Returns the time limit (in seconds, or None for no limit) and the memory limit
+        (in Java's -Xmx format) for each synthesis or analysis run
+        """
+
+        # (Note that Project turns "0" and "" into False, which means no setting here)
+        time_limit = self.proj.compile_options.get("synthesis_time_limit", False)
+        if time_limit is False:
+            time_limit = None
+        elif self._checkCompileOption("synthesis_time_limit", time_limit, lambda v: float(v) > 0,
+                                      "a number of seconds, like '300'", "no time limit"):
+            time_limit = float(str(time_limit))
+        else:
+            time_limit = None
+
+        max_memory = self.proj.compile_options.get("synthesis_memory_limit", False)
+        if max_memory is False:
+            max_memory = "512m"
+        elif self._checkCompileOption("synthesis_memory_limit", max_memory,
+                                      lambda v: synthesisBackends.parseMemorySize(v) > 0,
+                                      "a size like '512m'", "512m"):
+            max_memory = str(max_memory).strip()
+        else:
+            max_memory = "512m"
+
+        return time_limit, max_memory
+
+    def _checkCompileOption(self, name, value, check, expected, default):
+        """
+        Returns True if ``check()`` accepts the compile option ``value`` (as a string).
+        Otherwise, prints an error (once per option) saying what was ``expected``, and
+        that the ``default`` will be used instead.
+        """
+
+        # Project turns "1" (or "true") into True, which isn't a value we can use
+        if value is not True:
+            try:
+                if check(str(value)):
+                    return True
+            except ValueError:
+                pass
+
+        if name not in self.reported_options:
+            if value is True:
+                value = "1"
+            print "ERROR: Invalid value '%s' for compile option %s; expected %s.  Using %s instead." % \
+                  (value, name, expected, default)
+            self.reported_options.add(name)
+
+        return False
+
+    def _getJTLVBackend(self):
+        time_limit, max_memory = self._getSynthesisLimits()
+        return synthesisBackends.JTLVBackend(self.proj.ltlmop_root, max_memory)
+
     def _getGROneCommand(self, module):
-        # Check that GROneMain, etc. is compiled
-        if not os.path.exists(os.path.join(self.proj.ltlmop_root,"etc","jtlv","GROne","GROneMain.class")):
-            print "Please compile the synthesis Java code first.  For instructions, see etc/jtlv/JTLV_INSTRUCTIONS."
-            # TODO: automatically compile for the user
+        return self._getJTLVBackend().getCommand(module, self.proj.getFilenamePrefix())
+
+    def _startGROne(self, module, options=[]):
+        """
+        Start running the given GROne module on our SMV and LTL files in the background.
+        Returns the process, or None if it could not be started.
+        """
+
+        return self._getJTLVBackend().startProcess(module, self.proj.getFilenamePrefix(), options)
+
+    def _startSynthesis(self, with_safety_aut, backend):
+        """
+        Start synthesizing an automaton with the given backend (from _getSynthesisBackend()).
+        Returns the SynthesisJob, or None if it could not be started.
+        """
+
+        time_limit, max_memory = self._getSynthesisLimits()
+        job = backend.start(self.proj.getFilenamePrefix(), self._getSynthesisOptions(with_safety_aut),
+                            self.progress_callback, time_limit)
+        if job is not None:
+            self._addJob(job)
+
+        return job
+
+    def _startAnalysis(self, callback=None):
+        """
+        Start running GROneDebug on our SMV and LTL files, passing its output to ``callback``.
+        Returns the job, or None if it could not be started.
+        """
+
+        subp = self._startGROne("GROneDebug")
+        if subp is None:
             return None
 
-        # Windows uses a different delimiter for the java classpath
-        if os.name == "nt":
-            delim = ";"
-        else:
-            delim = ":"
+        time_limit, max_memory = self._getSynthesisLimits()
+        job = synthesisBackends.JTLVJob(subp, callback, time_limit)
+        self._addJob(job)
+
+        return job
+
+    def _addJob(self, job):
+        self.jobs.append(job)
+
+        # In case cancel() was called (from another thread) while this job was starting up
+        if self.cancelled:
+            job.cancel()
+
+    def _finishJob(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def cancel(self):
+        """
+        Stop any synthesis or analysis that is running, along with any that would be started
+        later.  This can be called from another thread, or from the progress callback.
+        """
+
+        self.cancelled = True
+        for job in list(self.jobs):
+            job.cancel()
+
+    def _getSynthesisBackend(self, with_safety_aut):
+        """
+        Returns the synthesis backend selected by the "synthesizer" compile option.
+        JTLV is used if the selected one doesn't exist or can't handle our options.
+        """
+
+        name = self.proj.compile_options.get("synthesizer", "jtlv")
+        time_limit, max_memory = self._getSynthesisLimits()
+        backend = synthesisBackends.getSynthesisBackend(name, self.proj.ltlmop_root, max_memory)
+
+        if backend is None:
+            print "WARNING: Unknown synthesizer '%s'.  Using JTLV instead." % name
+        elif not backend.supports(self._getSynthesisOptions(with_safety_aut)):
+            print "WARNING: Synthesizer '%s' does not support the selected options.  Using JTLV instead." % name
+            backend = None
+
+        if backend is None:
+            backend = self._getJTLVBackend()
+
+        return backend
+
+    def _getSynthesisOptions(self, with_safety_aut):
+        options = []
 
-        classpath = delim.join([os.path.join(self.proj.ltlmop_root, "etc", "jtlv", "jtlv-prompt1.4.0.jar"), os.path.join(self.proj.ltlmop_root, "etc", "jtlv", "GROne")])
+        if with_safety_aut:    # Generally used for Mopsy
+            options.append("--safety")
+
+        if self.proj.compile_options["fastslow"]:
+            options.append("--fastslow")
+
+        return options
+
+    def _getSynthesisCacheInfo(self, with_safety_aut, backend):
+        """
+        Returns the cache key and output files for synthesis with the given options and backend
+        """
 
-        cmd = ["java", "-ea", "-Xmx512m", "-cp", classpath, module, self.proj.getFilenamePrefix() + ".smv", self.proj.getFilenamePrefix() + ".ltl"]
+        prefix = self.proj.getFilenamePrefix()
+        key = self._hashInputs(self._hashFile(prefix + ".smv"), self._hashFile(prefix + ".ltl"),
+                               self._getSynthesisOptions(with_safety_aut), backend.name)
 
-        return cmd
+        filenames = [prefix + ".aut"]
+        if with_safety_aut:
+            filenames.append(prefix + "_safety.aut")
+
+        return key, filenames
+
+    def _getAnalysisCacheKey(self):
+        # The analysis also looks at the synthesized automaton, so include that too
+        prefix = self.proj.getFilenamePrefix()
+        return self._hashInputs(self._hashFile(prefix + ".smv"), self._hashFile(prefix + ".ltl"),
+                                self._hashFile(prefix + ".aut"))
 
     def _analyze(self):
-        cmd = self._getGROneCommand("GROneDebug")
-        if cmd is None:
+        key = self._getAnalysisCacheKey()
+        cached = self._checkCache("analyze", key, [])
+        if cached is not None:
+            return cached
+
+        job = self._startAnalysis(self.progress_callback)
+        if job is None:
             return (False, False, [], "")
 
-        subp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)
+        result = self._readAnalysisOutput(job)
+        if not job.aborted():
+            self._storeCache("analyze", key, [], result)
+
+        return result
 
-        # TODO: Make this output live
-        while subp.poll():
-            time.sleep(0.1)
+    def _readAnalysisOutput(self, job):
+        """
+        Wait for a GROneDebug job to finish, and interpret its output
+        """
+
+        output = job.readOutput()
+        self._finishJob(job)
+
+        if job.aborted():
+            return (False, False, [], output)
 
         realizable = False    
         nonTrivial = False
 
-        output = ""
         to_highlight = []
-        for dline in subp.stdout:
-            output += dline
+        for dline in output.splitlines(True):
             if "Specification is realizable." in dline:   
                 realizable = True            
             
@@ -219,7 +535,7 @@ class SpecCompiler(object):
         # check for trivial initial-state automaton with no transitions
         if realizable:
             proj_copy = deepcopy(self.proj)
-            proj_copy.rfi = self.proj.parser.rfi
+            proj_copy.rfi = self.parser.proj.rfi
             proj_copy.sensor_handler = None
             proj_copy.actuator_handler = None
             proj_copy.h_instance = None
@@ -230,41 +546,79 @@ class SpecCompiler(object):
             
             nonTrivial = any([s.transitions != [] for s in aut.states])
 
-        subp.stdout.close()
-
         return (realizable, nonTrivial, to_highlight, output)
 
     def _synthesize(self, with_safety_aut=False):
-        cmd = self._getGROneCommand("GROneMain")
-        if cmd is None:
-            return (False, False, "")
+        # Only look this up once, so any warnings about falling back to JTLV are only printed once
+        backend = self._getSynthesisBackend(with_safety_aut)
 
-        if with_safety_aut:    # Generally used for Mopsy
-            cmd.append("--safety")
+        key, filenames = self._getSynthesisCacheInfo(with_safety_aut, backend)
+        cached = self._checkCache("synthesize", key, filenames)
+        if cached is not None:
+            print "Specification unchanged; using previously synthesized automaton."
+            return cached
 
-        if self.proj.compile_options["fastslow"]:
-            cmd.append("--fastslow")
+        job = self._startSynthesis(with_safety_aut, backend)
+        if job is None:
+            return (False, False, "")
 
-        subp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)
-        
-        # TODO: Make this output live
-        while subp.poll():
-            time.sleep(0.1)
-
-        realizable = False
-        realizableFS = False
-
-        output = ""
-        for line in subp.stdout:
-            output += line
-            if "Specification is realizable" in line:
-                realizable = True
-            if "Specification is realizable with slow and fast actions" in line:
-                realizableFS = True
-               
-        subp.stdout.close()
-
-        return (realizable, realizableFS, output)
+        result = job.result()
+        self._finishJob(job)
+        if not job.aborted():
+            self._storeCache("synthesize", key, filenames, result)
+
+        return result
+
+    def _synthesizeAndAnalyze(self, with_safety_aut=False):
+        """
+        Run synthesis (as in _synthesize()) and analysis (as in _analyze()) at the same time,
+        since they are independent of each other.  Returns the results of both, in that order.
+        """
+
+        backend = self._getSynthesisBackend(with_safety_aut)
+
+        key, filenames = self._getSynthesisCacheInfo(with_safety_aut, backend)
+        synth_result = self._checkCache("synthesize", key, filenames)
+
+        # We can only tell whether the analysis is cached once we know the automaton
+        analysis_result = None
+        if synth_result is not None:
+            analysis_result = self._checkCache("analyze", self._getAnalysisCacheKey(), [])
+
+        if synth_result is not None and analysis_result is not None:
+            return (synth_result, analysis_result)
+
+        # Get both processes going before waiting on either of them
+        if synth_result is None:
+            synth_job = self._startSynthesis(with_safety_aut, backend)
+        if analysis_result is None:
+            # (Its output isn't passed on to the progress callback, since it will be
+            # reported along with the rest of the analysis results by _analyze())
+            analysis_job = self._startAnalysis()
+
+        if synth_result is None:
+            if synth_job is None:
+                synth_result = (False, False, "")
+            else:
+                synth_result = synth_job.result()
+                self._finishJob(synth_job)
+                if synth_job.aborted():
+                    # There's no point waiting for the analysis of an automaton we don't have
+                    if analysis_job is not None:
+                        analysis_job.cancel()
+                else:
+                    self._storeCache("synthesize", key, filenames, synth_result)
+
+        # Note that the analysis needs to look at the automaton, so it must finish after synthesis
+        if analysis_result is None:
+            if analysis_job is None:
+                analysis_result = (False, False, [], "")
+            else:
+                analysis_result = self._readAnalysisOutput(analysis_job)
+                if not analysis_job.aborted():
+                    self._storeCache("analyze", self._getAnalysisCacheKey(), [], analysis_result)
+
+        return (synth_result, analysis_result)
 
     def compile(self, with_safety_aut=False):
         self._decompose()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+""" ========================================================
+    synthesisBackends.py - Interchangeable synthesis engines
+    ========================================================
+
+    Each backend takes the .smv and .ltl files of a project and synthesizes an
+    automaton (.aut file) implementing the specification, or a counterstrategy
+    if the specification is unrealizable.
+
+    The backend is chosen with the "synthesizer" compile option:
+
+        - ``jtlv``: Runs GROneMain in a Java process (the default)
+        - ``bdd``: Solves the game in-process, with grOneSolver.py
+
+    Synthesis runs as a SynthesisJob, which passes each line of output to a callback
+    as soon as it is produced, and which can be given a time limit or cancelled.
+"""
+
+import os
+import re
+import time
+import threading
+import Queue
+import subprocess
+from cStringIO import StringIO
+
+import grOneSolver
+
+class SynthesisBackend(object):
+    """
+    Base class for synthesis engines.
+    """
+
+    name = None
+
+    def __init__(self, ltlmop_root, max_memory="512m"):
+        self.ltlmop_root = ltlmop_root
+        self.max_memory = max_memory    # In the same format as Java's -Xmx option
+
+    def supports(self, options):
+        """
+        Returns True if this backend can handle the given command-line style options
+        (e.g. ``--safety``, ``--fastslow``)
+        """
+        return True
+
+    def start(self, filename_prefix, options=[], callback=None, time_limit=None):
+        """
+        Begin synthesizing an automaton for ``filename_prefix``.smv/.ltl, which will be written
+        to ``filename_prefix``.aut.  Returns a SynthesisJob, or None if synthesis could not be started.
+
+        ``callback`` and ``time_limit`` are passed on to the job (see SynthesisJob).
+        """
+        raise NotImplementedError
+
+def parseMemorySize(size):
+    """
+    Convert a size like "512m" (as given to Java's -Xmx option) to a number of bytes
+    """
+
+    m = re.match(r"^\s*(\d+)\s*([kmg]?)b?\s*$", str(size), re.IGNORECASE)
+    if m is None:
+        raise ValueError("Invalid memory size '%s'" % size)
+
+    return int(m.group(1)) * {"": 1, "k": 2**10, "m": 2**20, "g": 2**30}[m.group(2).lower()]
+
+class SynthesisJob(object):
+    """
+    A synthesis run in progress, as returned by SynthesisBackend.start().
+
+    Nothing happens until result() is called, which passes each line of output to ``callback``
+    (if given) as soon as it is produced.  The run is stopped if it takes longer than ``time_limit``
+    seconds, or if cancel() is called (e.g. from another thread, or from the callback).
+    """
+
+    def __init__(self, callback=None, time_limit=None):
+        self.callback = callback
+        self.time_limit = time_limit
+
+        # One of "running", "finished", "cancelled", "timed out" or "out of memory"
+        self.status = "running"
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stop the run as soon as possible.  result() will then return an unrealizable result.
+        """
+        self._cancelled.set()
+
+    def aborted(self):
+        """ Returns True if the run was stopped before it could finish """
+        return self.status not in ["running", "finished"]
+
+    def _checkAbort(self, startTime):
+        """
+        Returns the reason the run should be stopped now, or None if it can keep going
+        """
+
+        if self._cancelled.is_set():
+            return "cancelled"
+        if self.time_limit and time.time() - startTime > self.time_limit:
+            return "timed out"
+        return None
+
+    def _abortMessage(self):
+        if self.status == "cancelled":
+            return "ERROR: Synthesis was cancelled.\n"
+        elif self.status == "timed out":
+            return "ERROR: Synthesis was stopped after exceeding the time limit of %s seconds.\n" % self.time_limit
+        else:
+            return "ERROR: Synthesis ran out of memory.\n"
+
+    def _emit(self, line):
+        if self.callback is not None:
+            self.callback(line)
+
+    def result(self):
+        """
+        Wait for synthesis to finish, and return a tuple of (realizable, realizableFS, output),
+        where ``realizableFS`` says whether the specification was realizable with slow and fast
+        actions, and ``output`` is the log of the synthesis process.
+        """
+        raise NotImplementedError
+
+class JTLVBackend(SynthesisBackend):
+    """
+    Synthesis using the JTLV-based Java code in etc/jtlv.
+    """
+
+    name = "jtlv"
+
+    def getCommand(self, module, filename_prefix):
+        """
+        Returns the command line for running the GROne Java class ``module`` on our SMV and LTL files,
+        or None if the Java code has not been compiled
+        """
+
+        # Check that GROneMain, etc. is compiled
+        if not os.path.exists(os.path.join(self.ltlmop_root,"etc","jtlv","GROne","GROneMain.class")):
+            print "Please compile the synthesis Java code first.  For instructions, see etc/jtlv/JTLV_INSTRUCTIONS."
+            # TODO: automatically compile for the user
+            return None
+
+        # Windows uses a different delimiter for the java classpath
+        if os.name == "nt":
+            delim = ";"
+        else:
+            delim = ":"
+
+        classpath = delim.join([os.path.join(self.ltlmop_root, "etc", "jtlv", "jtlv-prompt1.4.0.jar"), os.path.join(self.ltlmop_root, "etc", "jtlv", "GROne")])
+
+        cmd = ["java", "-ea", "-Xmx" + self.max_memory, "-cp", classpath, module, filename_prefix + ".smv", filename_prefix + ".ltl"]
+
+        return cmd
+
+    def startProcess(self, module, filename_prefix, options=[]):
+        """
+        Start running the given GROne module on our SMV and LTL files in the background.
+        Returns the process, or None if it could not be started.
+        """
+
+        cmd = self.getCommand(module, filename_prefix)
+        if cmd is None:
+            return None
+
+        return subprocess.Popen(cmd + options, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)
+
+    def start(self, filename_prefix, options=[], callback=None, time_limit=None):
+        subp = self.startProcess("GROneMain", filename_prefix, options)
+        if subp is None:
+            return None
+
+        return JTLVJob(subp, callback, time_limit)
+
+class JTLVJob(SynthesisJob):
+    """
+    A GROne Java process.  Its output is read by a separate thread, so that we can keep
+    an eye on the time limit and cancellation while waiting for the next line.
+    """
+
+    # How often (in seconds) to check for cancellation while there is no output
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, subp, callback=None, time_limit=None):
+        super(JTLVJob, self).__init__(callback, time_limit)
+        self.subp = subp
+        self.output = None
+
+        # (The process is already running, so that's when the clock starts)
+        self.startTime = time.time()
+
+    def _readLines(self, lines):
+        # (readline() rather than iterating over the file, which reads ahead in big blocks)
+        for line in iter(self.subp.stdout.readline, ""):
+            lines.put(line)
+        lines.put(None)
+
+    def _kill(self, status):
+        self.status = status
+        try:
+            self.subp.kill()
+        except OSError:
+            # It must have just finished on its own
+            pass
+
+    def readOutput(self):
+        """
+        Wait for the process to finish, passing on each line of its output as it arrives,
+        and return all of the output.  The process is killed if the run is aborted.
+        """
+
+        if self.output is not None:
+            return self.output
+
+        lines = Queue.Queue()
+        reader = threading.Thread(target=self._readLines, args=(lines,))
+        reader.daemon = True
+        reader.start()
+
+        output = []
+        while True:
+            if self.status == "running":
+                reason = self._checkAbort(self.startTime)
+                if reason is not None:
+                    # Killing the process closes its output, which will end the loop
+                    self._kill(reason)
+
+            try:
+                line = lines.get(timeout=self.POLL_INTERVAL)
+            except Queue.Empty:
+                continue
+
+            if line is None:
+                break
+
+            output.append(line)
+            self._emit(line)
+
+            if "OutOfMemoryError" in line and self.status == "running":
+                self._kill("out of memory")
+
+        self.subp.stdout.close()
+        self.subp.wait()
+
+        if self.status == "running":
+            self.status = "finished"
+        else:
+            output.append(self._abortMessage())
+            self._emit(output[-1])
+
+        self.output = "".join(output)
+        return self.output
+
+    def result(self):
+        """
+        Wait for the GROneMain process to finish, and interpret its output
+        """
+
+        output = self.readOutput()
+
+        realizable = False
+        realizableFS = False
+
+        if not self.aborted():
+            for line in output.splitlines():
+                if "Specification is realizable" in line:
+                    realizable = True
+                if "Specification is realizable with slow and fast actions" in line:
+                    realizableFS = True
+
+        return (realizable, realizableFS, output)
+
+class BDDBackend(SynthesisBackend):
+    """
+    Synthesis in this process, using grOneSolver.py.
+
+    This avoids starting a JVM for every compilation.  ``max_memory`` is enforced
+    approximately, by limiting the number of BDD nodes.  The BDD manager is kept from
+    one run to the next, so recompiling a project whose propositions haven't changed
+    can reuse the BDDs built last time.
+    Fast-slow synthesis is not supported.
+    """
+
+    name = "bdd"
+
+    # The manager from the last run, shared by all instances
+    manager = None
+
+    # Rough memory use of each BDD node, including its share of the unique table and caches
+    BYTES_PER_NODE = 200
+
+    def supports(self, options):
+        return "--fastslow" not in options
+
+    def start(self, filename_prefix, options=[], callback=None, time_limit=None):
+        return BDDJob(filename_prefix, options, parseMemorySize(self.max_memory) // self.BYTES_PER_NODE,
+                      callback, time_limit)
+
+class SynthesisAborted(Exception):
+    """ Raised inside the solver to stop a BDDJob """
+    pass
+
+class LineWriter(object):
+    """
+    A file-like object that collects everything written to it, and passes on each line
+    to ``callback`` as soon as it is complete
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.out = StringIO()
+        self.partial = ""
+
+    def write(self, text):
+        self.out.write(text)
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self.callback(line + "\n")
+
+    def getvalue(self):
+        return self.out.getvalue()
+
+class BDDJob(SynthesisJob):
+    """
+    A run of grOneSolver.  This happens in the thread that calls result(), which checks
+    for cancellation, the time limit and the node limit regularly while solving.
+    """
+
+    def __init__(self, filename_prefix, options, max_nodes, callback=None, time_limit=None):
+        super(BDDJob, self).__init__(callback, time_limit)
+        self.filename_prefix = filename_prefix
+        self.options = options
+        self.max_nodes = max_nodes
+
+    def _checkpoint(self, manager, startTime):
+        reason = self._checkAbort(startTime)
+        if reason is None and manager.nodeCount() > self.max_nodes:
+            reason = "out of memory"
+
+        if reason is not None:
+            self.status = reason
+            raise SynthesisAborted(reason)
+
+    def result(self):
+        prefix = self.filename_prefix
+
+        safetyAutFile = None
+        if "--safety" in self.options:
+            safetyAutFile = prefix + "_safety.aut"
+
+        startTime = time.time()
+        output = LineWriter(self._emit)
+        try:
+            envVars, sysVars = grOneSolver.parseSMVFile(prefix + ".smv")
+            manager = BDDBackend.manager
+            if manager is None or manager.varNames != grOneSolver.managerVariables(envVars, sysVars):
+                manager = grOneSolver.newManager(envVars, sysVars)
+            BDDBackend.manager = manager
+
+            realizable = grOneSolver.synthesize(prefix + ".smv", prefix + ".ltl", prefix + ".aut",
+                                                safetyAutFile, manager, output,
+                                                lambda: self._checkpoint(manager, startTime))
+        except grOneSolver.SpecificationError, e:
+            output.write("ERROR: %s\n" % e)
+            realizable = False
+        except SynthesisAborted:
+            # Don't hold on to a manager that has filled up the memory we're allowed
+            if self.status == "out of memory":
+                BDDBackend.manager = None
+            output.write(self._abortMessage())
+            realizable = False
+
+        if self.status == "running":
+            self.status = "finished"
+
+        return (realizable, False, output.getvalue())
+
+# Available backends, by name
+BACKENDS = dict((cls.name, cls) for cls in [JTLVBackend, BDDBackend])
+
+def getSynthesisBackend(name, ltlmop_root, max_memory="512m"):
+    """
+    Return an instance of the backend called ``name``, or None if there is no such backend
+    """
+
+    if name not in BACKENDS:
+        return None
+
+    return BACKENDS[name](ltlmop_root, max_memory)
@@ -22,6 +22,7 @@ import mapRenderer
 from specCompiler import SpecCompiler
 from copy import deepcopy
 import threading, time
+import traceback
 
 ######################### WARNING! ############################
 #         DO NOT EDIT GUI CODE BY HAND.  USE WXGLADE.         #
@@ -98,6 +99,33 @@ class AsynchronousProcessThread(threading.Thread):
         if self.callback is not None:
             wx.CallAfter(self.callback) # thread-safe call
 
+class AsynchronousFunctionThread(threading.Thread):
+    def __init__(self, func, args, callback):
+        """
+        Call func(*args) in the background, then pass its return value to the callback function
+        (if given) on the GUI thread.  If func raises an exception, the traceback is printed and
+        the callback is passed None.
+        """
+
+        self.func = func
+        self.args = args
+        self.callback = callback
+
+        threading.Thread.__init__(self)
+
+        # Auto-start
+        self.start()
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except:
+            traceback.print_exc()
+            result = None
+
+        if self.callback is not None:
+            wx.CallAfter(self.callback, result) # thread-safe call
+
 class MapDialog(wx.Dialog):
     """
     A simple little dialog that displays the regions on top of the map so that you can
@@ -172,6 +200,7 @@ class SpecEditorFrame(wx.Frame):
         self.frame_1_menubar = wx.MenuBar()
         global MENU_IMPORT_REGION; MENU_IMPORT_REGION = wx.NewId()
         global MENU_COMPILE; MENU_COMPILE = wx.NewId()
+        global MENU_CANCELCOMPILE; MENU_CANCELCOMPILE = wx.NewId()
         global MENU_COMPILECONFIG; MENU_COMPILECONFIG = wx.NewId()
         global MENU_CONVEXIFY; MENU_CONVEXIFY = wx.NewId()
         global MENU_FASTSLOW; MENU_FASTSLOW = wx.NewId()
@@ -199,6 +228,7 @@ class SpecEditorFrame(wx.Frame):
         self.frame_1_menubar.Append(wxglade_tmp_menu, "&Edit")
         wxglade_tmp_menu = wx.Menu()
         wxglade_tmp_menu.Append(MENU_COMPILE, "&Compile\tF5", "", wx.ITEM_NORMAL)
+        wxglade_tmp_menu.Append(MENU_CANCELCOMPILE, "Cancel Compilatio&n\tShift-F5", "", wx.ITEM_NORMAL)
         wxglade_tmp_menu_sub = wx.Menu()
         wxglade_tmp_menu_sub.Append(MENU_CONVEXIFY, "Decompose workspace into convex regions", "", wx.ITEM_CHECK)
         wxglade_tmp_menu_sub.Append(MENU_FASTSLOW, "Enable \"fast-slow\" synthesis", "", wx.ITEM_CHECK)
@@ -264,6 +294,7 @@ class SpecEditorFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.onMenuCopy, id=wx.ID_COPY)
         self.Bind(wx.EVT_MENU, self.onMenuPaste, id=wx.ID_PASTE)
         self.Bind(wx.EVT_MENU, self.onMenuCompile, id=MENU_COMPILE)
+        self.Bind(wx.EVT_MENU, self.onMenuCancelCompile, id=MENU_CANCELCOMPILE)
         self.Bind(wx.EVT_MENU, self.onMenuSetCompileOptions, id=MENU_CONVEXIFY)
         self.Bind(wx.EVT_MENU, self.onMenuSetCompileOptions, id=MENU_FASTSLOW)
         self.Bind(wx.EVT_MENU, self.onMenuSimulate, id=MENU_SIMULATE)
@@ -323,6 +354,11 @@ class SpecEditorFrame(wx.Frame):
                             "Dotty": None,
                             "Simulation Configuration": None }
 
+        # The SpecCompiler that is running in the background, if any
+        self.compiler = None
+        self.closeAfterCompile = False
+        self.frame_1_menubar.Enable(MENU_CANCELCOMPILE, False)
+
         self.initializeNewSpec()
 
         # HACK: This is an undocumented hack you can uncomment to help kill stuck copies of speceditor on windows
@@ -709,6 +745,14 @@ class SpecEditorFrame(wx.Frame):
                 elif response == wx.NO:
                     return
 
+        # Stop any compilation in progress.  The compilation thread still refers to this
+        # window, so we can only close once it's done (see onCompileDone()).
+        if self.compiler is not None:
+            self.appendLog("Stopping compilation...\n", "BLUE")
+            self.closeAfterCompile = True
+            self.compiler.cancel()
+            return
+
         self.Destroy()
 
     def askIfUserWantsToSave(self, action):
@@ -758,8 +802,10 @@ class SpecEditorFrame(wx.Frame):
 
         #event.Skip()
 
-    def onMenuCompile(self, event, with_safety_aut=False): # wxGlade: SpecEditorFrame.<event_handler>
-        # TODO: Use AsynchronousProcessThread for this too
+    def onMenuCompile(self, event, with_safety_aut=False, analyze=False): # wxGlade: SpecEditorFrame.<event_handler>
+        if self.compiler is not None:
+            # We're already compiling
+            return
 
         # Clear the error markers
         self.text_ctrl_spec.MarkerDeleteAll(MARKER_INIT)
@@ -804,30 +850,105 @@ class SpecEditorFrame(wx.Frame):
         sys.stdout = redir
         sys.stderr = redir
 
-        self.appendLog("Parsing locative prepositions...\n", "BLUE")
+        self.compiler = compiler
+        self.frame_1_menubar.Enable(MENU_COMPILE, False)
+        self.frame_1_menubar.Enable(MENU_ANALYZE, False)
+        self.frame_1_menubar.Enable(MENU_CANCELCOMPILE, True)
+
+        # Compile in the background, so that the window stays responsive and can cancel it
+        AsynchronousFunctionThread(self.compileInBackground, (compiler, with_safety_aut, analyze), self.onCompileDone)
+
+    def compileInBackground(self, compiler, with_safety_aut, analyze):
+        """
+        Run each stage of compilation, stopping early if the compiler is cancelled.
+        This is run on a separate thread, so it only touches the GUI through wx.CallAfter().
+        """
+
+        log = lambda text, color="BLACK": wx.CallAfter(self.appendLog, text, color)
+
+        log("Parsing locative prepositions...\n", "BLUE")
 
         compiler._decompose()
-        self.proj = compiler.proj
-        self.decomposedRFI = compiler.parser.proj.rfi
+        wx.CallAfter(self.showDecomposition, compiler)
 
-        # Update workspace decomposition listbox
-        self.list_box_locphrases.Set(self.proj.regionMapping.keys())
-        self.list_box_locphrases.Select(0)
+        if compiler.cancelled: return
 
-        self.appendLog("Creating SMV file...\n", "BLUE")
+        log("Creating SMV file...\n", "BLUE")
 
         compiler._writeSMVFile()
 
-        self.appendLog("Creating LTL file...\n", "BLUE")
+        log("Creating LTL file...\n", "BLUE")
 
-        self.traceback = compiler._writeLTLFile()
+        tb = compiler._writeLTLFile()
 
-        if self.traceback is None:
-            sys.stdout = sys.__stdout__
-            sys.stderr = sys.__stderr__
-            self.appendLog("ERROR: Aborting compilation due to syntax error.\n", "RED")
+        if tb is None:
+            log("ERROR: Aborting compilation due to syntax error.\n", "RED")
             return
 
+        wx.CallAfter(self.showLTL, tb)
+
+        if compiler.cancelled: return
+
+        log("Creating automaton...\n", "BLUE")
+
+        # Show the synthesis output as it is produced
+        streamed = []
+        def showProgress(line):
+            streamed.append(line)
+            log("\t"+line)
+        compiler.progress_callback = showProgress
+
+        if analyze:
+            # Run the analysis alongside synthesis; its results are cached for _analyze()
+            (realizable, realizableFS, output), analysis = compiler._synthesizeAndAnalyze(with_safety_aut)
+        else:
+            realizable, realizableFS, output = compiler._synthesize(with_safety_aut)
+
+        compiler.progress_callback = None
+
+        if compiler.cancelled: return
+
+        if not streamed:
+            # The result came from the cache, so we haven't shown its output yet
+            log("\t"+output.replace("\n", "\n\t"))
+
+        wx.CallAfter(self.showSynthesisResult, realizable, realizableFS)
+
+        if analyze:
+            log("Running analysis...\n", "BLUE")
+
+            analysis = compiler._analyze()
+
+            if compiler.cancelled: return
+
+            wx.CallAfter(self.showAnalysisResult, analysis)
+
+    def onCompileDone(self, result):
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+
+        if self.compiler.cancelled:
+            self.appendLog("Compilation cancelled.\n", "RED")
+
+        self.compiler = None
+        self.frame_1_menubar.Enable(MENU_COMPILE, True)
+        self.frame_1_menubar.Enable(MENU_ANALYZE, True)
+        self.frame_1_menubar.Enable(MENU_CANCELCOMPILE, False)
+
+        if self.closeAfterCompile:
+            self.Destroy()
+
+    def showDecomposition(self, compiler):
+        self.proj = compiler.proj
+        self.decomposedRFI = compiler.parser.proj.rfi
+
+        # Update workspace decomposition listbox
+        self.list_box_locphrases.Set(self.proj.regionMapping.keys())
+        self.list_box_locphrases.Select(0)
+
+    def showLTL(self, tb):
+        self.traceback = tb
+
         # Load in LTL file to the LTL tab
         if os.path.exists(self.proj.getFilenamePrefix()+".ltl"):
             f = open(self.proj.getFilenamePrefix()+".ltl","r")
@@ -835,14 +956,8 @@ class SpecEditorFrame(wx.Frame):
             f.close()
             self.text_ctrl_LTL.SetValue(ltl)
 
-
-        self.appendLog("Creating automaton...\n", "BLUE")
-
-        realizable, realizableFS, output = compiler._synthesize(with_safety_aut)
-
-        print "\n"
-
-        self.appendLog("\t"+output.replace("\n", "\n\t"))
+    def showSynthesisResult(self, realizable, realizableFS):
+        self.appendLog("\n")
 
         if self.proj.compile_options['fastslow']:
             if realizableFS:
@@ -857,10 +972,33 @@ class SpecEditorFrame(wx.Frame):
             else:
                 self.appendLog("ERROR: Specification was unsynthesizable (unrealizable/unsatisfiable) for instantaneous actions.\n", "RED")
 
-        sys.stdout = sys.__stdout__
-        sys.stderr = sys.__stderr__
+    def showAnalysisResult(self, analysis):
+        (realizable, nonTrivial, to_highlight, output) = analysis
+
+        self.appendLog(output, "BLACK")
 
-        return compiler
+        if realizable:
+            if nonTrivial:
+                self.appendLog("Synthesized automaton is non-trivial.\n", "GREEN")
+            else:
+                self.appendLog("Synthesized automaton is trivial.\n", "RED")
+
+        for h_item in to_highlight:
+            tb_key = h_item[0].title() + h_item[1].title()
+
+            if h_item[1] == "goals":
+                self.text_ctrl_spec.MarkerAdd(self.traceback[tb_key][h_item[2]]-1, MARKER_LIVE)           
+            else:
+                for l in self.traceback[tb_key]:
+                    if h_item[1] == "init":
+                        self.text_ctrl_spec.MarkerAdd(l-1, MARKER_INIT)
+                    elif h_item[1] == "trans":
+                        self.text_ctrl_spec.MarkerAdd(l-1, MARKER_SAFE)
+
+    def onMenuCancelCompile(self, event): # wxGlade: SpecEditorFrame.<event_handler>
+        if self.compiler is not None:
+            self.appendLog("Cancelling compilation...\n", "RED")
+            self.compiler.cancel()
 
     def appendLog(self, text, color="BLACK"):
         self.text_ctrl_log.BeginTextColour(color)
@@ -869,7 +1007,6 @@ class SpecEditorFrame(wx.Frame):
         #self.text_ctrl_log.EndBold()
         self.text_ctrl_log.EndTextColour()
         self.text_ctrl_log.ShowPosition(self.text_ctrl_log.GetLastPosition())
-        wx.Yield() # Ensure update
 
     def onMenuSimulate(self, event): # wxGlade: SpecEditorFrame.<event_handler>
         """ Run the simulation with current experiment configuration. """
@@ -1068,41 +1205,8 @@ class SpecEditorFrame(wx.Frame):
         event.Skip()
 
     def onMenuAnalyze(self, event): # wxGlade: SpecEditorFrame.<event_handler>
-        compiler = self.onMenuCompile(event, with_safety_aut=True)
-
-        # Redirect all output to the log
-        redir = RedirectText(self,self.text_ctrl_log)
-
-        sys.stdout = redir
-        sys.stderr = redir
-
-        self.appendLog("Running analysis...\n", "BLUE")
-
-        (realizable, nonTrivial, to_highlight, output) = compiler._analyze()
-
-        self.appendLog(output, "BLACK")
-
-        if realizable:
-            if nonTrivial:
-                self.appendLog("Synthesized automaton is non-trivial.\n", "GREEN")
-            else:
-                self.appendLog("Synthesized automaton is trivial.\n", "RED")
-
-        for h_item in to_highlight:
-            tb_key = h_item[0].title() + h_item[1].title()
-
-            if h_item[1] == "goals":
-                self.text_ctrl_spec.MarkerAdd(self.traceback[tb_key][h_item[2]]-1, MARKER_LIVE)           
-            else:
-                for l in self.traceback[tb_key]:
-                    if h_item[1] == "init":
-                        self.text_ctrl_spec.MarkerAdd(l-1, MARKER_INIT)
-                    elif h_item[1] == "trans":
-                        self.text_ctrl_spec.MarkerAdd(l-1, MARKER_SAFE)
-                    
-
-        sys.stdout = sys.__stdout__
-        sys.stderr = sys.__stderr__
+        # The analysis is run as the last stage of compilation; see compileInBackground()
+        self.onMenuCompile(event, with_safety_aut=True, analyze=True)
 
     def onMenuMopsy(self, event): # wxGlade: SpecEditorFrame.<event_handler>
         # Opens the counterstrategy visualization interfacs ("Mopsy")
@@ -1221,6 +1325,7 @@ class SpecEditorFrame(wx.Frame):
 class RedirectText:
     """
     A class that lets the output of a stream be directed into a text box.
+    It can be written to from any thread.
 
     http://mail.python.org/pipermail/python-list/2007-June/445795.html
     """
@@ -1230,6 +1335,9 @@ class RedirectText:
         self.parent=parent
 
     def write(self,string):
+        wx.CallAfter(self._write, string) # thread-safe call
+
+    def _write(self,string):
         self.out.BeginTextColour("BLACK")
         self.out.WriteText("\t"+string)
         self.out.EndTextColour()